@@ -0,0 +1,405 @@
+"""
+Offline stand-in for the Earth Engine Python API
+
+Exposes the subset of `ee` used by leaftoolbox (LEAF, toolsNets,
+toolsUtils), gee_helpers and the sampler scripts so they can be run
+and benchmarked without an Earth Engine account. Objects only record
+the calls made on them, functions given to `map` are called once as
+Earth Engine does, and every request to the server (`getInfo`,
+`ee.data` calls, task `start()`/`status()`) returns synthetic values
+after a configurable latency and is counted by the backend.
+
+Usage:
+    from gee_helpers import fake_ee
+    fake_ee.install(latency=0.2, num_features=20)
+    from leaftoolbox import LEAF     # LEAF now imports the fake as ee
+    ...
+    print(fake_ee.backend.report())
+"""
+
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+__version__ = 'fake'
+
+
+class EEException(Exception):
+    """Error raised by the fake server, same role as ee.EEException."""
+
+
+# messages of the errors raised by fault injection, as returned by the Earth Engine server
+FAULTS = {
+    'rate_limit': 'Too Many Requests: Request was rejected because the request rate or concurrency limit was exceeded. (429)',
+    'transient': 'An internal error has occurred (503 Service Unavailable).',
+    'memory': 'User memory limit exceeded.',
+    'timeout': 'Computation timed out.',
+}
+
+# faults that only computations can raise, other requests are not affected by them
+COMPUTE_FAULTS = ('memory', 'timeout')
+
+
+class FakeBackend:
+    """Synthetic server answering the requests made through the fake API and counting them."""
+
+    def __init__(self, latency=0.0, num_features=20, num_images=10, num_pixels=100, band_names=None,
+                 start_date='2015-06-01', period_days=365, task_polls=2, scene_interval_days=16,
+                 cloudy_months=(11, 12, 1, 2, 3), fault_rate=0.0, fault_kinds=tuple(FAULTS), faults=None, seed=0):
+        """Configure the synthetic server.
+
+        Each request fails with probability fault_rate with one of fault_kinds (keys of FAULTS), and
+        the requests made first fail in turn with the kinds listed in faults (None lets a request
+        succeed), so every recovery path can be exercised. Memory and timeout faults are only raised by
+        computeFeatures requests, which sample the product collections.
+        """
+        self.latency = latency
+        self.num_features = num_features
+        self.num_images = num_images
+        self.num_pixels = num_pixels
+        self.band_names = band_names or ['date', 'QC', 'longitude', 'latitude', 'SR_B2', 'SR_B3', 'SR_B4', 'SR_B5',
+                                         'SR_B6', 'SR_B7', 'partition', 'networkID']
+        self.start_date = datetime.strptime(start_date, '%Y-%m-%d')
+        self.period_days = period_days
+        self.task_polls = task_polls
+        self.scene_interval_days = scene_interval_days
+        self.cloudy_months = cloudy_months
+        self.fault_rate = fault_rate
+        self.fault_kinds = fault_kinds
+        self.faults = list(faults or [])
+        self.random = np.random.default_rng(seed)
+        self.lock = threading.Lock()
+        self.reset_counts()
+
+    def reset_counts(self):
+        """Reset the request counters."""
+        with self.lock:
+            self.counts = Counter()
+            self.bytes = Counter()
+            self.seconds = Counter()
+            self.faults_raised = Counter()
+
+    def next_fault(self, kind):
+        """Kind of fault the next request of a kind fails with, None if it succeeds."""
+        computes = kind == 'computeFeatures'
+        with self.lock:
+            if self.faults:
+                # a listed compute fault waits for the next computeFeatures request
+                if self.faults[0] in COMPUTE_FAULTS and not computes:
+                    return None
+                fault = self.faults.pop(0)
+            elif self.fault_rate and self.random.random() < self.fault_rate:
+                fault = self.fault_kinds[self.random.integers(len(self.fault_kinds))]
+                if fault in COMPUTE_FAULTS and not computes:
+                    return None
+            else:
+                return None
+            if fault is not None:
+                self.faults_raised[fault] += 1
+            return fault
+
+    def round_trip(self, kind, result):
+        """Count a request of a kind, wait for the latency and return its result or raise an injected fault."""
+        size = payload_size(result)
+        time.sleep(self.latency)
+        fault = self.next_fault(kind)
+        with self.lock:
+            self.counts[kind] += 1
+            self.bytes[kind] += 0 if fault else size
+            self.seconds[kind] += self.latency
+        if fault:
+            raise EEException(FAULTS[fault])
+        return result
+
+    def report(self):
+        """Requests, payload bytes and latency seconds by kind of request."""
+        with self.lock:
+            kinds = sorted(self.counts)
+            return {'requests': {kind: self.counts[kind] for kind in kinds},
+                    'bytes': {kind: self.bytes[kind] for kind in kinds},
+                    'seconds': {kind: self.seconds[kind] for kind in kinds},
+                    'total_requests': sum(self.counts.values()),
+                    'total_bytes': sum(self.bytes.values()),
+                    'faults': dict(self.faults_raised)}
+
+    def feature_time(self, index, end=False):
+        """Synthetic system:time_start (or system:time_end) of feature index in milliseconds."""
+        start = self.start_date + timedelta(days=index % 365)
+        return int((start + timedelta(days=self.period_days if end else 0)).timestamp() * 1000)
+
+    def feature_properties(self, index):
+        """Synthetic properties of feature index."""
+        return {'wllst__': 100000 + index, 'timeStart': self.feature_time(index)}
+
+    def feature_ring(self, index):
+        """Ring of the bounding box of the geometry of feature index, spread over central Alberta."""
+        x, y = -114.0 + (index % 10) * 0.1, 53.0 + (index // 10 % 10) * 0.1
+        return [[x, y], [x + 0.001, y], [x + 0.001, y + 0.001], [x, y + 0.001], [x, y]]
+
+    def scenes(self, start=None, end=None):
+        """Synthetic scene table of a collection from start to end, one scene every scene_interval_days.
+
+        Scenes of the cloudy months have 95% cloud cover, the others 10%.
+        """
+        first = self.start_date - timedelta(days=365)
+        last = self.start_date + timedelta(days=365 + self.period_days)
+        start, end = max(start or first, first), min(end or last, last)
+        rows = []
+        date = first
+        while date < end:
+            if date >= start:
+                rows.append({'sceneId': 'LC08_042024_%s' % date.strftime('%Y%m%d'),
+                             'time': int(date.replace(tzinfo=timezone.utc).timestamp() * 1000),
+                             'cloud': 95.0 if date.month in self.cloudy_months else 10.0, 'path': 42, 'row': 24,
+                             'minX': -115.0, 'minY': 52.5, 'maxX': -112.5, 'maxY': 54.5})
+            date += timedelta(days=self.scene_interval_days)
+        return pd.DataFrame(rows)
+
+    def pixels(self):
+        """Synthetic samples of one request as a dictionary of columns."""
+        with self.lock:
+            columns = {name: self.random.random(self.num_pixels) for name in self.band_names}
+        columns['date'] = np.full(self.num_pixels, float(self.feature_time(0)))
+        return columns
+
+    def list_length(self, obj):
+        """Number of elements of a list made by slicing the feature list."""
+        while isinstance(obj, ComputedObject):
+            if obj.op == 'slice' and obj.args:
+                start = obj.args[0]
+                end = obj.args[1] if len(obj.args) > 1 else self.num_features
+                return max(min(end, self.num_features) - start, 0)
+            obj = obj.receiver
+        return self.num_features
+
+    def resolve(self, obj, index=0):
+        """Synthetic value of a computed object, index is the feature being mapped over."""
+        if isinstance(obj, dict):
+            return {key: self.resolve(value, index) for key, value in obj.items()}
+        if isinstance(obj, (list, tuple)):
+            return [self.resolve(value, index) for value in obj]
+        if not isinstance(obj, ComputedObject):
+            return obj
+        op = obj.op
+        if op == 'Dictionary' and obj.args:
+            return self.resolve(obj.args[0], index)
+        if op == 'map' and obj.mapped is not None:
+            start = next((o.args[0] for o in chain(obj) if o.op == 'slice' and o.args), 0)
+            return [self.resolve(obj.mapped, start + n) for n in range(self.list_length(obj.receiver))]
+        if op == 'size':
+            return self.num_images if isinstance(obj, __getattr__('ImageCollection')) else self.num_features
+        if op == 'bandNames':
+            return list(self.band_names)
+        if op == 'propertyNames':
+            return ['system:time_start', 'system:time_end', 'timeStart', 'wllst__']
+        if op == 'toDictionary':
+            if any(o.op == 'set' and o.args and o.args[0] == 'samples' for o in chain(obj)):
+                return {'samples': [{'bandName': name, 'data': values.tolist()} for name, values in self.pixels().items()]}
+            return self.feature_properties(index)
+        if op in ('millis', 'If', 'parse', 'advance'):
+            return self.feature_time(index, end=mentions(obj, 'system:time_end'))
+        if op == 'area':
+            return 10000.0
+        if op == 'coordinates':
+            return [self.feature_ring(index)]
+        if op == 'get' and obj.args and isinstance(obj.args[0], int):
+            value = self.resolve(obj.receiver, index)
+            return value[obj.args[0]] if isinstance(value, list) and len(value) > obj.args[0] else None
+        if op == 'get' and obj.args and obj.args[0] == 'PLOT_ID':
+            return 'PLOT_%d' % index
+        return None
+
+
+backend = FakeBackend()
+
+
+def payload_size(result):
+    """Approximate size in bytes of a response sent as JSON."""
+    if isinstance(result, pd.DataFrame):
+        return len(result.to_json(orient='records'))
+    return len(json.dumps(result, default=str))
+
+
+def chain(obj):
+    """Computed objects from obj back through the receivers of its method calls."""
+    while isinstance(obj, ComputedObject):
+        yield obj
+        obj = obj.receiver
+
+
+def mentions(obj, text, depth=12):
+    """True if a string argument or dictionary key equal to text appears in the expression of obj."""
+    if depth == 0:
+        return False
+    if isinstance(obj, str):
+        return obj == text
+    if isinstance(obj, dict):
+        return text in obj or any(mentions(value, text, depth - 1) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return any(mentions(value, text, depth - 1) for value in obj)
+    if isinstance(obj, ComputedObject):
+        return any(mentions(value, text, depth - 1) for value in (obj.receiver, obj.args, obj.kwargs, obj.mapped))
+    return False
+
+
+class FakeClass(type):
+    """Metaclass so static calls such as ee.List.sequence or ee.Reducer.mean return objects of the class."""
+
+    def __getattr__(cls, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: cls.make(name, args, kwargs)
+
+
+class ComputedObject(metaclass=FakeClass):
+    """Expression node standing for any Earth Engine object."""
+
+    def __init__(self, *args, **kwargs):
+        self.op = type(self).__name__
+        self.args = args
+        self.kwargs = kwargs
+        self.receiver = None
+        self.mapped = None
+
+    @classmethod
+    def make(cls, op, args=(), kwargs=None, receiver=None):
+        obj = cls.__new__(cls)
+        obj.op = op
+        obj.args = args
+        obj.kwargs = kwargs or {}
+        obj.receiver = receiver
+        obj.mapped = None
+        return obj
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def method(*args, **kwargs):
+            result = type(self).make(name, args, kwargs, receiver=self)
+            # functions are called once with a placeholder, as Earth Engine does when building the graph
+            for arg in list(args) + list(kwargs.values()):
+                if callable(arg) and not isinstance(arg, (ComputedObject, type)):
+                    result.mapped = arg(ComputedObject.make('element'))
+            return result
+        return method
+
+    def getInfo(self):
+        return backend.round_trip('getInfo', backend.resolve(self))
+
+    def serialize(self):
+        return json.dumps(self.expression(), default=str, sort_keys=True)
+
+    def expression(self):
+        """Nested lists describing the calls that made this object."""
+        def encode(value):
+            if isinstance(value, ComputedObject):
+                return value.expression()
+            if isinstance(value, dict):
+                return {str(key): encode(item) for key, item in value.items()}
+            if isinstance(value, (list, tuple)):
+                return [encode(item) for item in value]
+            if callable(value):
+                # the body of a mapped function is in self.mapped, as Earth Engine serializes it
+                return 'function'
+            return value if isinstance(value, (str, int, float, bool, type(None))) else repr(value)
+        return [self.op, encode(self.receiver), encode(list(self.args)), encode(self.kwargs), encode(self.mapped)]
+
+    def __bool__(self):
+        return True
+
+    def _operator(name):
+        return lambda self, *args: type(self).make(name, args, receiver=self)
+
+    __add__ = __radd__ = _operator('add')
+    __sub__ = __rsub__ = _operator('subtract')
+    __mul__ = __rmul__ = _operator('multiply')
+    __truediv__ = __rtruediv__ = _operator('divide')
+    __neg__ = _operator('multiply')
+    del _operator
+
+
+_classes = {}
+
+
+def __getattr__(name):
+    """Any capitalized name (Image, FeatureCollection, Reducer, ...) is a class of fake objects."""
+    if name[:1].isupper():
+        if name not in _classes:
+            _classes[name] = FakeClass(name, (ComputedObject,), {})
+        return _classes[name]
+    raise AttributeError(name)
+
+
+def Initialize(*args, **kwargs):
+    pass
+
+
+def Authenticate(*args, **kwargs):
+    pass
+
+
+class data:
+    """Fake of ee.data, each call is one request."""
+
+    @staticmethod
+    def computeFeatures(params):
+        expression = params['expression']
+        if mentions(expression, 'sceneId'):
+            # scene table harvested by leaftoolbox.toolsCatalog, restricted to the filterDate of the collection
+            dates = next((o.args for o in chain(expression.args[0]) if o.op == 'filterDate'), (None, None))
+            return backend.round_trip('computeFeatures', backend.scenes(*dates))
+        return backend.round_trip('computeFeatures', pd.DataFrame(backend.pixels()))
+
+    @staticmethod
+    def getAsset(asset_id):
+        return backend.round_trip('getAsset', {'id': asset_id, 'name': asset_id, 'type': 'TABLE'})
+
+    @staticmethod
+    def listAssets(params):
+        return backend.round_trip('listAssets', {'assets': []})
+
+
+class Task:
+    """Fake export task, RUNNING for task_polls calls to status() then COMPLETED."""
+
+    def __init__(self, config):
+        self.config = config
+        self.polls = 0
+
+    def start(self):
+        backend.round_trip('export', None)
+
+    def status(self):
+        self.polls += 1
+        state = 'RUNNING' if self.polls <= backend.task_polls else 'COMPLETED'
+        return backend.round_trip('status', {'state': state, 'description': self.config.get('description')})
+
+
+class _Exporter:
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: Task(kwargs)
+
+
+class batch:
+    """Fake of ee.batch, Export.<kind>.<destination>(...) returns a Task."""
+
+    Task = Task
+
+    class Export:
+        table = _Exporter()
+        image = _Exporter()
+
+
+def install(**config):
+    """Replace the ee module by this fake and configure the backend, call before importing leaftoolbox."""
+    global backend
+    backend = FakeBackend(**config)
+    sys.modules['ee'] = sys.modules[__name__]
+    return backend
@@ -4,6 +4,12 @@ from . import toolsUtils
 from . import eoImage
 from . import toolsNets
 from . import dictionariesSL2P 
+from . import toolsEE
+from . import toolsWindows
+from . import toolsCheckpoint
+from . import toolsCache
+from . import toolsProfile
+from . import toolsCatalog
 from datetime import timedelta
 from datetime import datetime
 import pickle
@@ -11,22 +17,47 @@ import os
 from pprint import pprint
 import numpy as np
 from tqdm import tqdm 
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 
 
+# ingredients of makeProductCollection built once per run for each (collection, algorithm)
+# cleared at the start and end of each run of sampleTimeSeries, sampleSites, iterSampleSites and sampleSitesBatch
+ingredientCache = toolsCache.RunCache()
+
+# smallest fraction of the subsampling fraction used when a window of the minimum length runs out of memory
+minPixelBudget = 1/16
+
+#returns the networks, partition mosaic and collection options with the legend remap of a collection, built on the first call of a run only
+# the networks of all variables are parsed together so the ingredients do not depend on the variable
+def collectionIngredients(colOptions):
+    def build():
+        # check how many different unique networks are available (i.e. by partition class) - this is used for SL2P-CCRS
+        numNets = ee.Number(ee.Feature((colOptions["Network_Ind"]).first()).propertyNames().remove('lon').remove('Feature Index').remove('system:index').size())
+
+        # populate the netwoorks for each unique partition class
+        return {'numNets': numNets, \
+                'SL2P': ee.List.sequence(1,ee.Number(colOptions["numVariables"]),1).map(lambda netNum: toolsNets.makeNetVars(colOptions["Collection_SL2P"],numNets,netNum)), \
+                'errorsSL2P': ee.List.sequence(1,ee.Number(colOptions["numVariables"]),1).map(lambda netNum: toolsNets.makeNetVars(colOptions["Collection_SL2Perrors"],numNets,netNum)), \
+                'partition': (colOptions["partition"]).mosaic().rename('partition'), \
+                'colOptions': dict(colOptions, legendRemap=toolsNets.makeLegendRemap(colOptions["legend"],colOptions["Network_Ind"]))}
+    return ingredientCache.get((colOptions.get("key",colOptions["name"]),colOptions.get("algorithm")), build)
+
 #makes products for specified region and time period 
-def makeProductCollection(colOptions,netOptions,variable,mapBounds,startDate,endDate,maxCloudcover,inputScaleSize) :
+# dispatch='grouped' evaluates only the network of each pixel's partition instead of masking every network and taking the max
+# fused=True evaluates the estimate and error networks in a single pass over each image
+# partitionDomains is an optional list of domain feature collections indexed by networkID used for the QC band
+def makeProductCollection(colOptions,netOptions,variable,mapBounds,startDate,endDate,maxCloudcover,inputScaleSize,dispatch='mask',fused=False,partitionDomains=None) :
     # print('makeProductCollection')
     products = []
     tools = colOptions['tools']
+    wrapperNNets = toolsNets.wrapperNNetsGrouped if dispatch == 'grouped' else toolsNets.wrapperNNets
     
-    # parse the networks
-    # check how many different unique networks are available (i.e. by partition class) - this is used for SL2P-CCRS
-    numNets = ee.Number(ee.Feature((colOptions["Network_Ind"]).first()).propertyNames().remove('lon').remove('Feature Index').remove('system:index').size())
-
-    # populate the netwoorks for each unique partition class
-    net1 = toolsNets.makeNetVars(colOptions["Collection_SL2P"],numNets,1)
-    SL2P = ee.List.sequence(1,ee.Number(colOptions["numVariables"]),1).map(lambda netNum: toolsNets.makeNetVars(colOptions["Collection_SL2P"],numNets,netNum))
-    errorsSL2P = ee.List.sequence(1,ee.Number(colOptions["numVariables"]),1).map(lambda netNum: toolsNets.makeNetVars(colOptions["Collection_SL2Perrors"],numNets,netNum))
+    # parse the networks, reused from previous calls for the same collection
+    ingredients = collectionIngredients(colOptions)
+    SL2P = ingredients['SL2P']
+    errorsSL2P = ingredients['errorsSL2P']
+    colOptions = ingredients['colOptions']
 
     # make products 
     input_collection =  ee.ImageCollection(colOptions['name']) \
@@ -41,7 +72,7 @@ def makeProductCollection(colOptions,netOptions,variable,mapBounds,startDate,end
                       .map(lambda image: tools.addGeometry(colOptions,image)) 
 
     # check if there are products
-    if (input_collection.size().getInfo() > 0):
+    if (toolsEE.getInfo(input_collection.size()) > 0):
         # reproject to output scale based if it differs from nominal scale of first band
         projection = input_collection.first().select(netOptions["inputBands"][3]).projection()
         input_collection = input_collection.map( lambda image: image.setDefaultProjection(crs=image.select(image.bandNames().slice(0,1)).projection()) \
@@ -49,7 +80,7 @@ def makeProductCollection(colOptions,netOptions,variable,mapBounds,startDate,end
         
         input_collection  =  input_collection.map(lambda image: tools.MaskLand(image)).map(lambda image:toolsUtils.scaleBands(netOptions["inputBands"],netOptions["inputScaling"],netOptions["inputOffset"],image)) 
 
-        partition = (colOptions["partition"]).filterBounds(mapBounds).mosaic().clip(mapBounds).rename('partition');
+        partition = ingredients['partition'].clip(mapBounds);
         input_collection  =  input_collection.map(lambda image: image.addBands(partition))
         ###  add s2cloudness data (For Sentinel-2)
         if colOptions['name'].startswith('COPERNICUS/S2_SR'):
@@ -67,40 +98,120 @@ def makeProductCollection(colOptions,netOptions,variable,mapBounds,startDate,end
             #partition = (colOptions["partition"]).filterBounds(mapBounds).mosaic().clip(mapBounds).rename('partition');
 
             # pre process input imagery and flag invalid inputs
-            input_collection  =  input_collection.map(lambda image: toolsUtils.invalidInput(colOptions["sl2pDomain"],netOptions["inputBands"],image)) 
+            if partitionDomains is None:
+                input_collection  =  input_collection.map(lambda image: toolsUtils.invalidInput(colOptions["sl2pDomain"],netOptions["inputBands"],image)) 
+            else:
+                input_collection  =  input_collection.map(lambda image: image.addBands(toolsUtils.invalidInputPartition(partitionDomains,netOptions["inputBands"], \
+                                                            image.addBands(toolsNets.makeIndexLayer(image.select('partition'),colOptions["legend"],colOptions["Network_Ind"],colOptions["legendRemap"]))).select('QC')))
             
             ## apply networks to produce mapped parameters
-            if 's2cloudless_probability' in input_collection.first().bandNames().getInfo():
+            if 's2cloudless_probability' in toolsEE.getInfo(input_collection.first().bandNames()):
                 products =  input_collection.select(['date','QC','longitude','latitude','s2cloudless_probability'])  
             else:
                 products =  input_collection.select(['date','QC','longitude','latitude']) 
                 
             image = input_collection.first()
-            estimateSL2P = input_collection.map(lambda image: toolsNets.wrapperNNets(SL2P,partition, netOptions, colOptions,"estimate",variable,image))
-            uncertaintySL2P = input_collection.map(lambda image: toolsNets.wrapperNNets(errorsSL2P,partition, netOptions, colOptions,"error",variable,image))
-            products =  products.combine(estimateSL2P).combine(uncertaintySL2P.select("error"+variable))  
+            if fused:
+                productsSL2P = input_collection.map(lambda image: toolsNets.wrapperNNetsFused(SL2P,errorsSL2P,partition, netOptions, colOptions,variable,image,dispatch))
+                products =  products.combine(productsSL2P)
+            else:
+                estimateSL2P = input_collection.map(lambda image: wrapperNNets(SL2P,partition, netOptions, colOptions,"estimate",variable,image))
+                uncertaintySL2P = input_collection.map(lambda image: wrapperNNets(errorsSL2P,partition, netOptions, colOptions,"error",variable,image))
+                products =  products.combine(estimateSL2P).combine(uncertaintySL2P.select("error"+variable))  
     return products
 
-# returns lists of sampled values for each band in an image as a new feature property
-def sampleProductCollection(productCollection, sampleRegion, outputScaleSize, factor=1,numPixels=0) :
+# reducer applied to each product image over the site geometry in aggregate mode
+def aggregateReducer():
+    return ee.Reducer.mean().combine(ee.Reducer.median(),sharedInputs=True) \
+                            .combine(ee.Reducer.stdDev(),sharedInputs=True) \
+                            .combine(ee.Reducer.percentile([10,25,75,90]),sharedInputs=True) \
+                            .combine(ee.Reducer.count(),sharedInputs=True)
+
+# returns the samples of the images over a collection of sites as a feature collection and the list of sampled properties
+# samples carry the siteProperty of their site, aggregate=True returns the statistics of each image over each site instead of the pixels
+# dateProperties=(startProperty,endProperty) samples each image only over the sites with startProperty <= image date < endProperty (milliseconds)
+# numPixels>0 or factor<1 samples each site separately with image.sample as sampleProductTable does, instead of all sites in one sampleRegions
+def sampleProductTableSites(productCollection, sites, outputScaleSize, siteProperty, aggregate=False, dateProperties=None, factor=1, numPixels=0) :
+
+    productCollection = ee.ImageCollection(productCollection)
+    outputScaleSize= ee.Number(outputScaleSize)
+    allSites = ee.FeatureCollection(sites)
+    bandNames = productCollection.first().bandNames()
+
+    def imageSites(image):
+        if dateProperties is None:
+            return allSites.select([siteProperty])
+        time = image.get('system:time_start')
+        return allSites.filter(ee.Filter.And(ee.Filter.lte(dateProperties[0],time),ee.Filter.gt(dateProperties[1],time))).select([siteProperty])
+
+    if aggregate:
+        reducer = aggregateReducer()
+        outputNames = bandNames.map(lambda bandName: reducer.getOutputs().map(lambda output: ee.String(bandName).cat('_').cat(output))).flatten()
+        sampleData = productCollection.map(lambda image: image.reduceRegions(collection=imageSites(image), reducer=reducer, crs=image.select(image.slice(4,5).bandNames()).projection(), scale=outputScaleSize) \
+                                                              .map(lambda feature: feature.set('date',image.get('system:time_start')))).flatten() \
+                                      .filter(ee.Filter.notNull(outputNames))
+        outputNames = outputNames.add('date')
+    elif (numPixels>0) or (factor<1):
+        outputNames = bandNames
+        subsampling = {'numPixels': numPixels} if (numPixels>0) else {'factor': factor}
+        def sampleSites(image):
+            return imageSites(image).map(lambda site: image.sample(region=site.geometry(), projection=image.select(image.slice(4,5).bandNames()).projection(), scale=outputScaleSize, \
+                                                                   geometries=False, dropNulls=True, **subsampling) \
+                                                            .map(lambda sample: sample.set(siteProperty,site.get(siteProperty)))).flatten()
+        sampleData = productCollection.map(sampleSites).flatten()
+    else:
+        outputNames = bandNames
+        sampleData = productCollection.map(lambda image: image.sampleRegions(collection=imageSites(image), properties=[siteProperty], projection=image.select(image.slice(4,5).bandNames()).projection(), \
+                                                                              scale=outputScaleSize, geometries=False)).flatten()
+
+    return ee.FeatureCollection(sampleData), outputNames.add(siteProperty)
+
+# returns lists of sampled values for each band of the images over a collection of sites as the samples property of a feature
+def sampleProductCollectionSites(productCollection, sites, outputScaleSize, siteProperty, aggregate=False, factor=1, numPixels=0) :
+    sampleData, outputNames = sampleProductTableSites(productCollection, sites, outputScaleSize, siteProperty, aggregate, factor=factor, numPixels=numPixels)
+    sampleList= ee.List(outputNames.map(lambda bandName: ee.Dictionary({ 'bandName': bandName, 'data': sampleData.aggregate_array(bandName)})))
+    return ee.Feature(None).set('samples',sampleList)
+
+# returns the samples of the images over a region as a feature collection and the list of sampled properties
+# aggregate=True returns one feature per image with each band and aggregateReducer output (e.g. estimateLAI_median) instead of the pixels
+def sampleProductTable(productCollection, sampleRegion, outputScaleSize, factor=1,numPixels=0,aggregate=False) :
 
     productCollection = ee.ImageCollection(productCollection)
     outputScaleSize= ee.Number(outputScaleSize)
     sampleRegion = ee.Feature(sampleRegion)
 
+    if aggregate:
+        reducer = aggregateReducer()
+        bandNames = productCollection.first().bandNames()
+        outputNames = bandNames.map(lambda bandName: reducer.getOutputs().map(lambda output: ee.String(bandName).cat('_').cat(output))).flatten()
+        # one feature per image with the statistics of each band, date is the image date
+        statistics = productCollection.map(lambda image: ee.Feature(None,image.reduceRegion(reducer=reducer, geometry=sampleRegion.geometry(), crs=image.select(image.slice(4,5).bandNames()).projection(), \
+                                                                                                  scale=outputScaleSize, maxPixels=1e9)) \
+                                                                 .set('date',image.get('system:time_start'))) \
+                                      .filter(ee.Filter.notNull(outputNames))
+        return ee.FeatureCollection(statistics), outputNames.add('date')
+
     # produce feature collection where each feature a feature collectiion corresponding to a list of samples from a given band from one product image
     if (numPixels>0):
-        sampleData = productCollection.map(lambda image: image.sample(region=sampleRegion.geometry(), projection=image.select(image.slice(4,5).bandNames()).projection(), scale=outputScaleSize,geometries=True, dropNulls = True, numPixels=numPixels) ).flatten()
+        sampleData = productCollection.map(lambda image: image.sample(region=sampleRegion.geometry(), projection=image.select(image.slice(4,5).bandNames()).projection(), scale=outputScaleSize,geometries=False, dropNulls = True, numPixels=numPixels) ).flatten()
     else:
-        sampleData = productCollection.map(lambda image: image.sample(region=sampleRegion.geometry(), projection=image.select(image.slice(4,5).bandNames()).projection(), scale=outputScaleSize,geometries=True, dropNulls = True, factor=factor) ).flatten()
+        sampleData = productCollection.map(lambda image: image.sample(region=sampleRegion.geometry(), projection=image.select(image.slice(4,5).bandNames()).projection(), scale=outputScaleSize,geometries=False, dropNulls = True, factor=factor) ).flatten()
+    return ee.FeatureCollection(sampleData), productCollection.first().bandNames()
+
+# returns lists of sampled values for each band in an image as a new feature property
+def sampleProductCollection(productCollection, sampleRegion, outputScaleSize, factor=1,numPixels=0,aggregate=False) :
+    sampleRegion = ee.Feature(sampleRegion)
+    sampleData, outputNames = sampleProductTable(productCollection, sampleRegion, outputScaleSize, factor, numPixels, aggregate)
     
     # for each band get a dictionary of sampled values as a property of the sampleRegion feature
-    sampleList= ee.List(productCollection.first().bandNames().map(lambda bandName: ee.Dictionary({ 'bandName': bandName, 'data': sampleData.aggregate_array(bandName)})))
+    sampleList= ee.List(outputNames.map(lambda bandName: ee.Dictionary({ 'bandName': bandName, 'data': sampleData.aggregate_array(bandName)})))
     
     return sampleRegion.set('samples',sampleList)
 
 # add dictionary of sampled values from product to a feature
-def getSamples(site,variable,collectionOptions,networkOptions,maxCloudcover,bufferSpatialSize,inputScaleSize,startDate,endDate,outputScaleSize,factor=1,numPixels=0):
+# columnar=True returns the feature collection of samples from sampleProductTable instead, fetched as a table by samplestoDF
+# partitionDomains checks the input domain of each pixel against the domain of its partition network (see makeProductCollection)
+def getSamples(site,variable,collectionOptions,networkOptions,maxCloudcover,bufferSpatialSize,inputScaleSize,startDate,endDate,outputScaleSize,factor=1,numPixels=0,dispatch='mask',fused=False,aggregate=False,columnar=False,partitionDomains=None):
     
     # Buffer features is requested
     if ( bufferSpatialSize > 0 ):
@@ -111,10 +222,13 @@ def getSamples(site,variable,collectionOptions,networkOptions,maxCloudcover,buff
      # make collection
     sampleFeature = []
     productCollection = []
-    productCollection = makeProductCollection(collectionOptions,networkOptions,variable,site.geometry(),startDate,endDate,maxCloudcover,inputScaleSize)
+    productCollection = makeProductCollection(collectionOptions,networkOptions,variable,site.geometry(),startDate,endDate,maxCloudcover,inputScaleSize,dispatch,fused,partitionDomains)
     if productCollection :
         if ( ee.ImageCollection(productCollection).size().gt(0) ) :
-            sampleFeature = sampleProductCollection(productCollection, site.geometry(),  outputScaleSize,factor,numPixels)
+            if columnar:
+                sampleFeature = sampleProductTable(productCollection, site.geometry(),  outputScaleSize,factor,numPixels,aggregate)[0]
+            else:
+                sampleFeature = sampleProductCollection(productCollection, site.geometry(),  outputScaleSize,factor,numPixels,aggregate)
 
     return  sampleFeature
 
@@ -136,17 +250,18 @@ def getCollection(site,variable,collectionOptions,networkOptions,maxCloudcover,b
     return outputCollection
 
 #format samples into a data frame
+# a feature collection of samples (getSamples with columnar=True) is fetched as a table in one request
 def samplestoDF(sampleFeature):
 
-    # create empty data frame to hold samples
-    sampleDF = pd.DataFrame()
-    
-    # loop over list of samples and add column for each property sampled to dataframe
-    sampleList = ee.Dictionary(ee.Feature(sampleFeature).toDictionary()).getInfo()['samples']
-    for col in sampleList:
-        df = pd.DataFrame((col['data']),columns=[col['bandName']])
-        if (not(df.empty)) :
-            sampleDF = pd.concat([sampleDF,df],axis=1) 
+    if isinstance(sampleFeature, ee.FeatureCollection):
+        sampleDF = toolsEE.computeFeatures(sampleFeature)
+        with toolsProfile.stage('samplestoDF'):
+            sampleDF = sampleDF.drop(columns='geo',errors='ignore')
+    else:
+        # one column for each property sampled, columns of different lengths are padded with NaN
+        sampleList = toolsEE.getInfo(ee.Dictionary(ee.Feature(sampleFeature).toDictionary()))['samples']
+        with toolsProfile.stage('samplestoDF'):
+            sampleDF = pd.DataFrame({col['bandName']: pd.Series(col['data']) for col in sampleList if col['data']})
     
     if  (not(sampleDF.empty)) :
         sampleDF = sampleDF.dropna(subset=['date'])
@@ -168,10 +283,10 @@ def samplepartition(siteList,algorithm,bufferSpatialSize=0,outputFileName=None,n
         ESUs = []
         sampleRecords =  ee.FeatureCollection(input).sort('system:time_start', False).map(lambda feature: feature.set('timeStart',feature.get('system:time_start')))
         sampleRecords =  sampleRecords.toList(sampleRecords.size())
-        for n in range(sampleRecords.size().getInfo()) : #sampleRecords.size().getInfo()
+        for n in range(toolsEE.getInfo(sampleRecords.size())) : #sampleRecords.size().getInfo()
             result = []
             site = ee.Feature(sampleRecords.get(n))
-            esu=site.get('PLOT_ID').getInfo()
+            esu=toolsEE.getInfo(site.get('PLOT_ID'))
             if esu in ESUs:
                 print('Already sampled')
             else:
@@ -205,6 +320,7 @@ def sampleTimeSeries(siteList,imageCollectionName,algorithm,variableName='LAI',m
         endDatePlusOne = endDate + timedelta(days=1)
     except:
         raise ValueError(('Supported EO datasets: %s'%(dictionariesSL2P.make_net_options()[variableName].keys())))  
+    ingredientCache.clear()
     outputDictionary = {}
     collectionOptions = (dictionariesSL2P.make_collection_options(algorithm))
     networkOptions= dictionariesSL2P.make_net_options()
@@ -217,127 +333,357 @@ def sampleTimeSeries(siteList,imageCollectionName,algorithm,variableName='LAI',m
             result = []
             site = ee.Feature(sampleRecords.get(n))
             
-            esu=site.get('PLOT_ID').getInfo()
+            siteInfo = toolsEE.getInfo(ee.Dictionary({'PLOT_ID': site.get('PLOT_ID'), 'area': site.geometry().area(1)}))
+            esu=siteInfo['PLOT_ID']
             print(esu)
-            dateRange = pd.DataFrame(pd.date_range(startDate,endDate,freq='ME'),columns=['startDate'])
-            dateRange['endDate'] = pd.concat([dateRange['startDate'].tail(-1),pd.DataFrame([endDatePlusOne])],ignore_index=True).values
-            #dateRange = pd.DataFrame( {'startDate':[startDate],'endDate':[endDatePlusOne]})
-            # process one month at a time to prevent GEE memory limits
-            samplesDF = pd.DataFrame()
-            for index, Dates in dateRange.iterrows():
+            def sampleWindow(windowStart,windowEnd):
                 sampleFeature= getSamples(site,variableName,collectionOptions[imageCollectionName],networkOptions[variableName][imageCollectionName],maxCloudcover,bufferSpatialSize,inputScaleSize, \
-                                     Dates['startDate'],Dates['endDate'],outputScaleSize,subsamplingFraction,numPixels)
-                if sampleFeature :
-                    samplesDF = pd.concat([samplesDF,samplestoDF(sampleFeature)],ignore_index=True)
-            result.append({'feature': ee.Dictionary(ee.Feature(sampleRecords.get(n)).toDictionary()).getInfo() , \
+                                     windowStart,windowEnd,outputScaleSize,subsamplingFraction,numPixels,columnar=True)
+                return samplestoDF(sampleFeature) if sampleFeature else pd.DataFrame()
+
+            # process the period in adaptive windows, a window is only split when GEE runs out of memory or time
+            windowKey = (imageCollectionName,toolsWindows.areaBucket(siteInfo['area']))
+            samplesDF = pd.concat(toolsWindows.planner.run(startDate,endDatePlusOne,sampleWindow,windowKey),ignore_index=True)
+            result.append({'feature': toolsEE.getInfo(ee.Dictionary(ee.Feature(sampleRecords.get(n)).toDictionary())) , \
                 algorithm.__name__ : samplesDF })        
     
             outputDictionary.update({esu: result})   
             with open(outputFileName, "wb") as fp:   #Pickling
                 pickle.dump(outputDictionary, fp) 
+    ingredientCache.clear()
     print('\nDONE LEAF SITE\n')    
     return outputDictionary
     
-#sample features for LEAF output
-def sampleSites(siteList,imageCollectionName,algorithm,variableName='LAI',maxCloudcover=100,outputScaleSize=30,inputScaleSize=30,bufferSpatialSize=0,bufferTemporalSize=[0,0],subsamplingFraction=1,numPixels=0,outputPathName=None,feature_range=[0,np.nan]):
-    print('STARTING LEAF IMAGE for ',imageCollectionName)
-    if outputPathName==None:
-        outputPathName=os.getcwd()
-
+#fetch the size of a feature list and the properties and dates of its features start to end in a single request
+# string dates are parsed on the server as dd/MM/YY, timeEnd is missing for features without system:time_end
+# area is the area of the feature geometry in m2, used to reuse the date window length of similar sites
+# bounds is the ring of the bounding box of the feature geometry, used to find its scenes in a scene catalog
+def prefetchFeatures(sampleRecords,start=0,end=None):
+    def featureInfo(feature):
+        feature = ee.Feature(feature)
+        def millis(name):
+            value = feature.get(name)
+            return ee.Algorithms.If(ee.String(ee.Algorithms.ObjectType(value)).equals('String'), \
+                                    ee.Date.parse("dd/MM/YY",value,'Etc/GMT+6').millis(), \
+                                    ee.Date(value).millis())
+        return ee.Dictionary({'feature': feature.toDictionary(), \
+                              'timeStart': millis('system:time_start'), \
+                              'timeEnd': ee.Algorithms.If(feature.propertyNames().contains('system:time_end'),millis('system:time_end'),None), \
+                              'area': feature.geometry().area(1), \
+                              'bounds': feature.geometry().bounds(1).coordinates().get(0)})
+
+    records = sampleRecords.slice(start) if end is None or np.isnan(end) else sampleRecords.slice(start,int(end))
+    info = toolsEE.getInfo(ee.Dictionary({'size': sampleRecords.size(), 'features': records.map(featureInfo)}))
+    featureTable = pd.DataFrame(info['features'],columns=['feature','timeStart','timeEnd','area','bounds'],index=range(start,start+len(info['features'])))
+    return info['size'], featureTable
+
+
+#returns (startDate,endDate,endDatePlusOne) when bufferTemporalSize holds two %Y-%m-%d dates used for all features, otherwise None
+def defaultDateRange(bufferTemporalSize):
     if (type(bufferTemporalSize[0])==str):
         try: 
             startDate = datetime.strptime(bufferTemporalSize[0],"%Y-%m-%d")
             endDate =  datetime.strptime(bufferTemporalSize[1],"%Y-%m-%d")
-            endDatePlusOne = endDate + timedelta(days=1)
-            defaultDate=True
+            return (startDate,endDate,endDate + timedelta(days=1))
         except ValueError:
-            defaultDate = False
+            return None
+    return None
+
+#returns (startDate,endDate,endDatePlusOne) of a feature from its row in the prefetchFeatures table, defaultDates overrides the feature dates
+def featureDates(featureInfo,bufferTemporalSize,defaultDates=None):
+    if ( defaultDates is not None ):
+        return defaultDates
+    startDate = datetime.fromtimestamp(featureInfo['timeStart']/1000) + timedelta(days=bufferTemporalSize[0])
+    if not pd.isna(featureInfo['timeEnd']):
+        endDate = datetime.fromtimestamp(featureInfo['timeEnd']/1000) + timedelta(days=bufferTemporalSize[1])
     else:
-        defaultDate = False
+        endDate = startDate - timedelta(days=bufferTemporalSize[0]) + timedelta(days=bufferTemporalSize[1])
+    return (startDate,endDate,endDate + timedelta(days=1))
+
+#returns the (minX,minY,maxX,maxY) bounds in degrees of a feature from its row in the prefetchFeatures table, grown by the spatial buffer
+def featureBounds(featureInfo,bufferSpatialSize):
+    return toolsCatalog.ringBounds(featureInfo['bounds'],bufferSpatialSize)
+
+#harvest the scenes of a collection over the features of a prefetchFeatures table into a scene catalog, unless it holds them already
+# scenes are stored under the collection key and harvested from its Earth Engine asset, the "name" of its collection options
+# a harvest that still runs out of memory or time on its shortest window is left unrecorded, the catalog then returns no
+# scene dates for the features and they are sampled in plain date windows
+# returns the bounds and (startDate,endDate,endDatePlusOne) of all features
+def harvestScenes(catalog,featureTable,imageCollectionName,collectionOptions,bufferSpatialSize,bufferTemporalSize,defaultDates=None):
+    bounds = [featureBounds(featureTable.loc[n],bufferSpatialSize) for n in featureTable.index]
+    bounds = (min(b[0] for b in bounds),min(b[1] for b in bounds),max(b[2] for b in bounds),max(b[3] for b in bounds))
+    dates = [featureDates(featureTable.loc[n],bufferTemporalSize,defaultDates) for n in featureTable.index]
+    dates = (min(d[0] for d in dates),max(d[1] for d in dates),max(d[2] for d in dates))
+    try:
+        catalog.ensure(imageCollectionName,collectionOptions[imageCollectionName]["Cloudcover"],bounds,dates[0],dates[2],collectionOptions[imageCollectionName]["name"])
+    except Exception as error:
+        if not toolsWindows.isSplitError(error):
+            raise
+        toolsEE.retryPolicy.count('split.catalogFallback')
+        print('Sampling without the scene catalog, harvesting scenes of %s failed: %s'%(imageCollectionName,error))
+    return bounds, dates
+
+#sample one feature of a site list for LEAF output
+# featureInfo is the row of the feature in the prefetchFeatures table, defaultDates=(startDate,endDate,endDatePlusOne) overrides its dates
+# with a scene catalog (see harvestScenes), date windows without candidate scenes are skipped before any request
+def sampleSiteFeature(sampleRecords,n,numFeatures,featureInfo,imageCollectionName,algorithm,variableName,collectionOptions,networkOptions,maxCloudcover,outputScaleSize,inputScaleSize,bufferSpatialSize,bufferTemporalSize,subsamplingFraction,defaultDates=None,aggregate=False,catalog=None,partitionDomains=None):
+    # select feature to process
+    site = ee.Feature(sampleRecords.get(n))
+    toolsProfile.profiler.setFeature(n)
+    # get start and end date for this feature
+    startDate, endDate, endDatePlusOne = featureDates(featureInfo,bufferTemporalSize,defaultDates)
+
+    print('Feature n°: %s/%s  -- startDate: %s -- endDate: %s'%(n,numFeatures,startDate,endDate))
+    print('----------------------------------------------------------------------------------------------------------')
+    
+    print(startDate,endDate)
+    # a window that runs out of memory but is too short for the planner to split is sampled again with half the pixels
+    def sampleWindow(windowStart,windowEnd):
+        factor = subsamplingFraction
+        while True:
+            try:
+                sampleFeature= getSamples(site,variableName,collectionOptions[imageCollectionName],networkOptions[variableName][imageCollectionName],maxCloudcover,bufferSpatialSize,inputScaleSize, \
+                                windowStart,windowEnd,outputScaleSize,factor,aggregate=aggregate,columnar=True,partitionDomains=partitionDomains)
+                return samplestoDF(sampleFeature) if sampleFeature else pd.DataFrame()
+            except Exception as error:
+                days = (windowEnd - windowStart) / timedelta(days=1)
+                if aggregate or not toolsWindows.isSplitError(error) or days / 2 >= toolsWindows.planner.minDays or factor / 2 < subsamplingFraction * minPixelBudget:
+                    raise
+                factor = factor / 2
+                toolsEE.retryPolicy.count('split.pixelBudget')
+                print('Sampling window %s to %s with subsampling fraction %s: %s'%(windowStart,windowEnd,factor,error))
+
+    # process the period in adaptive windows, a window is only split when GEE runs out of memory or time
+    windowKey = (imageCollectionName,toolsWindows.areaBucket(featureInfo['area']))
+    sceneDates = None
+    if catalog is not None:
+        sceneDates = catalog.sceneDates(imageCollectionName,featureBounds(featureInfo,bufferSpatialSize),startDate,endDatePlusOne,maxCloudcover)
+    # self time of the feature, its requests and conversions are reported as their own nested stages
+    with toolsProfile.stage('feature'):
+        samplesDF = pd.concat(toolsWindows.planner.run(startDate,endDatePlusOne,sampleWindow,windowKey,sceneDates) or [pd.DataFrame()],ignore_index=True)
+    toolsProfile.profiler.setFeature(None)
+
+    return {'feature': featureInfo['feature'] , \
+                algorithm.__name__ : samplesDF }
+
+
+#sample features of a site list in order, yields (n, result of sampleSiteFeature) as each feature completes
+# featureTable is the prefetchFeatures table of the site list and features the indices of the features to sample
+def iterSiteFeatures(sampleRecords,featureTable,features,numFeatures,imageCollectionName,algorithm,variableName,collectionOptions,networkOptions,maxCloudcover,outputScaleSize,inputScaleSize, \
+                     bufferSpatialSize,bufferTemporalSize,subsamplingFraction,defaultDates=None,aggregate=False,max_workers=1,catalog=None,partitionDomains=None):
+    sampleFeature = lambda n: sampleSiteFeature(sampleRecords,n,numFeatures,featureTable.loc[n],imageCollectionName,algorithm,variableName,collectionOptions,networkOptions,maxCloudcover, \
+                                                outputScaleSize,inputScaleSize,bufferSpatialSize,bufferTemporalSize,subsamplingFraction,defaultDates,aggregate,catalog,partitionDomains)
+    if max_workers <= 1:
+        for n in features:
+            yield n, sampleFeature(n)
+        return
+    # features are sampled in worker threads but collected in order, at most max_workers features are pending
+    # so the next feature is only submitted once the oldest one is yielded
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    pending = deque()
+    try:
+        for n in features:
+            pending.append((n, executor.submit(sampleFeature, n)))
+            if len(pending) >= max_workers:
+                n, future = pending.popleft()
+                yield n, future.result()
+        while pending:
+            n, future = pending.popleft()
+            yield n, future.result()
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+#sample features for LEAF output, yields (feature properties, samples data frame) as each feature completes
+# takes the sampling parameters of sampleSites and keeps nothing once a feature is yielded, nothing is written to disk
+# the scene catalog is closed once the generator is exhausted, closed or fails
+def iterSampleSites(siteList,imageCollectionName,algorithm,variableName='LAI',maxCloudcover=100,outputScaleSize=30,inputScaleSize=30,bufferSpatialSize=0,bufferTemporalSize=[0,0],subsamplingFraction=1,numPixels=0,feature_range=[0,np.nan],max_workers=1,rate_limit=None,aggregate=False,scene_catalog=None,partitionDomains=None):
+    print('STARTING LEAF IMAGE for ',imageCollectionName)
+    toolsEE.setRateLimit(rate_limit)
+    defaultDates = defaultDateRange(bufferTemporalSize)
+    collectionOptions = (dictionariesSL2P.make_collection_options(algorithm))
+    networkOptions= dictionariesSL2P.make_net_options()
+    catalog = toolsCatalog.SceneCatalog(scene_catalog) if scene_catalog else None
+    ingredientCache.clear()
+
+    try:
+        for input in siteList:
+            sampleRecords =  ee.FeatureCollection(input).sort('system:time_start', False).map(lambda feature: feature.set('timeStart',feature.get('system:time_start')))
+            sampleRecords =  sampleRecords.toList(sampleRecords.size())
+            numRecords, featureTable = prefetchFeatures(sampleRecords,feature_range[0],feature_range[1])
+            print('Site: ',input, ' with ',numRecords, ' features.')
+            numFeatures = int(np.nanmin([feature_range[1],numRecords]))
+            if catalog is not None and not featureTable.empty:
+                harvestScenes(catalog,featureTable,imageCollectionName,collectionOptions,bufferSpatialSize,bufferTemporalSize,defaultDates)
+            for n, siteResult in iterSiteFeatures(sampleRecords,featureTable,range(feature_range[0],numFeatures),numFeatures,imageCollectionName,algorithm,variableName,collectionOptions,networkOptions,maxCloudcover, \
+                                                  outputScaleSize,inputScaleSize,bufferSpatialSize,bufferTemporalSize,subsamplingFraction,defaultDates,aggregate,max_workers,catalog,partitionDomains):
+                yield siteResult['feature'], siteResult[algorithm.__name__]
+            print('\nDONE LEAF SITE\n')
+    finally:
+        ingredientCache.clear()
+        if catalog is not None:
+            catalog.close()
+
+
+#sample features for LEAF output
+# max_workers > 1 samples features concurrently in a thread pool, results keep the feature order
+# rate_limit sets the maximum number of Earth Engine requests per second made by each worker
+# aggregate=True returns per image statistics of each band over the site (see sampleProductCollection) instead of pixel samples
+# every sampled feature is appended to a *_checkpoint.sqlite file named after the run parameters, resume=True skips the features
+# it already holds, otherwise the features stored for each input are cleared first
+# scene_catalog is a SQLite file of the scenes of the collection over the sites (see toolsCatalog), harvested once on the first run
+# and used to skip the date windows without candidate scenes and to batch the days with scenes into fewer windows
+# partitionDomains is a list of domain feature collections indexed by networkID, the QC band then uses the domain of each pixel's network
+def sampleSites(siteList,imageCollectionName,algorithm,variableName='LAI',maxCloudcover=100,outputScaleSize=30,inputScaleSize=30,bufferSpatialSize=0,bufferTemporalSize=[0,0],subsamplingFraction=1,numPixels=0,outputPathName=None,feature_range=[0,np.nan],max_workers=1,rate_limit=None,aggregate=False,resume=False,scene_catalog=None,partitionDomains=None):
+    print('STARTING LEAF IMAGE for ',imageCollectionName)
+    toolsEE.setRateLimit(rate_limit)
+    if outputPathName==None:
+        outputPathName=os.getcwd()
+
+    defaultDates = defaultDateRange(bufferTemporalSize)
   
     outputDictionary = {}
     collectionOptions = (dictionariesSL2P.make_collection_options(algorithm))
     networkOptions= dictionariesSL2P.make_net_options()
 
-    ofn='_'.join([os.path.split(os.path.abspath(siteList[0]))[-1],imageCollectionName.replace('/','_'),variableName,str(feature_range[0]),str(feature_range[1]),algorithm.__name__,datetime.now().strftime("%Y_%m_%d_%Hh_%mmn")+'.pkl'])
+    runName='_'.join([os.path.split(os.path.abspath(siteList[0]))[-1],imageCollectionName.replace('/','_'),variableName,str(feature_range[0]),str(feature_range[1]),algorithm.__name__])
+    ofn='_'.join([runName,datetime.now().strftime("%Y_%m_%d_%Hh_%mmn")+'.pkl'])
     outputFileName=os.path.join(outputPathName,ofn)
     print('Output file: %s'%(outputFileName))
-
-    for input in siteList:   
-        #Convert the feature collection to a list so we can apply SL2P on features in sequence to avoid time outs on GEE
-        sampleRecords =  ee.FeatureCollection(input).sort('system:time_start', False).map(lambda feature: feature.set('timeStart',feature.get('system:time_start')))
-        sampleRecords =  sampleRecords.toList(sampleRecords.size())
-        print('Site: ',input, ' with ',sampleRecords.size().getInfo(), ' features.')
-        feature_range[1]=np.int32(np.nanmin([feature_range[1],sampleRecords.size().getInfo()]))
+    checkpoint = toolsCheckpoint.Checkpoint(os.path.join(outputPathName,runName+'_checkpoint.sqlite'))
+    print('Checkpoint file: %s'%(checkpoint.fileName))
+    catalog = toolsCatalog.SceneCatalog(scene_catalog) if scene_catalog else None
+    ingredientCache.clear()
+
+    try:
+        for input in siteList:   
+            #Convert the feature collection to a list so we can apply SL2P on features in sequence to avoid time outs on GEE
+            sampleRecords =  ee.FeatureCollection(input).sort('system:time_start', False).map(lambda feature: feature.set('timeStart',feature.get('system:time_start')))
+            sampleRecords =  sampleRecords.toList(sampleRecords.size())
+            # one request for the size and the properties of all features in the range, the dates are then computed locally
+            numRecords, featureTable = prefetchFeatures(sampleRecords,feature_range[0],feature_range[1])
+            print('Site: ',input, ' with ',numRecords, ' features.')
+            feature_range[1]=np.int32(np.nanmin([feature_range[1],numRecords]))
         
-        result = []
-        
-        #save data search parameters
-        params=['input','imageCollectionName','algorithm','variableName','maxCloudcover','outputScaleSize','inputScaleSize','bufferSpatialSize','bufferTemporalSize','subsamplingFraction','feature_range']
-        for pp in params:
-            if pp == params[0]:
-                txt=''
-            txt=txt+pp+': %s\n'%(eval(pp))
-        with open(outputFileName.replace('.pkl','_metadata.txt'), "a") as fp:   
-            fp.write(txt)
-            fp.close()
-        #######
+            #save data search parameters
+            params=['input','imageCollectionName','algorithm','variableName','maxCloudcover','outputScaleSize','inputScaleSize','bufferSpatialSize','bufferTemporalSize','subsamplingFraction','feature_range']
+            for pp in params:
+                if pp == params[0]:
+                    txt=''
+                txt=txt+pp+': %s\n'%(eval(pp))
+            with open(outputFileName.replace('.pkl','_metadata.txt'), "a") as fp:   
+                fp.write(txt)
+                fp.close()
+            #######
         
-        print('Data sampling for features: from %s to %s'%(feature_range[0],feature_range[1]))
-        for n in range(feature_range[0],feature_range[1]) : #sampleRecords.size().getInfo()
-            # select feature to process
-            site = ee.Feature(sampleRecords.get(n))
-            # get start and end date for this feature if it 
-            if ( defaultDate==False ):
-                time_start = site.get('system:time_start').getInfo()
-                if isinstance(time_start, int):
-                    startDate = datetime.fromtimestamp(site.get('system:time_start').getInfo()/1000) + timedelta(days=bufferTemporalSize[0])
-                else:
-                    startDate = datetime.fromtimestamp(ee.Date.parse("dd/MM/YY",site.get('system:time_start'),'Etc/GMT+6').getInfo()['value']/1000) + timedelta(days=bufferTemporalSize[0])
-
-                if ("system:time_end" in site.propertyNames().getInfo()):
-                    time_end = site.get('system:time_end').getInfo()
-                    if isinstance(time_end, int):
-                        endDate = datetime.fromtimestamp(site.get('system:time_end').getInfo()/1000) + timedelta(days=bufferTemporalSize[1])
-                    else:
-                        endDate = datetime.fromtimestamp(ee.Date.parse("dd/MM/YY",site.get('system:time_end'),'Etc/GMT+6').getInfo()['value']/1000) + timedelta(days=bufferTemporalSize[1])
-                else:
-                    endDate = startDate - timedelta(days=bufferTemporalSize[0]) + timedelta(days=bufferTemporalSize[1])
-                endDatePlusOne = endDate + timedelta(days=1)
-
-            print('Feature n°: %s/%s  -- startDate: %s -- endDate: %s'%(n,feature_range[1],startDate,endDate))
-            print('----------------------------------------------------------------------------------------------------------')
-            
-            #do monthly processing 
-            print(startDate,endDate)
-            if (len(pd.date_range(startDate,endDate,freq='m')) > 0 ):
-                dateRange = pd.DataFrame(pd.date_range(startDate,endDate,freq='m'),columns=['startDate'])
-                dateRange['endDate'] = pd.concat([dateRange['startDate'].tail(-1),pd.DataFrame([endDatePlusOne])],ignore_index=True).values
+            print('Data sampling for features: from %s to %s'%(feature_range[0],feature_range[1]))
+            if resume:
+                completed = checkpoint.completed(input)
+                print('Resuming with %s features already sampled'%(len(completed)))
             else:
-                dateRange = pd.DataFrame( {'startDate':[startDate],'endDate':[endDatePlusOne]})
-                
-            # process one month at a time to prevent GEE memory limits
-            samplesDF = pd.DataFrame()
-            for index, Dates in dateRange.iterrows():
-                sampleFeature= getSamples(site,variableName,collectionOptions[imageCollectionName],networkOptions[variableName][imageCollectionName],maxCloudcover,bufferSpatialSize,inputScaleSize, \
-                                Dates['startDate'],Dates['endDate'],outputScaleSize,subsamplingFraction)
-                if sampleFeature :
-                    samplesDF = pd.concat([samplesDF,samplestoDF(sampleFeature)],ignore_index=True)
+                completed = set()
+                checkpoint.clear(input)
+            features = [n for n in range(feature_range[0],feature_range[1]) if n not in completed]
+            if catalog is not None and features:
+                harvestScenes(catalog,featureTable.loc[features],imageCollectionName,collectionOptions,bufferSpatialSize,bufferTemporalSize,defaultDates)
+            for n, siteResult in iterSiteFeatures(sampleRecords,featureTable,features,feature_range[1],imageCollectionName,algorithm,variableName,collectionOptions,networkOptions,maxCloudcover, \
+                                                  outputScaleSize,inputScaleSize,bufferSpatialSize,bufferTemporalSize,subsamplingFraction,defaultDates,aggregate,max_workers,catalog,partitionDomains):
+                with toolsProfile.stage('checkpoint') as call:
+                    checkpoint.append(input,n,siteResult)
+                    call.payload(siteResult[algorithm.__name__])
+            outputDictionary.update({input: checkpoint.load(input,feature_range[0],feature_range[1])})
+
+            print('\nDONE LEAF SITE\n')
+            print('Request retries: %s -- window splits: %s'%(toolsEE.retryPolicy.report(),toolsWindows.planner.splits))
+            if ( outputFileName ):
+                with open(outputFileName, "wb") as fp, toolsProfile.stage('pickle'):   #Pickling
+                    pickle.dump(outputDictionary, fp)
+    finally:
+        ingredientCache.clear()
+        checkpoint.close()
+        if catalog is not None:
+            catalog.close()
+    return outputDictionary
 
-                
-            result.append({'feature': ee.Dictionary(ee.Feature(sampleRecords.get(n)).toDictionary()).getInfo() , \
-                        algorithm.__name__ : samplesDF })
-        
-            #dump every 100
+
+#sample features for LEAF output in batches, returns the same dictionary as sampleSites
+# one product collection is made over all features of a site list for each date window and every image is sampled over all features in one pass
+# samples are tagged with the feature index, split per feature and restricted to the dates of each feature
+# scene_catalog skips the date windows without candidate scenes over any of the features, as in sampleSites
+def sampleSitesBatch(siteList,imageCollectionName,algorithm,variableName='LAI',maxCloudcover=100,outputScaleSize=30,inputScaleSize=30,bufferSpatialSize=0,bufferTemporalSize=[0,0],subsamplingFraction=1,numPixels=0,outputPathName=None,feature_range=[0,np.nan],aggregate=False,scene_catalog=None,partitionDomains=None):
+    print('STARTING LEAF IMAGE for ',imageCollectionName)
+    if outputPathName==None:
+        outputPathName=os.getcwd()
+
+    defaultDates = defaultDateRange(bufferTemporalSize)
+    outputDictionary = {}
+    collectionOptions = (dictionariesSL2P.make_collection_options(algorithm))
+    networkOptions= dictionariesSL2P.make_net_options()
+    siteProperty = 'LEAF_siteIndex'
+    dateProperties = ('LEAF_startTime','LEAF_endTime')
+    catalog = toolsCatalog.SceneCatalog(scene_catalog) if scene_catalog else None
+    ingredientCache.clear()
+
+    ofn='_'.join([os.path.split(os.path.abspath(siteList[0]))[-1],imageCollectionName.replace('/','_'),variableName,str(feature_range[0]),str(feature_range[1]),algorithm.__name__,'batch',datetime.now().strftime("%Y_%m_%d_%Hh_%mmn")+'.pkl'])
+    outputFileName=os.path.join(outputPathName,ofn)
+    print('Output file: %s'%(outputFileName))
+
+    try:
+        for input in siteList:
+            sampleRecords =  ee.FeatureCollection(input).sort('system:time_start', False).map(lambda feature: feature.set('timeStart',feature.get('system:time_start')))
+            sampleRecords =  sampleRecords.toList(sampleRecords.size())
+            numRecords, featureTable = prefetchFeatures(sampleRecords,feature_range[0],feature_range[1])
+            print('Site: ',input, ' with ',numRecords, ' features.')
+            if featureTable.empty:
+                outputDictionary.update({input: []})
+                continue
+
+            # tag the features with their index in the site list and the start and end (excluded) of their dates in milliseconds
+            dates = {n: featureDates(featureTable.loc[n],bufferTemporalSize,defaultDates) for n in featureTable.index}
+            siteDates = ee.List([[int(n),int(dates[n][0].timestamp()*1000),int(dates[n][2].timestamp()*1000)] for n in featureTable.index])
+            sites = ee.FeatureCollection(siteDates.map(lambda row: ee.Feature(sampleRecords.get(ee.List(row).get(0))).set(siteProperty,ee.List(row).get(0), \
+                                                                                                                          dateProperties[0],ee.List(row).get(1), \
+                                                                                                                          dateProperties[1],ee.List(row).get(2))))
+            if ( bufferSpatialSize > 0 ):
+                sites = sites.map(lambda feature: feature.buffer(bufferSpatialSize))
+            startDate = min(date[0] for date in dates.values())
+            endDate = max(date[1] for date in dates.values())
+            endDatePlusOne = max(date[2] for date in dates.values())
+            print('Data sampling for features: from %s to %s -- startDate: %s -- endDate: %s'%(featureTable.index[0],featureTable.index[-1]+1,startDate,endDate))
+
+            def sampleWindow(windowStart,windowEnd):
+                productCollection = makeProductCollection(collectionOptions[imageCollectionName],networkOptions[variableName][imageCollectionName],variableName,sites.geometry(), \
+                                                          windowStart,windowEnd,maxCloudcover,inputScaleSize,partitionDomains=partitionDomains)
+                if productCollection :
+                    return samplestoDF(sampleProductTableSites(productCollection,sites,outputScaleSize,siteProperty,aggregate,dateProperties,subsamplingFraction,numPixels)[0])
+                return pd.DataFrame()
+
+            # process the period in adaptive windows, a window is only split when GEE runs out of memory or time
+            windowKey = (imageCollectionName,'batch',toolsWindows.areaBucket(featureTable['area'].sum()))
+            sceneDates = None
+            if catalog is not None:
+                bounds = harvestScenes(catalog,featureTable,imageCollectionName,collectionOptions,bufferSpatialSize,bufferTemporalSize,defaultDates)[0]
+                sceneDates = catalog.sceneDates(imageCollectionName,bounds,startDate,endDatePlusOne,maxCloudcover)
+            samplesDF = pd.concat(toolsWindows.planner.run(startDate,endDatePlusOne,sampleWindow,windowKey,sceneDates) or [pd.DataFrame()],ignore_index=True)
+
+            # split the samples per feature, the server only sampled each feature within its own dates
+            siteSamples = dict(tuple(samplesDF.groupby(siteProperty))) if siteProperty in samplesDF else {}
+            result = []
+            for n in featureTable.index:
+                siteDF = siteSamples.get(n,pd.DataFrame())
+                if not siteDF.empty:
+                    siteDF = siteDF.drop(columns=siteProperty).reset_index(drop=True)
+                result.append({'feature': featureTable.loc[n,'feature'] , \
+                               algorithm.__name__ : siteDF })
             outputDictionary.update({input: result})
-            if (( n % 100 ) == 0 ):
-                with open(outputFileName.replace('.pkl','_raw.pkl'), "wb") as fpr:   #Pickling
-                    pickle.dump(outputDictionary, fpr)
 
         print('\nDONE LEAF SITE\n')
-        if ( outputFileName ):
-            with open(outputFileName, "wb") as fp:   #Pickling
-                pickle.dump(outputDictionary, fp)
+        with open(outputFileName, "wb") as fp:   #Pickling
+            pickle.dump(outputDictionary, fp)
+    finally:
+        ingredientCache.clear()
+        if catalog is not None:
+            catalog.close()
     return outputDictionary
 
 
@@ -354,36 +700,35 @@ def imageSites(siteList,imageCollectionName,algorithm,variableName='LAI',maxClou
         #Convert the feature collection to a list so we can apply SL2P on features in sequence to avoid time outs on GEE
         sampleRecords =  ee.FeatureCollection(input).sort('system:time_start', False).map(lambda feature: feature.set('timeStart',feature.get('system:time_start')))
         sampleRecords =  sampleRecords.toList(sampleRecords.size())
-        print('Site: ',input, ' with ',sampleRecords.size().getInfo(), ' features.')
+        numFeatures = toolsEE.getInfo(sampleRecords.size())
+        print('Site: ',input, ' with ',numFeatures, ' features.')
         result = []
-        for n in range(0,sampleRecords.size().getInfo()) : 
+        for n in range(0,numFeatures) : 
 
             # select feature to process
             site = ee.Feature(sampleRecords.get(n))
             
             # get start and end date for this feature
-            startDate = datetime.fromtimestamp(ee.Date(site.get('system:time_start')).advance(bufferTemporalSize[0],'day').getInfo()['value']/1000)
-            endDate = datetime.fromtimestamp(ee.Date(site.get('system:time_end')).advance(bufferTemporalSize[1],'day').getInfo()['value']/1000)
-            endDatePlusOne = datetime.fromtimestamp(ee.Date(site.get('system:time_end')).advance(bufferTemporalSize[1]+1,'day').getInfo()['value']/1000)
+            siteInfo = toolsEE.getInfo(ee.Dictionary({'startDate': ee.Date(site.get('system:time_start')).advance(bufferTemporalSize[0],'day').millis(), \
+                                                      'endDate': ee.Date(site.get('system:time_end')).advance(bufferTemporalSize[1],'day').millis(), \
+                                                      'area': site.geometry().area(1)}))
+            startDate = datetime.fromtimestamp(siteInfo['startDate']/1000)
+            endDate = datetime.fromtimestamp(siteInfo['endDate']/1000)
+            endDatePlusOne = endDate + timedelta(days=1)
  
             print('Processing feature:',n,' from ', startDate,' to ',endDate)
-             #do monthly processing 
-            if (len(pd.date_range(startDate,endDate,freq='ME')) > 0 ):
-                dateRange = pd.DataFrame(pd.date_range(startDate,endDate,freq='ME'),columns=['startDate'])
-                dateRange['endDate'] = pd.concat([dateRange['startDate'].tail(-1),pd.DataFrame([endDatePlusOne])],ignore_index=True).values
-            else:
-                dateRange = pd.DataFrame( {'startDate':[startDate],'endDate':[endDatePlusOne]})
+            def windowCollection(windowStart,windowEnd):
+                return getCollection(site,variableName,collectionOptions[imageCollectionName],networkOptions[variableName][imageCollectionName],maxCloudcover,bufferSpatialSize,inputScaleSize, \
+                            windowStart,windowEnd,outputScaleSize,subsamplingFraction)
 
-            # process one month at a time to prevent GEE memory limits
+            # process the period in adaptive windows, a window is only split when GEE runs out of memory or time
             siteCollection = ee.ImageCollection([])
-            for index, Dates in dateRange.iterrows():
-
-                monthlyCollection = getCollection(site,variableName,collectionOptions[imageCollectionName],networkOptions[variableName][imageCollectionName],maxCloudcover,bufferSpatialSize,inputScaleSize, \
-                            Dates['startDate'],Dates['endDate'],outputScaleSize,subsamplingFraction)
+            windowKey = (imageCollectionName,toolsWindows.areaBucket(siteInfo['area']))
+            for monthlyCollection in toolsWindows.planner.run(startDate,endDatePlusOne,windowCollection,windowKey):
                 if monthlyCollection :
                     siteCollection = siteCollection.merge(monthlyCollection)
                 
-            result.append({'feature': ee.Dictionary(ee.Feature(sampleRecords.get(n)).toDictionary()).getInfo() , \
+            result.append({'feature': toolsEE.getInfo(ee.Dictionary(ee.Feature(sampleRecords.get(n)).toDictionary())) , \
                         algorithm.__name__ : siteCollection })
         
         outputDictionary.update({input: result})
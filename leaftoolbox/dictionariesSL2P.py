@@ -1,6 +1,7 @@
 # Dictionaries for SL2P
 # Richard Fernandes
 
+import threading
 import ee
 from . import toolsS2
 from . import toolsL8
@@ -8,12 +9,67 @@ from . import toolsL9
 from . import toolsHLS
 
 
+# entry of a LazyRegistry built by calling build() on first access
+class LazyEntry:
+    def __init__(self, build):
+        self.build = build
+
+# dictionary whose LazyEntry values are built on first access and then kept, so only the sensors used are constructed
+# values() and items() build every entry, dict(registry) copies the unbuilt entries
+class LazyRegistry(dict):
+    lock = threading.RLock()
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if isinstance(value, LazyEntry):
+            with self.lock:
+                value = dict.__getitem__(self, key)
+                if isinstance(value, LazyEntry):
+                    value = value.build()
+                    dict.__setitem__(self, key, value)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    # keys of the entries built so far
+    def built(self):
+        return [key for key in self if not isinstance(dict.__getitem__(self, key), LazyEntry)]
+
+    # registry handing out shallow copies of the entries of this one, each entry is still built once here
+    # so callers can edit their copy and its entries without changing the options seen by other callers
+    def copy(self):
+        return LazyRegistry({key: LazyEntry(lambda key=key: copyEntry(self[key])) for key in self})
+
+# shallow copy of a registry entry, nested registries are copied the same way
+def copyEntry(value):
+    if isinstance(value, LazyRegistry):
+        return value.copy()
+    if isinstance(value, dict):
+        return dict(value)
+    return value
+
+# registries already made, collection options are kept per algorithm module
+# the make_* functions return copies of these so they are never edited by callers
+collectionOptionsCache = {}
+netOptionsCache = {}
+
 def make_collection_options(fc): 
+    if fc.__name__ in collectionOptionsCache:
+        return collectionOptionsCache[fc.__name__].copy()
 
-    COLLECTION_OPTIONS = {
+    COLLECTION_OPTIONS = LazyRegistry({
         # Sentinel 2 using 20 m bands:
-        'COPERNICUS/S2_SR_HARMONIZED': {
+        'COPERNICUS/S2_SR_HARMONIZED': LazyEntry(lambda: {
         "name": 'COPERNICUS/S2_SR_HARMONIZED',
+        "key": 'COPERNICUS/S2_SR_HARMONIZED',
+        "algorithm": fc.__name__,
         "description": 'Sentinel 2A',
         "Cloudcover": 'CLOUDY_PIXEL_PERCENTAGE',
         "Watercover": 'WATER_PERCENTAGE',
@@ -31,10 +87,12 @@ def make_collection_options(fc):
         "numVariables": 7,
         "exportRes": 20,
         "tools": toolsS2
-        },
+        }),
         # Sentinel 2 using 10 m bands:
-        'COPERNICUS/S2_SR_HARMONIZED_10m': {
+        'COPERNICUS/S2_SR_HARMONIZED_10m': LazyEntry(lambda: {
         "name": 'COPERNICUS/S2_SR_HARMONIZED',
+        "key": 'COPERNICUS/S2_SR_HARMONIZED_10m',
+        "algorithm": fc.__name__,
         "description": 'Sentinel 2A',
         "Cloudcover": 'CLOUDY_PIXEL_PERCENTAGE',
         "Watercover": 'WATER_PERCENTAGE',
@@ -52,9 +110,11 @@ def make_collection_options(fc):
         "numVariables": 7,
         "exportRes": 10,
         "tools": toolsHLS
-        },
-        'LANDSAT/LC08/C02/T1_L2': {
+        }),
+        'LANDSAT/LC08/C02/T1_L2': LazyEntry(lambda: {
         "name": 'LANDSAT/LC08/C02/T1_L2',
+        "key": 'LANDSAT/LC08/C02/T1_L2',
+        "algorithm": fc.__name__,
         "description": 'LANDSAT 8',
         "Cloudcover": 'CLOUD_COVER_LAND',
         "Watercover": 'CLOUD_COVER',
@@ -72,9 +132,11 @@ def make_collection_options(fc):
         "numVariables": 7,
         "exportRes": 30,
         "tools": toolsL8
-        },
-        'LANDSAT/LC09/C02/T1_L2': {
+        }),
+        'LANDSAT/LC09/C02/T1_L2': LazyEntry(lambda: {
         "name": 'LANDSAT/LC09/C02/T1_L2',
+        "key": 'LANDSAT/LC09/C02/T1_L2',
+        "algorithm": fc.__name__,
         "description": 'LANDSAT 8',
         "Cloudcover": 'CLOUD_COVER_LAND',
         "Watercover": 'CLOUD_COVER',
@@ -92,9 +154,11 @@ def make_collection_options(fc):
         "numVariables": 7,
         "exportRes": 30,
         "tools": toolsL9
-        },
-        'NASA/HLS/HLSL30/v002': {
+        }),
+        'NASA/HLS/HLSL30/v002': LazyEntry(lambda: {
         "name": 'NASA/HLS/HLSL30/v002',
+        "key": 'NASA/HLS/HLSL30/v002',
+        "algorithm": fc.__name__,
         "description": 'Harmonized Landsat',
         "Cloudcover": 'CLOUD_COVERAGE',
         "Watercover": 'CLOUD_COVERAGE',
@@ -112,59 +176,62 @@ def make_collection_options(fc):
         "numVariables": 7,
         "exportRes": 30,
         "tools": toolsHLS
-        }
-    }
+        })
+    })
 
-    return(COLLECTION_OPTIONS)
+    collectionOptionsCache[fc.__name__] = COLLECTION_OPTIONS
+    return(COLLECTION_OPTIONS.copy())
 
 def make_net_options():
+    if 'NET_OPTIONS' in netOptionsCache:
+        return netOptionsCache['NET_OPTIONS'].copy()
 
-    NET_OPTIONS = {
-        'Surface_Reflectance': {
-            "COPERNICUS/S2_SR_HARMONIZED": {
+    NET_OPTIONS = LazyRegistry({
+        'Surface_Reflectance': LazyRegistry({
+            "COPERNICUS/S2_SR_HARMONIZED": LazyEntry(lambda: {
                 "Name": 'Surface_Reflectance',
                 "description": 'Surface_Reflectance',
                 "inputBands":      ['cosVZA', 'cosSZA', 'cosRAA', 'B1', 'B2', 'B3', 'B4', 'B5', 'B6', 'B7', 'B8','B8A', 'B9','B11', 'B12'],
                 "inputScaling":    [0.0001, 0.0001, 0.0001, 0.0001,0.0001, 0.0001, 0.0001, 0.0001, 0.0001, 0.0001,0.0001, 0.0001, 0.0001,0.0001, 0.0001],
                 "inputOffset":     [0,0,0,00,0,0,0,0,0,0,0,0,0,0,0],
-            },
-            "COPERNICUS/S2_SR_HARMONIZED_10m": {
+            }),
+            "COPERNICUS/S2_SR_HARMONIZED_10m": LazyEntry(lambda: {
                 "Name": 'Surface_Reflectance',
                 "description": 'Surface_Reflectance',
                 "inputBands": ['cosVZA', 'cosSZA', 'cosRAA', 'B1','B2', 'B3', 'B4', 'B8'],
                 "inputScaling":    [0.0001, 0.0001, 0.0001, 0.0001,0.0001, 0.0001, 0.0001, 0.0001],
                 "inputOffset":     [0,0,0,0,0,0,0,0],
-            },
-            'LANDSAT/LC08/C02/T1_L2': {
+            }),
+            'LANDSAT/LC08/C02/T1_L2': LazyEntry(lambda: {
                 "Name": 'Surface_Reflectance',
                 "description": 'Surface_Reflectance',
                 "inputBands":      ['cosVZA','cosSZA','cosRAA','SR_B1','SR_B2','SR_B3', 'SR_B4', 'SR_B5', 'SR_B6', 'SR_B7'],
                 "inputScaling":     [0.0001,0.0001,0.0001,2.75e-05,2.75e-05,2.75e-05,2.75e-05,2.75e-05,2.75e-05,2.75e-05],
                 "inputOffset":     [0,0,0,-0.2,-0.2,-0.2,-0.2,-0.2,-0.2,-0.2],
-                },
-            'LANDSAT/LC09/C02/T1_L2': {
+                }),
+            'LANDSAT/LC09/C02/T1_L2': LazyEntry(lambda: {
                 "Name": 'Surface_Reflectance',
                 "description": 'Surface_Reflectance',
                 "inputBands":      [ 'SR_B1','SR_B2','SR_B3', 'SR_B4', 'SR_B5', 'SR_B6', 'SR_B7'],
                 "inputBands":      ['cosVZA','cosSZA','cosRAA','SR_B1','SR_B2','SR_B3', 'SR_B4', 'SR_B5', 'SR_B6', 'SR_B7'],
                 "inputScaling":     [0.0001,0.0001,0.0001,2.75e-05,2.75e-05,2.75e-05,2.75e-05,2.75e-05,2.75e-05,2.75e-05],
                 "inputOffset":     [0,0,0,-0.2,-0.2,-0.2,-0.2,-0.2,-0.2,-0.2],
-                },
-            'NASA/HLS/HLSL30/v002': {
+                }),
+            'NASA/HLS/HLSL30/v002': LazyEntry(lambda: {
                 "Name": 'Surface_Reflectance',
                 "description": 'Surface_Reflectance',
                 "inputBands":      ['cosVZA','cosSZA','cosRAA','B1','B2','B3', 'B4', 'B5', 'B6', 'B7'],
                 "inputScaling":     [0.0001,.0001,.0001,1,1,1,1,1,1,1],
                 "inputOffset":     [0,0,0,0,0,0,0,0,0,0],
-                },
-            'users/rfernand387/L2avalidation': {
+                }),
+            'users/rfernand387/L2avalidation': LazyEntry(lambda: {
                 "Name": 'Surface_Reflectance',
                 "description": 'Surface_Reflectance',
                 "inputBands":      [ 'B1','B2','B3','B4', 'B5', 'B6', 'B7', 'B8','B8A','B9','B10','B11','B12'],
-                }
-        },
-        'Albedo': {
-            "COPERNICUS/S2_SR_HARMONIZED": {
+                })
+        }),
+        'Albedo': LazyRegistry({
+            "COPERNICUS/S2_SR_HARMONIZED": LazyEntry(lambda: {
                 "Name": 'Albedo',
                 "errorName": 'errorAlbedo',
                 "maskName": 'maskAlbedo',
@@ -175,8 +242,8 @@ def make_net_options():
                 "inputOffset":     [0,0,0,0,0,0,0,0,0,0,0],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[1]])))
-            },
-            "COPERNICUS/S2_SR_HARMONIZED_10m": {
+            }),
+            "COPERNICUS/S2_SR_HARMONIZED_10m": LazyEntry(lambda: {
                 "Name": 'Albedo',
                 "errorName": 'errorAlbedo',
                 "maskName": 'maskAlbedo',
@@ -187,8 +254,8 @@ def make_net_options():
                 "inputOffset":     [0,0,0,0,0,0,0,0],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[1]])))
-            },
-            'LANDSAT/LC08/C02/T1_L2': {
+            }),
+            'LANDSAT/LC08/C02/T1_L2': LazyEntry(lambda: {
                 "Name": 'Albedo',
                 "errorName": 'errorAlbedo',
                 "maskName": 'maskAlbedo',
@@ -199,8 +266,8 @@ def make_net_options():
                 "inputOffset":     [0,0,0,-0.2,-0.2,-0.2,-0.2,-0.2],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[1]])))
-            },
-            'LANDSAT/LC09/C02/T1_L2': {
+            }),
+            'LANDSAT/LC09/C02/T1_L2': LazyEntry(lambda: {
                 "Name": 'Albedo',
                 "errorName": 'errorAlbedo',
                 "maskName": 'maskAlbedo',
@@ -211,8 +278,8 @@ def make_net_options():
                 "inputOffset":     [0,0,0,-0.2,-0.2,-0.2,-0.2,-0.2],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[1]])))
-            },
-            'NASA/HLS/HLSL30/v002': {
+            }),
+            'NASA/HLS/HLSL30/v002': LazyEntry(lambda: {
                 "Name": 'Albedo',
                 "errorName": 'errorAlbedo',
                 "maskName": 'maskAlbedo',
@@ -223,10 +290,10 @@ def make_net_options():
                 "inputOffset":     [0,0,0,0,0,0,0,0],
                 "outmin": (ee.Image(0)),
                 "outmax": (ee.Image(1))
-            }
-        },
-        'fAPAR': {
-            "COPERNICUS/S2_SR_HARMONIZED": {
+            })
+        }),
+        'fAPAR': LazyRegistry({
+            "COPERNICUS/S2_SR_HARMONIZED": LazyEntry(lambda: {
                 "Name": 'fAPAR',
                 "errorName": 'errorfAPAR',
                 "maskName": 'maskfAPAR',
@@ -237,8 +304,8 @@ def make_net_options():
                 "inputOffset":     [0,0,0,0,0,0,0,0,0,0,0],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[1]])))
-            },
-            "COPERNICUS/S2_SR_HARMONIZED_10m": {
+            }),
+            "COPERNICUS/S2_SR_HARMONIZED_10m": LazyEntry(lambda: {
                 "Name": 'fAPAR',
                 "errorName": 'errorfAPAR',
                 "maskName": 'maskfAPAR',
@@ -249,8 +316,8 @@ def make_net_options():
                 "inputOffset":     [0,0,0,0,0,0,0,0],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[1]])))
-            },
-            'LANDSAT/LC08/C02/T1_L2': {
+            }),
+            'LANDSAT/LC08/C02/T1_L2': LazyEntry(lambda: {
                 "Name": 'fAPAR',
                 "errorName": 'errorfAPAR',
                 "maskName": 'maskfAPAR',
@@ -261,8 +328,8 @@ def make_net_options():
                 "inputOffset":     [0,0,0,-0.2,-0.2,-0.2,-0.2,-0.2],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[1]]))) 
-            },
-            'LANDSAT/LC09/C02/T1_L2': {
+            }),
+            'LANDSAT/LC09/C02/T1_L2': LazyEntry(lambda: {
                 "Name": 'fAPAR',
                 "errorName": 'errorfAPAR',
                 "maskName": 'maskfAPAR',
@@ -273,8 +340,8 @@ def make_net_options():
                 "inputOffset":     [0,0,0,-0.2,-0.2,-0.2,-0.2,-0.2],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[1]]))) 
-            },
-            'NASA/HLS/HLSL30/v002': {
+            }),
+            'NASA/HLS/HLSL30/v002': LazyEntry(lambda: {
                 "Name": 'fAPAR',
                 "errorName": 'errorfAPAR',
                 "maskName": 'maskfAPAR',
@@ -285,10 +352,10 @@ def make_net_options():
                 "inputOffset":     [0,0,0,0,0,0,0,0],
                 "outmin": (ee.Image(0)),
                 "outmax": (ee.Image(1))
-                }
-        },
-        'fCOVER': {
-            "COPERNICUS/S2_SR_HARMONIZED": {
+                })
+        }),
+        'fCOVER': LazyRegistry({
+            "COPERNICUS/S2_SR_HARMONIZED": LazyEntry(lambda: {
                 "Name": 'fCOVER',
                 "errorName": 'errorfCOVER',
                 "maskName": 'maskfCOVER',
@@ -299,8 +366,8 @@ def make_net_options():
                 "inputOffset":     [0,0,0,0,0,0,0,0,0,0,0],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[1]]))) 
-            },
-            "COPERNICUS/S2_SR_HARMONIZED_10m": {
+            }),
+            "COPERNICUS/S2_SR_HARMONIZED_10m": LazyEntry(lambda: {
                 "Name": 'fCOVER',
                 "errorName": 'errorfCOVER',
                 "maskName": 'maskfCOVER',
@@ -311,8 +378,8 @@ def make_net_options():
                 "inputOffset":     [0,0,0,0,0,0,0,0],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[1]])))
-            },
-            'LANDSAT/LC08/C02/T1_L2': {
+            }),
+            'LANDSAT/LC08/C02/T1_L2': LazyEntry(lambda: {
                 "Name": 'fCOVER',
                 "errorName": 'errorfCOVER',
                 "maskName": 'maskfCOVER',
@@ -323,8 +390,8 @@ def make_net_options():
                 "inputOffset":     [0,0,0,-0.2,-0.2,-0.2,-0.2,-0.2],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[1]]))) 
-            },
-            'LANDSAT/LC09/C02/T1_L2': {
+            }),
+            'LANDSAT/LC09/C02/T1_L2': LazyEntry(lambda: {
                 "Name": 'fCOVER',
                 "errorName": 'errorfCOVER',
                 "maskName": 'maskfCOVER',
@@ -335,8 +402,8 @@ def make_net_options():
                 "inputOffset":     [0,0,0,-0.2,-0.2,-0.2,-0.2,-0.2],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[1]]))) 
-            },
-            'NASA/HLS/HLSL30/v002': {
+            }),
+            'NASA/HLS/HLSL30/v002': LazyEntry(lambda: {
                 "Name": 'fCOVER',
                 "errorName": 'errorfCOVER',
                 "maskName": 'maskfCOVER',
@@ -347,10 +414,10 @@ def make_net_options():
                 "inputOffset":     [0,0,0,0,0,0,0,0],
                 "outmin": (ee.Image(0)),
                 "outmax": (ee.Image(1))
-                }
-        },
-        'LAI': {
-            "COPERNICUS/S2_SR_HARMONIZED": {
+                })
+        }),
+        'LAI': LazyRegistry({
+            "COPERNICUS/S2_SR_HARMONIZED": LazyEntry(lambda: {
                 "Name": 'LAI',
                 "errorName": 'errorLAI',
                 "maskName": 'maskLAI',
@@ -361,8 +428,8 @@ def make_net_options():
                 "inputOffset":     [0,0,0,0,0,0,0,0,0,0,0],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[10]]))) 
-            },
-            "COPERNICUS/S2_SR_HARMONIZED_10m": {
+            }),
+            "COPERNICUS/S2_SR_HARMONIZED_10m": LazyEntry(lambda: {
                 "Name": 'LAI',
                 "errorName": 'errorLAI',
                 "maskName": 'maskLAI',
@@ -373,8 +440,8 @@ def make_net_options():
                 "inputOffset":     [0,0,0,0,0,0,0,0],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[10]])))
-            },
-            'LANDSAT/LC08/C02/T1_L2': {
+            }),
+            'LANDSAT/LC08/C02/T1_L2': LazyEntry(lambda: {
                 "Name": 'LAI',
                 "errorName": 'errorLAI',
                 "maskName": 'maskLAI',
@@ -385,8 +452,8 @@ def make_net_options():
                 "inputOffset":     [0,0,0,-0.2,-0.2,-0.2,-0.2,-0.2],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[10]]))) 
-            },
-            'LANDSAT/LC09/C02/T1_L2': {
+            }),
+            'LANDSAT/LC09/C02/T1_L2': LazyEntry(lambda: {
                  "Name": 'LAI',
                 "errorName": 'errorLAI',
                 "maskName": 'maskLAI',
@@ -397,8 +464,8 @@ def make_net_options():
                 "inputOffset":     [0,0,0,-0.2,-0.2,-0.2,-0.2,-0.2],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[10]]))) 
-            },
-            'NASA/HLS/HLSL30/v002': {
+            }),
+            'NASA/HLS/HLSL30/v002': LazyEntry(lambda: {
                 "Name": 'LAI',
                 "errorName": 'errorLAI',
                 "maskName": 'maskLAI',
@@ -409,10 +476,10 @@ def make_net_options():
                 "inputOffset":     [0,0,0,0,0,0,0,0],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[10]]))) 
-                }
-        },
-        'CCC': {
-            "COPERNICUS/S2_SR_HARMONIZED": {
+                })
+        }),
+        'CCC': LazyRegistry({
+            "COPERNICUS/S2_SR_HARMONIZED": LazyEntry(lambda: {
                 "Name": 'CCC',
                 "errorName": 'errorCCC',
                 "maskName": 'maskCCC',
@@ -423,8 +490,8 @@ def make_net_options():
                 "inputOffset":     [0,0,0,0,0,0,0,0,0,0,0],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[100]]))) 
-            },
-            "COPERNICUS/S2_SR_HARMONIZED_10m": {
+            }),
+            "COPERNICUS/S2_SR_HARMONIZED_10m": LazyEntry(lambda: {
                 "Name": 'CCC',
                 "errorName": 'errorCCC',
                 "maskName": 'maskCCC',
@@ -435,8 +502,8 @@ def make_net_options():
                 "inputOffset":     [0,0,0,0,0,0,0,0],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[100]]))) 
-            },
-            'LANDSAT/LC08/C02/T1_L2': {
+            }),
+            'LANDSAT/LC08/C02/T1_L2': LazyEntry(lambda: {
                 "Name": 'CCC',
                 "errorName": 'errorCCC',
                 "maskName": 'maskCCC',
@@ -447,8 +514,8 @@ def make_net_options():
                 "inputOffset":     [0,0,0,-0.2,-0.2,-0.2,-0.2,-0.2],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[100]]))) 
-            },
-            'LANDSAT/LC09/C02/T1_L2': {
+            }),
+            'LANDSAT/LC09/C02/T1_L2': LazyEntry(lambda: {
                 "Name": 'CCC',
                 "errorName": 'errorCCC',
                 "maskName": 'maskCCC',
@@ -459,8 +526,8 @@ def make_net_options():
                 "inputOffset":     [0,0,0,-0.2,-0.2,-0.2,-0.2,-0.2],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[100]]))) 
-            },
-            'NASA/HLS/HLSL30/v002': {
+            }),
+            'NASA/HLS/HLSL30/v002': LazyEntry(lambda: {
                 "Name": 'CCC',
                 "errorName": 'errorCCC',
                 "maskName": 'maskCCC',
@@ -471,10 +538,10 @@ def make_net_options():
                 "inputOffset":     [0,0,0,0,0,0,0,0],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[100]]))) 
-                }
-        },
-        'CWC': {
-            "COPERNICUS/S2_SR_HARMONIZED": {
+                })
+        }),
+        'CWC': LazyRegistry({
+            "COPERNICUS/S2_SR_HARMONIZED": LazyEntry(lambda: {
                 "Name": 'CWC',
                 "errorName": 'errorCWC',
                 "maskName": 'maskCWC',
@@ -485,8 +552,8 @@ def make_net_options():
                 "inputOffset":     [0,0,0,0,0,0,0,0,0,0,0],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[100]])))
-            },
-            "COPERNICUS/S2_SR_HARMONIZED_10m": {
+            }),
+            "COPERNICUS/S2_SR_HARMONIZED_10m": LazyEntry(lambda: {
                 "Name": 'CWC',
                 "errorName": 'errorCWC',
                 "maskName": 'maskCWC',
@@ -497,8 +564,8 @@ def make_net_options():
                 "inputOffset":     [0,0,0,0,0,0,0,0],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[100]])))
-            },
-            'LANDSAT/LC08/C02/T1_L2': {
+            }),
+            'LANDSAT/LC08/C02/T1_L2': LazyEntry(lambda: {
                 "Name": 'CWC',
                 "errorName": 'errorCWC',
                 "maskName": 'maskCWC',
@@ -509,8 +576,8 @@ def make_net_options():
                 "inputOffset":     [0,0,0,-0.2,-0.2,-0.2,-0.2,-0.2],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[1]]))) 
-            },  
-            'LANDSAT/LC09/C02/T1_L2': {
+            }),  
+            'LANDSAT/LC09/C02/T1_L2': LazyEntry(lambda: {
                 "Name": 'CWC',
                 "errorName": 'errorCWC',
                 "maskName": 'maskCWC',
@@ -521,8 +588,8 @@ def make_net_options():
                 "inputOffset":     [0,0,0,-0.2,-0.2,-0.2,-0.2,-0.2],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[100]])))
-            }, 
-            'NASA/HLS/HLSL30/v002': {
+            }), 
+            'NASA/HLS/HLSL30/v002': LazyEntry(lambda: {
                 "Name": 'CWC',
                 "errorName": 'errorCWC',
                 "maskName": 'maskCWC',
@@ -533,10 +600,10 @@ def make_net_options():
                 "inputOffset":     [0,0,0,0,0,0,0,0],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[100]])))
-                }
-        },
-        'DASF': {
-            "COPERNICUS/S2_SR_HARMONIZED": {
+                })
+        }),
+        'DASF': LazyRegistry({
+            "COPERNICUS/S2_SR_HARMONIZED": LazyEntry(lambda: {
                 "Name": 'DASF',
                 "errorName": 'errorDASF',
                 "maskName": 'maskDASF',
@@ -547,8 +614,8 @@ def make_net_options():
                 "inputOffset":     [0,0,0,0,0,0,0,0,0,0,0],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[1]]))) 
-            },
-            "COPERNICUS/S2_SR_HARMONIZED_10m": {
+            }),
+            "COPERNICUS/S2_SR_HARMONIZED_10m": LazyEntry(lambda: {
                 "Name": 'DASF',
                 "errorName": 'errorDASF',
                 "maskName": 'maskDASF',
@@ -559,8 +626,8 @@ def make_net_options():
                 "inputOffset":     [0,0,0,0,0,0,0,0],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[1]])))
-            },
-            'LANDSAT/LC09/C02/T1_L2': {
+            }),
+            'LANDSAT/LC09/C02/T1_L2': LazyEntry(lambda: {
                 "Name": 'DASF',
                 "errorName": 'errorDASF',
                 "maskName": 'maskDASF',
@@ -571,8 +638,8 @@ def make_net_options():
                 "inputOffset":     [0,0,0,-0.2,-0.2,-0.2,-0.2,-0.2],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[1]]))) 
-            }, 
-            'NASA/HLS/HLSL30/v002': {
+            }), 
+            'NASA/HLS/HLSL30/v002': LazyEntry(lambda: {
                 "Name": 'DASF',
                 "errorName": 'errorDASF',
                 "maskName": 'maskDASF',
@@ -583,8 +650,8 @@ def make_net_options():
                 "inputOffset":     [0,0,0,0,0,0,0,0],
                 "outmin": (ee.Image(ee.Array([[0]]))),
                 "outmax": (ee.Image(ee.Array([[1]]))) 
-                }, 
-            'users/rfernand387/L2avalidation': {
+                }), 
+            'users/rfernand387/L2avalidation': LazyEntry(lambda: {
                 "Name": 'DASF',
                 "errorName": 'errorDASF',
                 "maskName": 'maskDASF',
@@ -595,12 +662,13 @@ def make_net_options():
                 "inputOffset":     [0,0,0,0,0,0,0,0],
                 "outmin": (ee.Image(0)),
                 "outmax": (ee.Image(1))
-            }
-        }
-    }
+            })
+        })
+    })
 
 
-    return(NET_OPTIONS)
+    netOptionsCache['NET_OPTIONS'] = NET_OPTIONS
+    return(NET_OPTIONS.copy())
 
 
 
@@ -1,8 +1,9 @@
 import ee
 from . import eoImage as eoImg
 
-#Water mask
-GL_water = ee.Image('JRC/GSW1_0/GlobalSurfaceWater').select('occurrence') 
+#Water mask, built on first use so importing the module does not need an initialized Earth Engine session
+def GL_water():
+    return ee.Image('JRC/GSW1_0/GlobalSurfaceWater').select('occurrence')
 
 
 ###################################################
@@ -61,7 +62,7 @@ def add_spec_score(centre_eeDate,image):
     # Deal with water pixels
     #===============================================================================================
     NDWI_map    = grn_img.subtract(sw1_img).divide(grn_img.add(sw1_img));
-    water_cond  = GL_water.neq(ee.Image(1)).And(NDWI_map.gt(ee.Image(0.6)).And(nir_img.lt(ee.Image(0.03))))
+    water_cond  = GL_water().neq(ee.Image(1)).And(NDWI_map.gt(ee.Image(0.6)).And(nir_img.lt(ee.Image(0.03))))
 
     water_score = blu_img.divide(nir_img.add(sw1_img).add(sw2_img))  # Blue/(NIR+SW1+SW2)
     score_map   = land_score.where(water_cond, water_score)  #handle water pixels
@@ -0,0 +1,118 @@
+import pickle
+import sqlite3
+import threading
+import time
+
+
+# ------------------------------------------------------
+# Caches of objects reused during a run and between runs:
+# ------------------------------------------------------
+# in-memory cache of objects built once per run, counts hits and misses so repeated builds show up
+class RunCache:
+
+    def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    # cached value of key, calling build() to make it on the first request
+    def get(self, key, build):
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            value = self.entries[key] = build()
+            return value
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries)}
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# persistent cache of server results shared between runs, stored in a SQLite file
+# entries older than ttl seconds are rebuilt, the least recently used entries are evicted above maxBytes
+class DiskCache:
+
+    def __init__(self, fileName, ttl=None, maxBytes=512 * 2**20):
+        self.fileName = fileName
+        self.ttl = ttl
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        # requests are made from the sampler worker threads, the lock serializes access to the connection
+        self.connection = sqlite3.connect(fileName, check_same_thread=False)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, created REAL, '
+                                'accessed REAL, size INTEGER)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+        self.connection.commit()
+        # bytes of the stored values, summed once when the file is opened and then kept up to date by put and evict
+        self.size = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    # cached value of key if it is younger than ttl, otherwise calls build() and stores its result
+    # build() runs outside the lock so concurrent misses on different keys do not wait on each other
+    def get(self, key, build):
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute('SELECT value, created FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is not None and (self.ttl is None or now - row[1] < self.ttl):
+                self.hits += 1
+                self.connection.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+                self.connection.commit()
+                return pickle.loads(row[0])
+            self.misses += 1
+        value = build()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+            self.connection.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)', (key, blob, now, now, len(blob)))
+            self.size += len(blob) - (row[0] if row is not None else 0)
+            self.evict()
+            self.connection.commit()
+
+    # remove the least recently used entries until the stored values fit in maxBytes, called with the lock held
+    # only the oldest rows are read through the index on accessed, a few at a time while the cache is over budget
+    def evict(self, batchRows=32):
+        while self.maxBytes is not None and self.size > self.maxBytes:
+            rows = self.connection.execute('SELECT key, size FROM entries ORDER BY accessed LIMIT ?', (batchRows,)).fetchall()
+            if not rows:
+                self.size = 0
+                break
+            for key, size in rows:
+                if self.size <= self.maxBytes:
+                    break
+                self.connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+                self.size -= size
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.connection.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'entries': entries, 'bytes': size}
+
+    def clear(self):
+        with self.lock:
+            self.connection.execute('DELETE FROM entries')
+            self.connection.commit()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,139 @@
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+import ee
+import numpy as np
+import pandas as pd
+
+from . import toolsEE
+from . import toolsWindows
+
+
+# ------------------------------------------------------
+# Local catalog of the scenes of image collections:
+# ------------------------------------------------------
+# properties holding the orbit path and tile row of the scenes of a collection, by collection name prefix
+TILE_PROPERTIES = {'LANDSAT/': ('WRS_PATH', 'WRS_ROW'),
+                   'COPERNICUS/S2': ('SENSING_ORBIT_NUMBER', 'MGRS_TILE'),
+                   'NASA/HLS/': ('SENSING_ORBIT_NUMBER', 'MGRS_TILE_ID')}
+
+SCENE_COLUMNS = ['sceneId', 'time', 'cloud', 'path', 'row', 'minX', 'minY', 'maxX', 'maxY']
+
+
+def tileProperties(collectionName):
+    return next((properties for prefix, properties in TILE_PROPERTIES.items() if collectionName.startswith(prefix)), (None, None))
+
+
+# (minX, minY, maxX, maxY) in degrees of the ring of a bounds() polygon, grown by bufferSize metres
+def ringBounds(ring, bufferSize=0):
+    x = [point[0] for point in ring]
+    y = [point[1] for point in ring]
+    dy = bufferSize / 111320.0
+    dx = dy / max(np.cos(np.radians(max(abs(min(y)), abs(max(y))))), 0.01)
+    return (min(x) - dx, min(y) - dy, max(x) + dx, max(y) + dy)
+
+
+def millis(date):
+    return int(date.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+# one feature with the id, date, cloud cover, path/row and footprint bounds of a scene
+def sceneFeature(image, cloudProperty, pathProperty, rowProperty):
+    ring = ee.List(image.geometry().bounds(1).coordinates().get(0))
+    lower = ee.List(ring.get(0))
+    upper = ee.List(ring.get(2))
+    properties = {'sceneId': image.id(), 'time': image.get('system:time_start'), 'cloud': image.get(cloudProperty),
+                  'minX': lower.get(0), 'minY': lower.get(1), 'maxX': upper.get(0), 'maxY': upper.get(1)}
+    if pathProperty:
+        properties.update({'path': image.get(pathProperty), 'row': image.get(rowProperty)})
+    return ee.Feature(None, properties)
+
+
+# scenes of collections harvested once from Earth Engine and stored in a SQLite file with an R*Tree index of their footprints
+# harvests records the regions and periods harvested, queries outside them return None since their scenes are unknown
+class SceneCatalog:
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.lock = threading.Lock()
+        # queried from the sampler worker threads, the lock serializes access to the connection
+        self.connection = sqlite3.connect(fileName, check_same_thread=False)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS scenes (id INTEGER PRIMARY KEY, collection TEXT NOT NULL, sceneId TEXT NOT NULL, '
+                                'time INTEGER, cloud REAL, path INTEGER, row TEXT, UNIQUE (collection, sceneId))')
+        self.connection.execute('CREATE VIRTUAL TABLE IF NOT EXISTS footprints USING rtree(id, minX, maxX, minY, maxY)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS harvests (collection TEXT NOT NULL, minX REAL, minY REAL, maxX REAL, maxY REAL, '
+                                'start INTEGER, end INTEGER, harvested REAL)')
+        self.connection.commit()
+
+    # True if the scenes of a collection over bounds from startDate to endDate have been harvested
+    def covers(self, collectionName, bounds, startDate, endDate):
+        with self.lock:
+            return self.connection.execute('SELECT 1 FROM harvests WHERE collection = ? AND minX <= ? AND minY <= ? AND maxX >= ? AND maxY >= ? '
+                                           'AND start <= ? AND end >= ? LIMIT 1',
+                                           (collectionName,) + tuple(bounds) + (millis(startDate), millis(endDate))).fetchone() is not None
+
+    # store the scenes of a collection over bounds from startDate to endDate, one request per window of the period
+    # collectionName labels the scenes in the catalog, assetName is the Earth Engine image collection, collectionName by default
+    # windows are planned by toolsWindows.planner, a window that runs out of memory or time is split in half and
+    # a split error raised on the shortest window is raised to the caller
+    # the harvest is only recorded once every window is stored, an interrupted harvest is repeated
+    def harvest(self, collectionName, cloudProperty, bounds, startDate, endDate, assetName=None):
+        assetName = assetName or collectionName
+        pathProperty, rowProperty = tileProperties(assetName)
+        region = ee.Geometry.Rectangle(list(bounds), None, False)
+
+        def harvestWindow(start, end):
+            scenes = ee.ImageCollection(assetName).filterBounds(region).filterDate(start, end) \
+                       .map(lambda image: sceneFeature(image, cloudProperty, pathProperty, rowProperty))
+            table = toolsEE.computeFeatures(ee.FeatureCollection(scenes), cache=False).reindex(columns=SCENE_COLUMNS)
+            self.addScenes(collectionName, table)
+        toolsWindows.planner.run(startDate, endDate, harvestWindow, ('catalog', assetName))
+        with self.lock:
+            self.connection.execute('INSERT INTO harvests VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                    (collectionName,) + tuple(bounds) + (millis(startDate), millis(endDate), time.time()))
+            self.connection.commit()
+
+    def addScenes(self, collectionName, table):
+        with self.lock:
+            for scene in table.dropna(subset=['sceneId', 'time']).itertuples(index=False):
+                values = (collectionName, scene.sceneId, int(scene.time), None if pd.isna(scene.cloud) else float(scene.cloud),
+                          None if pd.isna(scene.path) else int(scene.path), None if pd.isna(scene.row) else str(scene.row))
+                row = self.connection.execute('SELECT id FROM scenes WHERE collection = ? AND sceneId = ?', values[:2]).fetchone()
+                if row is None:
+                    sceneIndex = self.connection.execute('INSERT INTO scenes (collection, sceneId, time, cloud, path, row) VALUES (?, ?, ?, ?, ?, ?)',
+                                                         values).lastrowid
+                    self.connection.execute('INSERT INTO footprints VALUES (?, ?, ?, ?, ?)',
+                                            (sceneIndex, scene.minX, scene.maxX, scene.minY, scene.maxY))
+            self.connection.commit()
+
+    # harvest the scenes of a collection over bounds from startDate to endDate unless the catalog already covers them
+    def ensure(self, collectionName, cloudProperty, bounds, startDate, endDate, assetName=None):
+        if not self.covers(collectionName, bounds, startDate, endDate):
+            print('Harvesting scenes of %s from %s to %s' % (collectionName, startDate, endDate))
+            self.harvest(collectionName, cloudProperty, bounds, startDate, endDate, assetName)
+
+    # scenes of a collection whose footprint intersects bounds, dated from startDate to endDate (excluded) and with cloud cover
+    # below maxCloudcover as filtered by makeProductCollection, None when the catalog does not cover the query
+    def scenes(self, collectionName, bounds, startDate, endDate, maxCloudcover=100):
+        if not self.covers(collectionName, bounds, startDate, endDate):
+            return None
+        minX, minY, maxX, maxY = bounds
+        with self.lock:
+            rows = self.connection.execute('SELECT s.sceneId, s.time, s.cloud, s.path, s.row FROM scenes s JOIN footprints f ON s.id = f.id '
+                                           'WHERE s.collection = ? AND f.minX <= ? AND f.maxX >= ? AND f.minY <= ? AND f.maxY >= ? '
+                                           'AND s.time >= ? AND s.time < ? AND s.cloud < ? ORDER BY s.time',
+                                           (collectionName, maxX, minX, maxY, minY, millis(startDate), millis(endDate), maxCloudcover)).fetchall()
+        return pd.DataFrame(rows, columns=['sceneId', 'time', 'cloud', 'path', 'row'])
+
+    # dates of the candidate scenes of scenes(), as naive UTC datetimes like the dates of the sampling windows
+    def sceneDates(self, collectionName, bounds, startDate, endDate, maxCloudcover=100):
+        scenes = self.scenes(collectionName, bounds, startDate, endDate, maxCloudcover)
+        if scenes is None:
+            return None
+        return [datetime.fromtimestamp(t / 1000, timezone.utc).replace(tzinfo=None) for t in scenes['time']]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
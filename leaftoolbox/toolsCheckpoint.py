@@ -0,0 +1,44 @@
+import json
+import pickle
+import sqlite3
+
+
+# ------------------------------------------------------
+# Append-only checkpoints of sampled features:
+# ------------------------------------------------------
+# one row per completed feature of a site list input, written as soon as the feature is sampled
+# a run interrupted at any point can resume from the features already stored
+class Checkpoint:
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.connection = sqlite3.connect(fileName)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS features (input TEXT NOT NULL, n INTEGER NOT NULL, feature TEXT, '
+                                'algorithm TEXT, samples BLOB, PRIMARY KEY (input, n))')
+        self.connection.commit()
+
+    # indices of the features of an input already stored
+    def completed(self, input):
+        return set(row[0] for row in self.connection.execute('SELECT n FROM features WHERE input = ?', (input,)))
+
+    # store the result of feature n of an input, {'feature': properties, algorithmName: samplesDF}
+    def append(self, input, n, siteResult):
+        algorithm = [key for key in siteResult if key != 'feature'][0]
+        self.connection.execute('INSERT OR REPLACE INTO features VALUES (?, ?, ?, ?, ?)',
+                                (input, int(n), json.dumps(siteResult['feature']), algorithm,
+                                 pickle.dumps(siteResult[algorithm], protocol=pickle.HIGHEST_PROTOCOL)))
+        self.connection.commit()
+
+    # results of the stored features of an input in feature order, optionally only features from start to end
+    def load(self, input, start=0, end=None):
+        rows = self.connection.execute('SELECT n, feature, algorithm, samples FROM features WHERE input = ? AND n >= ? AND n < ? ORDER BY n',
+                                       (input, int(start), int(end) if end is not None else 2**62))
+        return [{'feature': json.loads(feature), algorithm: pickle.loads(samples)} for n, feature, algorithm, samples in rows]
+
+    # remove the stored features of an input
+    def clear(self, input):
+        self.connection.execute('DELETE FROM features WHERE input = ?', (input,))
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,187 @@
+import hashlib
+import random
+import re
+import threading
+import time
+from collections import Counter
+
+import ee
+
+from . import toolsCache
+from . import toolsProfile
+from . import toolsWindows
+
+
+# ------------------------------------------------------
+# Functions wrapping Earth Engine requests made by LEAF:
+# ------------------------------------------------------
+# limit the rate of requests made by each worker thread
+class RateLimiter:
+
+    def __init__(self, maxRequestsPerSecond):
+        self.interval = 1.0 / maxRequestsPerSecond
+        self.local = threading.local()
+
+    # block the calling thread until its next request is allowed
+    def wait(self):
+        last = getattr(self.local, 'last', None)
+        now = time.monotonic()
+        if last is not None and now - last < self.interval:
+            time.sleep(self.interval - (now - last))
+        self.local.last = time.monotonic()
+
+
+rateLimiter = None
+
+
+# set the maximum number of requests per second made by each thread, None removes the limit
+def setRateLimit(maxRequestsPerSecond):
+    global rateLimiter
+    rateLimiter = RateLimiter(maxRequestsPerSecond) if maxRequestsPerSecond else None
+
+
+# fragments of the messages of errors the server returns when requests are made too fast or too many run at once
+RATE_LIMIT_ERRORS = ['too many requests', 'rate limit', 'request rate', 'resource exhausted', 'too many concurrent aggregations']
+# fragments of the messages of errors the server returns once a quota is used up, waiting a few seconds does not restore it
+FATAL_ERRORS = ['quota exceeded']
+# fragments of the messages of server and connection errors that a new attempt of the same request can avoid
+TRANSIENT_ERRORS = ['internal error', 'backend error', 'service unavailable', 'bad gateway', 'gateway timeout',
+                    'temporarily unavailable', 'connection reset', 'connection aborted']
+
+
+# True if the message of an error holds one of the fragments or one of the HTTP status codes
+def errorMatches(message, fragments, codes):
+    return any(fragment in message for fragment in fragments) or (bool(codes) and re.search(r'\b(%s)\b' % '|'.join(codes), message) is not None)
+
+
+# 'rateLimit', 'split' (memory or computation timeout, see toolsWindows.isSplitError), 'transient' or 'fatal' for errors
+# that another attempt cannot avoid such as invalid arguments or an exceeded quota
+def errorClass(error):
+    message = str(error).lower()
+    if errorMatches(message, FATAL_ERRORS, []):
+        return 'fatal'
+    if errorMatches(message, RATE_LIMIT_ERRORS, ['429']):
+        return 'rateLimit'
+    if toolsWindows.isSplitError(error):
+        return 'split'
+    if isinstance(error, (ConnectionError, TimeoutError)) or errorMatches(message, TRANSIENT_ERRORS, ['500', '502', '503', '504']):
+        return 'transient'
+    return 'fatal'
+
+
+# retry requests that fail with rate limit or transient errors, waiting a jittered exponential backoff between attempts
+# split errors are raised at once since the same request would fail again, the window planner makes smaller requests instead
+# stats counts the retries, recoveries, failures and seconds waited by error class
+class RetryPolicy:
+
+    def __init__(self, maxRetries=6, baseDelay=1.0, maxDelay=64.0):
+        self.maxRetries = maxRetries
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+        self.stats = Counter()
+        self.lock = threading.Lock()
+
+    # seconds to wait before retry number attempt (from 0), drawn uniformly up to the exponential backoff so that
+    # workers limited at the same time do not retry at the same time
+    def delay(self, attempt):
+        return random.uniform(0, min(self.maxDelay, self.baseDelay * 2**attempt))
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.stats[name] += value
+
+    # return request(), retrying it on rate limit and transient errors
+    def call(self, kind, request):
+        attempt = 0
+        while True:
+            try:
+                result = request()
+            except Exception as error:
+                errorType = errorClass(error)
+                self.count(errorType + '.errors')
+                if errorType not in ('rateLimit', 'transient'):
+                    raise
+                if attempt >= self.maxRetries:
+                    self.count(errorType + '.failed')
+                    raise
+                seconds = self.delay(attempt)
+                print('Retrying %s in %.1f s after %s error: %s' % (kind, seconds, errorType, error))
+                self.count(errorType + '.retries')
+                self.count(errorType + '.seconds', seconds)
+                time.sleep(seconds)
+                attempt += 1
+                continue
+            if attempt:
+                self.count('recovered')
+            return result
+
+    def report(self):
+        with self.lock:
+            return dict(sorted(self.stats.items()))
+
+    def clear(self):
+        with self.lock:
+            self.stats.clear()
+
+
+retryPolicy = RetryPolicy()
+
+
+# set the number of retries and the backoff of requests, maxRetries=0 makes every error fatal
+def setRetryPolicy(maxRetries=6, baseDelay=1.0, maxDelay=64.0):
+    global retryPolicy
+    retryPolicy = RetryPolicy(maxRetries, baseDelay, maxDelay)
+
+
+# return request() with the retries of the retry policy, for requests made outside getInfo and computeFeatures
+def withRetries(kind, request):
+    return retryPolicy.call(kind, request)
+
+
+resultCache = None
+
+
+# keep the results of getInfo and computeFeatures in a file shared between runs, None stops caching
+# ttl is the age in seconds after which a result is requested again, None keeps results until they are evicted
+def setResultCache(fileName, ttl=None, maxBytes=512 * 2**20):
+    global resultCache
+    if resultCache is not None:
+        resultCache.close()
+    resultCache = toolsCache.DiskCache(fileName, ttl, maxBytes) if fileName else None
+
+
+# identical graphs serialize to identical strings, so the hash identifies a query across runs
+def graphKey(kind, computedObject):
+    return kind + ':' + hashlib.sha256(computedObject.serialize().encode('utf-8')).hexdigest()
+
+
+# return the result of request() from the result cache when it is enabled and cache is True
+def cachedRequest(kind, computedObject, request, cache):
+    if resultCache is None or not cache:
+        return request()
+    return resultCache.get(graphKey(kind, computedObject), request)
+
+
+# return the value of a computed object from the server, all blocking requests of LEAF go through here
+# cache=False bypasses the result cache for queries whose result changes between runs
+def getInfo(computedObject, cache=True):
+    def request():
+        if rateLimiter is not None:
+            rateLimiter.wait()
+        with toolsProfile.stage('getInfo') as call:
+            result = computedObject.getInfo()
+            call.payload(result)
+        return result
+    return cachedRequest('getInfo', computedObject, lambda: retryPolicy.call('getInfo', request), cache)
+
+
+# return a feature collection from the server as a pandas DataFrame with one column per property
+def computeFeatures(featureCollection, cache=True):
+    def request():
+        if rateLimiter is not None:
+            rateLimiter.wait()
+        with toolsProfile.stage('computeFeatures') as call:
+            result = ee.data.computeFeatures({'expression': featureCollection, 'fileFormat': 'PANDAS_DATAFRAME'})
+            call.payload(result)
+        return result
+    return cachedRequest('computeFeatures', featureCollection, lambda: retryPolicy.call('computeFeatures', request), cache)
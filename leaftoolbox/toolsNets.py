@@ -11,7 +11,7 @@ def invalidInput(sl2pDomain,bandList,image):
   # intialize inputs
   image = ee.Image(image)
   sl2pDomain = ee.FeatureCollection(sl2pDomain).aggregate_array("DomainCode").sort()
-  bandList = ee.List(bandList).slice(3,null)
+  bandList = ee.List(bandList).slice(3)
 
   # code image bands into a single band and compare to valid codes to make QC band
   imageQC =  image.select(bandList,bandList) \
@@ -24,12 +24,21 @@ def invalidInput(sl2pDomain,bandList,image):
                               .remap(sl2pDomain, ee.List.repeat(0, sl2pDomain.length()),1) \
                               .rename('QC')
 
-  image.addBands(imageQC)
+  return image.addBands(imageQC)
 
 
 # return image with single band named network id corresponding given 
-def makeIndexLayer(image, legend, Network_Ind):
+def makeIndexLayer(image, legend, Network_Ind, legendRemap=None):
     image = ee.Image(image)                          # partition image
+    
+    # lists of valid partitions and corresponding networkIDs, legendRemap holds them when already made by makeLegendRemap
+    landcover, networkIDs = legendRemap if legendRemap is not None else makeLegendRemap(legend, Network_Ind)
+    
+    return image.remap(landcover, networkIDs, 0).rename('networkID')
+
+
+# return the lists of partition classes of a legend and of their networkIDs used by makeIndexLayer
+def makeLegendRemap(legend, Network_Ind):
     legend = ee.FeatureCollection(legend)            # legend to convert partition numbers to networks
     Network_Ind = ee.FeatureCollection(Network_Ind)  # legend to convert networks to networkIDs
     
@@ -41,8 +50,7 @@ def makeIndexLayer(image, legend, Network_Ind):
     networkIDs = legend_list.map(lambda feature: ee.Feature(feature).get('SL2P Network')) \
                                     .map(lambda propertyValue: ee.Feature(ee.FeatureCollection(Network_Ind).first()) \
                                     .toDictionary().getNumber(propertyValue))
-    
-    return image.remap(landcover, networkIDs, 0).rename('networkID')
+    return landcover, networkIDs
 
 
 # read coefficients of a network from csv EE asset
@@ -197,10 +205,109 @@ def wrapperNNets(network, partition, netOptions, colOptions, suffixName, outputN
     netList = ee.List(network.get(ee.Number(netOptions.get("variable")).subtract(1)))
 
     # parse land cover into network index and add to input image
-    imageInput = imageInput.addBands(makeIndexLayer(partition,colOptions["legend"],colOptions["Network_Ind"]))
+    imageInput = imageInput.addBands(makeIndexLayer(partition,colOptions["legend"],colOptions["Network_Ind"],colOptions.get("legendRemap")))
 
     # define list of input names
     return ee.ImageCollection(ee.List.sequence(0, netList.size().subtract(1)) \
                                                     .map(lambda netIndex: selectNet(imageInput,netList,netOptions["inputBands"],netIndex)) \
                                                     .map(lambda netDict: applyNet(suffixName+outputName,netDict))) \
                                                     .max().addBands(partition).addBands(imageInput.select('networkID'))
+
+
+# return array image [1, n] holding, at each pixel, the coefficients named key of the network selected by the networkID band
+def gatherCoefs(netList, key, networkID):
+    coefs = ee.Image(ee.Array(netList.map(lambda net: ee.Dictionary(net).get(key))))
+    return coefs.arraySlice(0, networkID, networkID.add(1))
+
+
+# apply two-layer neural network using per pixel coefficients gathered by networkID, so each pixel is evaluated once
+# assumes all networks in netList share the same number of inputs and hidden nodes
+def applyNetGrouped(outputName, image, netList, inputNames):
+    outputName = ee.String(outputName)
+    image = ee.Image(image)
+    netList = ee.List(netList)
+    networkID = image.select('networkID').int()
+    net = ee.Dictionary(netList.get(0))
+    shape = ee.Image(ee.Array(ee.List([ee.List(net.get('h1bi')).length(), ee.List(net.get('inpOffset')).length()])))
+
+    # input scaling
+    inp = image.select(inputNames).toArray().toArray(1).arrayTranspose()
+    l1inp2D = inp.multiply(gatherCoefs(netList, 'inpSlope', networkID)).add(gatherCoefs(netList, 'inpOffset', networkID))
+
+    # hidden layers
+    l12D = gatherCoefs(netList, 'h1wt', networkID).arrayProject([1]).arrayReshape(shape, 2) \
+              .matrixMultiply(l1inp2D.arrayTranspose()) \
+              .add(gatherCoefs(netList, 'h1bi', networkID).arrayTranspose())
+
+    # apply tansig 2/(1+exp(-2*n))-1
+    l2inp2D = ee.Image(2).divide(ee.Image(1).add((ee.Image(-2).multiply(l12D)).exp())).subtract(ee.Image(1))
+
+    # purlin hidden layers
+    l22D = gatherCoefs(netList, 'h2wt', networkID).matrixMultiply(l2inp2D) \
+              .add(gatherCoefs(netList, 'h2bi', networkID))
+
+    # output scaling
+    outputBand = l22D.subtract(gatherCoefs(netList, 'outBias', networkID)).divide(gatherCoefs(netList, 'outSlope', networkID)) \
+                    .arrayProject([0]).arrayFlatten([['output']])
+
+    return outputBand.rename(outputName)
+
+
+# same as wrapperNNets but each pixel is only evaluated by the network of its partition class
+# rather than masking the image once per network and taking the max
+def wrapperNNetsGrouped(network, partition, netOptions, colOptions, suffixName, outputName, imageInput):
+
+    # typecast function parameters
+    network = ee.List(network)
+    partition = ee.Image(partition)
+    imageInput = ee.Image(imageInput)
+
+    # parse partition  used to identify network to use
+    partition = partition.clip(imageInput.geometry()).select(['partition'])
+
+    # determine networks based on collection
+    netList = ee.List(network.get(ee.Number(netOptions.get("variable")).subtract(1)))
+
+    # parse land cover into network index and add to input image
+    imageInput = imageInput.addBands(makeIndexLayer(partition,colOptions["legend"],colOptions["Network_Ind"],colOptions.get("legendRemap")))
+
+    return applyNetGrouped(suffixName+outputName, imageInput, netList, netOptions["inputBands"]) \
+                .addBands(partition).addBands(imageInput.select('networkID'))
+
+
+# apply the estimate and error networks of a variable in one pass
+# the partition clip, network index layer and masked input selection are shared by both networks
+def wrapperNNetsFused(network, errorNetwork, partition, netOptions, colOptions, outputName, imageInput, dispatch='mask'):
+
+    # typecast function parameters
+    network = ee.List(network)
+    errorNetwork = ee.List(errorNetwork)
+    partition = ee.Image(partition)
+    imageInput = ee.Image(imageInput)
+    estimateName = "estimate"+outputName
+    errorName = "error"+outputName
+
+    # parse partition  used to identify network to use
+    partition = partition.clip(imageInput.geometry()).select(['partition'])
+
+    # determine networks based on collection
+    variableIndex = ee.Number(netOptions.get("variable")).subtract(1)
+    netList = ee.List(network.get(variableIndex))
+    errorNetList = ee.List(errorNetwork.get(variableIndex))
+
+    # parse land cover into network index and add to input image
+    imageInput = imageInput.addBands(makeIndexLayer(partition,colOptions["legend"],colOptions["Network_Ind"],colOptions.get("legendRemap")))
+
+    if dispatch == 'grouped':
+        output = applyNetGrouped(estimateName, imageInput, netList, netOptions["inputBands"]) \
+                    .addBands(applyNetGrouped(errorName, imageInput, errorNetList, netOptions["inputBands"]))
+    else:
+        output = ee.ImageCollection(ee.List.sequence(0, netList.size().subtract(1)) \
+                                        .map(lambda netIndex: selectNet(imageInput,netList,netOptions["inputBands"],netIndex) \
+                                                                .set("ErrorNetwork", errorNetList.get(ee.Number(netIndex).int()))) \
+                                        .map(lambda netDict: applyNet(estimateName,netDict) \
+                                                                .addBands(applyNet(errorName,ee.Dictionary(netDict).set("Network",ee.Dictionary(netDict).get("ErrorNetwork")))))) \
+                                        .max()
+
+    # keep the band order of the separate estimate and error passes
+    return output.select([estimateName]).addBands(partition).addBands(imageInput.select('networkID')).addBands(output.select([errorName]))
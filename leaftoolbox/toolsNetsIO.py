@@ -0,0 +1,255 @@
+import csv
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from . import dictionariesSL2P
+from . import toolsNetsLocal
+
+
+# --------------------------------------------------------------------------
+# Local parsing and caching of SL2P network coefficient tables:
+# --------------------------------------------------------------------------
+# Bump when the layout of the cached .npz files changes so stale caches are rebuilt
+CACHE_VERSION = 1
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'leaftoolbox')
+
+# uint16 value reserved for missing outputs in quantized tables
+QUANTIZED_FILL = np.iinfo(np.uint16).max
+
+
+# read the feature properties of an exported FeatureCollection (CSV or GeoJSON) as a list of dictionaries
+def readTable(fileName):
+    if fileName.lower().endswith(('.json', '.geojson')):
+        with open(fileName) as fp:
+            return [feature['properties'] for feature in json.load(fp)['features']]
+    with open(fileName, newline='') as fp:
+        return [row for row in csv.DictReader(fp)]
+
+
+# read coefficient ind of a network row
+def getCoefs(netData, ind):
+    return float(netData['tabledata%d' % ind])
+
+
+# parse one row of the tabledataN layout into a network, same walk as toolsNets.makeNets
+def makeNets(netData):
+    net = {}
+    end = 6
+    for key in toolsNetsLocal.NET_KEYS:
+        num = end if key == 'inpSlope' else end + 1
+        start = num + 1
+        end = num + int(getCoefs(netData, num))
+        net[key] = [getCoefs(netData, ind) for ind in range(start, end + 1)]
+    return toolsNetsLocal.makeNet(net)
+
+
+# parse all rows of a coefficient table into {variableNum: [network for each partition class]}
+# rows for a variable keep their table order, as with the toList in toolsNets.makeNetVars
+def makeNetVars(rows, numNets=None):
+    netVars = {}
+    for row in rows:
+        netVars.setdefault(int(getCoefs(row, 3)), []).append(row)
+    return {variableNum: [makeNets(row) for row in netRows[:numNets]] for variableNum, netRows in netVars.items()}
+
+
+# name of the cache file for an asset id
+def cacheFileName(assetId, cacheDir=None):
+    return os.path.join(cacheDir or CACHE_DIR, assetId.strip('/').replace('/', '_') + '.npz')
+
+
+# write arrays to the versioned .npz cache of an asset
+def writeCache(assetId, arrays, cacheDir=None):
+    fileName = cacheFileName(assetId, cacheDir)
+    os.makedirs(os.path.dirname(fileName), exist_ok=True)
+    np.savez(fileName, cacheVersion=np.array(CACHE_VERSION), assetId=np.array(assetId), **arrays)
+    return fileName
+
+
+# read the arrays of an asset from the .npz cache, returns None if missing or written by another cache version
+def readCache(assetId, cacheDir=None):
+    fileName = cacheFileName(assetId, cacheDir)
+    if not os.path.exists(fileName):
+        return None
+    with np.load(fileName) as data:
+        if int(data['cacheVersion']) != CACHE_VERSION or str(data['assetId']) != assetId:
+            return None
+        return {name: data[name] for name in data.files if name not in ['cacheVersion', 'assetId']}
+
+
+# write parsed networks to a versioned .npz cache
+def saveNets(assetId, netVars, cacheDir=None):
+    arrays = {}
+    for variableNum, nets in netVars.items():
+        for netNum, net in enumerate(nets):
+            for key in toolsNetsLocal.NET_KEYS:
+                arrays['v%d_n%d_%s' % (variableNum, netNum, key)] = net[key]
+    return writeCache(assetId, arrays, cacheDir)
+
+
+# read parsed networks from the .npz cache, returns None if missing or written by another cache version
+def readNets(assetId, cacheDir=None):
+    data = readCache(assetId, cacheDir)
+    if data is None:
+        return None
+    netVars = {}
+    for name in data:
+        variable, net, key = name.split('_', 2)
+        nets = netVars.setdefault(int(variable[1:]), {})
+        nets.setdefault(int(net[1:]), {})[key] = data[name]
+    return {variableNum: [nets[netNum] for netNum in sorted(nets)] for variableNum, nets in netVars.items()}
+
+
+# return networks for an asset, parsing the exported table only when the cache is missing or stale
+def loadNets(assetId, exportFileName=None, cacheDir=None, numNets=None):
+    netVars = readNets(assetId, cacheDir)
+    if netVars is None:
+        if exportFileName is None:
+            raise ValueError('No cached networks for %s and no exported table to parse' % assetId)
+        # the cache holds every network of the table, numNets only limits the networks returned
+        netVars = makeNetVars(readTable(exportFileName))
+        saveNets(assetId, netVars, cacheDir)
+    if numNets is not None:
+        netVars = {variableNum: nets[:numNets] for variableNum, nets in netVars.items()}
+    return netVars
+
+
+# read the valid DomainCode values of an exported domain FeatureCollection as a sorted array
+def readDomain(fileName):
+    return np.unique(np.array([int(float(row['DomainCode'])) for row in readTable(fileName)], dtype=np.int64))
+
+
+# --------------------------------------------------------------------------
+# Quantized storage of SL2P outputs:
+# --------------------------------------------------------------------------
+# return the make_outputParams variable of an output column (e.g. estimateLAI, errorLAI or LAI), None if not an SL2P output
+def outputVariable(column, outputParams):
+    for prefix in ['estimate', 'error', '']:
+        variable = column[len(prefix):] if column.startswith(prefix) else None
+        if variable in outputParams and outputParams[variable]['outputScale'] > 0:
+            return variable
+    return None
+
+
+# write a table to a directory with one .npy file per column, SL2P estimates and errors are clipped to
+# [outputOffset, outputMax] and stored as uint16 scaled by outputScale from dictionariesSL2P.make_outputParams
+# the scale, offset and fill value of each quantized column are recorded in metadata.json
+def encodeOutputs(table, pathName, outputParams=None):
+    if outputParams is None:
+        outputParams = dictionariesSL2P.make_outputParams()
+    os.makedirs(pathName, exist_ok=True)
+    metadata = {'columns': list(table.columns), 'quantized': {}}
+    for column in table.columns:
+        values = table[column].to_numpy()
+        variable = outputVariable(str(column), outputParams)
+        if variable is not None:
+            params = outputParams[variable]
+            scaled = np.clip(values.astype(np.float64), params['outputOffset'], params['outputMax'])
+            scaled = np.rint((scaled - params['outputOffset']) * params['outputScale'])
+            values = np.where(np.isnan(scaled), QUANTIZED_FILL, scaled).astype(np.uint16)
+            metadata['quantized'][str(column)] = {'variable': variable, 'scale': params['outputScale'],
+                                                  'offset': params['outputOffset'], 'fill': int(QUANTIZED_FILL)}
+        elif values.dtype == object:
+            values = values.astype(str)
+        np.save(os.path.join(pathName, '%s.npy' % column), values)
+    with open(os.path.join(pathName, 'metadata.json'), 'w') as fp:
+        json.dump(metadata, fp, indent=2)
+    return pathName
+
+
+# read-only view of a table written by encodeOutputs
+# columns are memory mapped, quantized columns are only decoded to float64 when they are requested
+# raw() is the zero-copy path, every other access allocates a new float64 array for the rows it decodes:
+# a whole column for table[column] and toDataFrame, blockRows rows at a time for iterBlocks
+class QuantizedTable:
+
+    def __init__(self, pathName):
+        self.pathName = pathName
+        with open(os.path.join(pathName, 'metadata.json')) as fp:
+            metadata = json.load(fp)
+        self.columns = metadata['columns']
+        self.quantized = metadata['quantized']
+
+    def __len__(self):
+        return len(self.raw(self.columns[0]))
+
+    # stored values of a column without decoding or copying
+    def raw(self, column):
+        return np.load(os.path.join(self.pathName, '%s.npy' % column), mmap_mode='r')
+
+    # decoded values of rows start to end (excluded) of a column, missing outputs are NaN
+    def decode(self, column, start=0, end=None):
+        values = self.raw(column)[start:end]
+        if column not in self.quantized:
+            return values
+        params = self.quantized[column]
+        decoded = values / np.float64(params['scale']) + params['offset']
+        decoded[values == params['fill']] = np.nan
+        return decoded
+
+    # decoded values of a whole column, a new float64 copy on every call for quantized columns
+    def __getitem__(self, column):
+        return self.decode(column)
+
+    # yield the decoded values of a column in blocks of blockRows rows, memory stays bounded by one block
+    def iterBlocks(self, column, blockRows=65536):
+        for start in range(0, len(self), blockRows):
+            yield self.decode(column, start, start + blockRows)
+
+    def toDataFrame(self, columns=None):
+        return pd.DataFrame({column: self[column] for column in (self.columns if columns is None else columns)})
+
+
+# return the decoded view of a table written by encodeOutputs
+def decodeOutputs(pathName):
+    return QuantizedTable(pathName)
+
+
+# read the DomainCode values of an exported domain table for each network, as a list indexed by networkID
+# networkColumn holds the networkID of each row, e.g. added before exporting the merged per-network domains
+def readDomains(fileName, networkColumn='networkID'):
+    sl2pDomains = {}
+    for row in readTable(fileName):
+        sl2pDomains.setdefault(int(float(row[networkColumn])), []).append(int(float(row['DomainCode'])))
+    return [np.unique(np.array(sl2pDomains.get(netIndex, []), dtype=np.int64)) for netIndex in range(max(sl2pDomains) + 1)]
+
+
+# parse the rows of an exported *_createFeatureCollection_ranges table into {variableNum: (min, max)}
+# the variable column holds variable numbers or names (e.g. LAI), repeated rows of the merged per-network copies are ignored
+def makeRanges(rows, variableColumn='variable', minColumn='min', maxColumn='max'):
+    variableNums = {name: variableNum for variableNum, name in toolsNetsLocal.VARIABLES.items()}
+    ranges = {}
+    for row in rows:
+        variable = str(row[variableColumn])
+        variableNum = variableNums[variable] if variable in variableNums else int(float(variable))
+        ranges.setdefault(variableNum, (float(row[minColumn]), float(row[maxColumn])))
+    return ranges
+
+
+# write output ranges to the .npz cache of the ranges asset
+def saveRanges(assetId, ranges, cacheDir=None):
+    variableNums = sorted(ranges)
+    return writeCache(assetId, {'variable': np.array(variableNums, dtype=np.int64),
+                                'outmin': np.array([ranges[variableNum][0] for variableNum in variableNums]),
+                                'outmax': np.array([ranges[variableNum][1] for variableNum in variableNums])}, cacheDir)
+
+
+# read output ranges from the .npz cache, returns None if missing or written by another cache version
+def readRanges(assetId, cacheDir=None):
+    data = readCache(assetId, cacheDir)
+    if data is None:
+        return None
+    return {int(variableNum): (float(outmin), float(outmax)) for variableNum, outmin, outmax in zip(data['variable'], data['outmin'], data['outmax'])}
+
+
+# return output ranges for an asset, parsing the exported table only when the cache is missing or stale
+def loadRanges(assetId, exportFileName=None, cacheDir=None, **columns):
+    ranges = readRanges(assetId, cacheDir)
+    if ranges is None:
+        if exportFileName is None:
+            raise ValueError('No cached ranges for %s and no exported table to parse' % assetId)
+        ranges = makeRanges(readTable(exportFileName), **columns)
+        saveRanges(assetId, ranges, cacheDir)
+    return ranges
@@ -0,0 +1,355 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# --------------------------------------------------------------------------
+# Offline SL2P network evaluation (NumPy mirror of toolsNets.applyNet):
+# --------------------------------------------------------------------------
+# Networks are dictionaries with the same keys produced by toolsNets.makeNets
+NET_KEYS = ['inpSlope', 'inpOffset', 'h1wt', 'h1bi', 'h2wt', 'h2bi', 'outSlope', 'outBias']
+
+# SL2P output variables in network order, "variable" in dictionariesSL2P.make_net_options
+VARIABLES = {1: 'LAI', 2: 'fAPAR', 3: 'fCOVER', 4: 'CCC', 5: 'CWC', 6: 'Albedo', 7: 'DASF'}
+
+
+# typecast a parsed network into float64 arrays, h1wt is reshaped to (hidden nodes, inputs)
+def makeNet(net):
+    net = {key: np.asarray(net[key], dtype=np.float64).ravel() for key in NET_KEYS}
+    net['h1wt'] = net['h1wt'].reshape(net['h1bi'].size, net['inpOffset'].size)
+    return net
+
+
+# return an (N pixels x bands) float64 array from a table with one column per input band
+def makeInputs(table, inputBands):
+    return np.column_stack([np.asarray(table[band], dtype=np.float64) for band in inputBands])
+
+
+# apply two-layer neural network with input and output scaling to an (N pixels x bands) array
+def applyNet(inputs, net):
+    net = makeNet(net)
+    inp = np.atleast_2d(np.asarray(inputs, dtype=np.float64))
+    if inp.shape[1] != net['inpSlope'].size:
+        raise ValueError('Network expects %d inputs, got %d bands' % (net['inpSlope'].size, inp.shape[1]))
+
+    # input scaling
+    l1inp2D = inp * net['inpSlope'] + net['inpOffset']
+
+    # hidden layer, tansig 2/(1+exp(-2*n))-1 is tanh
+    l2inp2D = np.tanh(l1inp2D @ net['h1wt'].T + net['h1bi'])
+
+    # purelin output layer
+    l22D = l2inp2D @ net['h2wt'] + net['h2bi'][0]
+
+    # output scaling
+    return (l22D - net['outBias'][0]) / net['outSlope'][0]
+
+
+# return array of networkIDs for partition classes using the legend and Network_Ind tables, as toolsNets.makeIndexLayer
+# classes missing from the legend are remapped to network 0 as done by ee.Image.remap
+def makeIndexLayer(partition, legend, Network_Ind):
+    Network_Ind = Network_Ind[0] if isinstance(Network_Ind, list) else Network_Ind
+    landcover = np.array([float(row['Value']) for row in legend])
+    networkIDs = np.array([int(float(Network_Ind[row['SL2P Network']])) for row in legend], dtype=np.intp)
+    order = np.argsort(landcover)
+    landcover, networkIDs = landcover[order], networkIDs[order]
+
+    partition = np.asarray(partition, dtype=np.float64)
+    position = np.clip(np.searchsorted(landcover, partition), 0, landcover.size - 1)
+    return np.where(landcover[position] == partition, networkIDs[position], 0)
+
+
+# return start offsets and row order grouping pixels by networkID with a stable sort
+# pixels with a networkID outside the network list are left out of every group
+def groupByNetwork(networkID, numNets):
+    networkID = np.asarray(networkID)
+    valid = np.flatnonzero((networkID >= 0) & (networkID < numNets))
+    order = valid[np.argsort(networkID[valid], kind='stable')]
+    counts = np.bincount(networkID[valid].astype(np.intp), minlength=numNets)
+    return order, np.concatenate([[0], np.cumsum(counts)])
+
+
+# apply a set of networks to an (N pixels x bands) array, evaluating each network only on its own pixels
+# pixels without a valid networkID are returned as NaN like the masked pixels of toolsNets.wrapperNNets
+def wrapperNNets(netList, networkID, inputs):
+    inp = np.atleast_2d(np.asarray(inputs, dtype=np.float64))
+    output = np.full(inp.shape[0], np.nan)
+    order, bounds = groupByNetwork(networkID, len(netList))
+    for netIndex in range(len(netList)):
+        rows = order[bounds[netIndex]:bounds[netIndex + 1]]
+        if rows.size > 0:
+            output[rows] = applyNet(inp[rows], netList[netIndex])
+    return output
+
+
+# stack K networks with the same inputs into arrays with a leading network axis
+# networks with fewer hidden nodes are zero padded, which leaves their outputs unchanged since tansig(0) = 0
+def stackNets(nets):
+    nets = [makeNet(net) for net in nets]
+    numHidden = max(net['h1bi'].size for net in nets)
+    stack = {key: np.zeros((len(nets), numHidden)) for key in ['h1bi', 'h2wt']}
+    stack['h1wt'] = np.zeros((len(nets), numHidden, nets[0]['inpSlope'].size))
+    for k, net in enumerate(nets):
+        hidden = net['h1bi'].size
+        stack['h1wt'][k, :hidden] = net['h1wt']
+        stack['h1bi'][k, :hidden] = net['h1bi']
+        stack['h2wt'][k, :hidden] = net['h2wt']
+    for key in ['inpSlope', 'inpOffset']:
+        stack[key] = np.stack([net[key] for net in nets])
+    for key in ['h2bi', 'outSlope', 'outBias']:
+        stack[key] = np.array([net[key][0] for net in nets])
+    return stack
+
+
+# apply a stack of networks to an (N pixels x bands) array in one pass, returns an (N pixels x K networks) array
+# with a workspace from makeWorkspace the intermediate arrays are written into its buffers instead of allocated
+def applyNetStack(inputs, stack, work=None):
+    inp = np.atleast_2d(np.asarray(inputs, dtype=np.float64))
+    if work is None:
+        # input scaling for every network
+        l1inp3D = inp[:, None, :] * stack['inpSlope'] + stack['inpOffset']
+
+        # hidden layer with tansig
+        l2inp3D = np.tanh(np.einsum('nki,khi->nkh', l1inp3D, stack['h1wt']) + stack['h1bi'])
+
+        # purelin output layer and output scaling
+        l22D = np.einsum('nkh,kh->nk', l2inp3D, stack['h2wt']) + stack['h2bi']
+        return (l22D - stack['outBias']) / stack['outSlope']
+
+    numNets, numHidden = stack['h1bi'].shape
+    l1inp3D = workView(work, 'l1inp', (inp.shape[0], numNets, inp.shape[1]))
+    np.multiply(inp[:, None, :], stack['inpSlope'], out=l1inp3D)
+    l1inp3D += stack['inpOffset']
+
+    l2inp3D = workView(work, 'hidden', (inp.shape[0], numNets, numHidden))
+    np.einsum('nki,khi->nkh', l1inp3D, stack['h1wt'], out=l2inp3D)
+    l2inp3D += stack['h1bi']
+    np.tanh(l2inp3D, out=l2inp3D)
+
+    l22D = workView(work, 'output', (inp.shape[0], numNets))
+    np.einsum('nkh,kh->nk', l2inp3D, stack['h2wt'], out=l22D)
+    l22D += stack['h2bi']
+    l22D -= stack['outBias']
+    l22D /= stack['outSlope']
+    return l22D
+
+
+# stack K network lists into one stack per networkID
+def stackNetLists(netLists):
+    numNets = min(len(netList) for netList in netLists)
+    return [stackNets([netList[netIndex] for netList in netLists]) for netIndex in range(numNets)]
+
+
+# return preallocated work buffers to evaluate network stacks on blocks of up to blockRows pixels
+def makeWorkspace(stacks, numBands, blockRows):
+    numNets = stacks[0]['h1bi'].shape[0]
+    numHidden = max(stack['h1bi'].shape[1] for stack in stacks)
+    sizes = {'block': numBands, 'inputs': numBands, 'l1inp': numNets * numBands, 'hidden': numNets * numHidden,
+             'output': numNets, 'result': numNets}
+    return {name: np.empty(blockRows * size) for name, size in sizes.items()}
+
+
+# return a contiguous view with the requested shape at the start of a work buffer
+def workView(work, name, shape):
+    return work[name][:int(np.prod(shape))].reshape(shape)
+
+
+# apply K network lists (e.g. estimate and error networks) to an (N pixels x bands) array in one pass per networkID
+# returns an (N pixels x K) array, NaN for pixels without a valid networkID
+# stacks from stackNetLists can be passed to avoid restacking the networks on every call,
+# the result is written to out and the work buffers of a workspace are reused if they are given
+def wrapperNNetStack(netLists, networkID, inputs, stacks=None, out=None, work=None):
+    inp = np.atleast_2d(np.asarray(inputs, dtype=np.float64))
+    stacks = stackNetLists(netLists) if stacks is None else stacks
+    output = np.empty((inp.shape[0], len(stacks[0]['h2bi']))) if out is None else out
+    output.fill(np.nan)
+    order, bounds = groupByNetwork(networkID, len(stacks))
+    for netIndex, stack in enumerate(stacks):
+        rows = order[bounds[netIndex]:bounds[netIndex + 1]]
+        if rows.size > 0:
+            if work is None:
+                output[rows] = applyNetStack(inp[rows], stack)
+            else:
+                netInputs = np.take(inp, rows, axis=0, out=workView(work, 'inputs', (rows.size, inp.shape[1])))
+                output[rows] = applyNetStack(netInputs, stack, work)
+    return output
+
+
+# evaluate network lists over a reflectance source in blocks of blockRows pixels with reused work buffers
+# source is an (N pixels x bands) array, e.g. np.memmap, with networkID its N networkIDs,
+# or an iterator of (networkID, inputs) blocks such as iterTableBlocks
+# out is an (N x K) writable array such as np.memmap, or the file name of a .npy file created with the output
+# for iterator sources, whose number of rows is unknown, rows are appended to a temporary file copied into the .npy at the end
+# ranges=(outmin, outmax) also writes the range flags of makeRangeFlags for each block to flagsOut, in the same way as out
+# returns the number of rows written
+def streamNNetStack(source, netLists, out, networkID=None, blockRows=65536, ranges=None, flagsOut=None):
+    stacks = stackNetLists(netLists)
+    numNets = len(netLists)
+    outputs = [(out, np.float64, (numNets,))]
+    if ranges is not None:
+        outputs.append((flagsOut, rangeFlagType(*ranges), ()))
+    if hasattr(source, 'shape'):
+        blocks = ((networkID[start:start + blockRows], source[start:start + blockRows]) for start in range(0, source.shape[0], blockRows))
+        outputs = [(np.lib.format.open_memmap(target, mode='w+', dtype=dtype, shape=(source.shape[0],) + shape) if isinstance(target, str) else target, dtype, shape)
+                   for target, dtype, shape in outputs]
+    else:
+        blocks = source
+    files = [open(target + '.part', 'wb') if isinstance(target, str) else None for target, dtype, shape in outputs]
+
+    work = None
+    written = 0
+    try:
+        for blockID, blockInputs in blocks:
+            for start in range(0, len(blockID), blockRows):
+                ids = np.asarray(blockID[start:start + blockRows])
+                if work is None:
+                    work = makeWorkspace(stacks, np.shape(blockInputs)[1], blockRows)
+                inp = workView(work, 'block', (ids.size, np.shape(blockInputs)[1]))
+                np.copyto(inp, blockInputs[start:start + blockRows])
+                result = wrapperNNetStack(None, ids, inp, stacks, workView(work, 'result', (ids.size, numNets)), work)
+                results = [result] if ranges is None else [result, makeRangeFlags(result, *ranges)]
+                for (target, dtype, shape), fp, values in zip(outputs, files, results):
+                    if fp is None:
+                        target[written:written + ids.size] = values
+                    else:
+                        fp.write(memoryview(np.ascontiguousarray(values)))
+                written += ids.size
+    finally:
+        for (target, dtype, shape), fp in zip(outputs, files):
+            if fp is not None:
+                fp.close()
+            elif hasattr(target, 'flush'):
+                target.flush()
+    for (target, dtype, shape), fp in zip(outputs, files):
+        if fp is not None:
+            writeNpy(target, target + '.part', dtype, (written,) + shape, blockRows)
+    return written
+
+
+# copy raw rows of dtype and shape from partName into a .npy file, blockRows rows at a time, and remove partName
+def writeNpy(fileName, partName, dtype, shape, blockRows):
+    npy = np.lib.format.open_memmap(fileName, mode='w+', dtype=dtype, shape=shape)
+    if shape[0] > 0:
+        rows = np.memmap(partName, mode='r', dtype=dtype, shape=shape)
+        for start in range(0, shape[0], blockRows):
+            npy[start:start + blockRows] = rows[start:start + blockRows]
+        del rows
+    npy.flush()
+    del npy
+    os.remove(partName)
+
+
+# yield (networkID, inputs) blocks from sampled tables (e.g. the time_series pickles of run_sampler.py)
+# networkIDs come from the partition column remapped with the legend and Network_Ind tables
+def iterTableBlocks(tables, inputBands, legend, Network_Ind):
+    for table in tables:
+        yield makeIndexLayer(table['partition'], legend, Network_Ind), makeInputs(table, inputBands)
+
+
+# apply the estimate and error networks of a variable in one pass over the grouped inputs
+def wrapperNNetsFused(netList, errorNetList, networkID, inputs):
+    output = wrapperNNetStack([netList, errorNetList], networkID, inputs)
+    return output[:, 0], output[:, 1]
+
+
+# return the network lists and column names used to evaluate several variables and their errors together
+# netVars and errorVars map variable numbers to network lists, as returned by toolsNetsIO.loadNets
+def makeVariableNetLists(netVars, errorVars, variables=None):
+    variables = sorted(set(netVars) & set(errorVars)) if variables is None else variables
+    netLists, columns = [], []
+    for variableNum in variables:
+        name = VARIABLES.get(variableNum, str(variableNum))
+        netLists += [netVars[variableNum], errorVars[variableNum]]
+        columns += ['estimate' + name, 'error' + name]
+    return netLists, columns
+
+
+# return (outmin, outmax) for the columns of makeVariableNetLists, only estimate columns are range checked
+# ranges maps variable numbers to (min, max), e.g. from toolsNetsIO.loadRanges
+def makeVariableRanges(ranges, variables):
+    outmin = np.full(2 * len(variables), np.nan)
+    outmax = np.full(2 * len(variables), np.nan)
+    for position, variableNum in enumerate(variables):
+        if variableNum in ranges:
+            outmin[2 * position], outmax[2 * position] = ranges[variableNum]
+    return outmin, outmax
+
+
+# smallest unsigned integer type holding one flag bit per range checked column
+def rangeFlagType(outmin, outmax):
+    numChecked = int(np.count_nonzero(~(np.isnan(outmin) & np.isnan(outmax))))
+    return np.min_scalar_type((1 << numChecked) - 1)
+
+
+# return bit-packed range flags for an (N pixels x K) output array, bit b is set when the b-th
+# column with bounds is outside [outmin, outmax], columns with NaN bounds are not checked
+# NaN outputs (masked or invalid inputs) are left unflagged, they are already reported as missing values
+def makeRangeFlags(output, outmin, outmax):
+    outmin, outmax = np.asarray(outmin, dtype=np.float64), np.asarray(outmax, dtype=np.float64)
+    checked = np.flatnonzero(~(np.isnan(outmin) & np.isnan(outmax)))
+    dtype = rangeFlagType(outmin, outmax)
+    values = output[:, checked]
+    outside = (values < outmin[checked]) | (values > outmax[checked])
+    return (outside.astype(dtype) << np.arange(checked.size, dtype=dtype)).sum(axis=1, dtype=dtype)
+
+
+# apply the estimate and error networks of all variables to an (N pixels x bands) array in one pass per networkID
+# returns a wide table with an estimate and an error column for each variable
+# with ranges ({variableNum: (min, max)}) a rangeFlag column holds one bit per variable set for out of range estimates
+def wrapperNNetsVariables(netVars, errorVars, networkID, inputs, variables=None, ranges=None):
+    variables = sorted(set(netVars) & set(errorVars)) if variables is None else variables
+    netLists, columns = makeVariableNetLists(netVars, errorVars, variables)
+    output = wrapperNNetStack(netLists, networkID, inputs)
+    table = pd.DataFrame(output, columns=columns)
+    if ranges is not None:
+        table['rangeFlag'] = makeRangeFlags(output, *makeVariableRanges(ranges, variables))
+    return table
+
+
+# return the input domain code of each pixel, coded as in toolsUtils.invalidInput:
+# the tenths digit of each band after the three angle bands weighted by increasing powers of ten
+# pixels with missing inputs get code -1
+def makeDomainCodes(inputs):
+    inp = np.atleast_2d(np.asarray(inputs, dtype=np.float64))[:, 3:]
+    missing = np.isnan(inp).any(axis=1)
+    digits = np.clip(np.fmod(np.ceil(np.nan_to_num(inp) * 10), 10), 0, 255).astype(np.int64)
+    codes = digits @ (10 ** np.arange(inp.shape[1], dtype=np.int64))
+    codes[missing] = -1
+    return codes
+
+
+# return QC flag (0 valid, 1 outside of the algorithm domain) for an (N pixels x bands) array, as toolsUtils.invalidInput
+# sl2pDomain is the array of valid DomainCode values, e.g. from toolsNetsIO.readDomain
+def invalidInput(sl2pDomain, inputs):
+    sl2pDomain = np.unique(np.asarray(sl2pDomain, dtype=np.int64))
+    codes = makeDomainCodes(inputs)
+    if sl2pDomain.size == 0:
+        return np.ones(codes.size, dtype=np.uint8)
+    position = np.clip(np.searchsorted(sl2pDomain, codes), 0, sl2pDomain.size - 1)
+    return (sl2pDomain[position] != codes).astype(np.uint8)
+
+
+# return the valid (networkID, DomainCode) pairs of all networks as one sorted int64 key array and its stride,
+# a pair is keyed networkID * stride + DomainCode with stride above every valid code, memory grows with the number of codes
+# sl2pDomains is a list of DomainCode arrays indexed by networkID, e.g. from toolsNetsIO.readDomains
+def makeDomainKeys(sl2pDomains):
+    sl2pDomains = [np.unique(np.asarray(sl2pDomain, dtype=np.int64)) for sl2pDomain in sl2pDomains]
+    stride = max([int(sl2pDomain[-1]) + 1 for sl2pDomain in sl2pDomains if sl2pDomain.size > 0], default=1)
+    keys = np.concatenate([netIndex * stride + sl2pDomain for netIndex, sl2pDomain in enumerate(sl2pDomains)] + [np.empty(0, dtype=np.int64)])
+    return np.unique(keys), stride
+
+
+# return QC flag (0 valid, 1 outside of the domain of the pixel's network) for an (N pixels x bands) array
+# domainKeys come from makeDomainKeys, all pixels are looked up in one searchsorted whatever the number of networks
+# pixels without a valid networkID, with missing inputs or with codes above every valid code are flagged as invalid
+def invalidInputPartition(domainKeys, networkID, inputs):
+    keys, stride = domainKeys
+    codes = makeDomainCodes(inputs)
+    networkID = np.asarray(networkID, dtype=np.int64)
+    pixelKeys = networkID * stride + codes
+    if keys.size == 0:
+        return np.ones(codes.size, dtype=np.uint8)
+    position = np.clip(np.searchsorted(keys, pixelKeys), 0, keys.size - 1)
+    valid = (keys[position] == pixelKeys) & (codes >= 0) & (codes < stride) & (networkID >= 0)
+    return (~valid).astype(np.uint8)
@@ -0,0 +1,175 @@
+import csv
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+
+# ------------------------------------------------------
+# Opt-in instrumentation of Earth Engine requests and client-side stages:
+# ------------------------------------------------------
+# upper bounds in milliseconds of the latency histogram bins
+HISTOGRAM_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000, float('inf')]
+
+
+# approximate size in bytes of a payload, as JSON for server responses and in memory for data frames
+def payloadSize(payload):
+    if payload is None:
+        return 0
+    if isinstance(payload, pd.DataFrame):
+        return int(payload.memory_usage(deep=True).sum())
+    if isinstance(payload, (bytes, bytearray)):
+        return len(payload)
+    try:
+        return len(json.dumps(payload, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+# timing of one call inside a stage, payload() records the size of what it returned or wrote
+class StageCall:
+
+    def __init__(self):
+        self.size = 0
+
+    def payload(self, payload):
+        self.size = payloadSize(payload)
+
+
+# call yielded by stages while profiling is disabled, payloads are not sized
+class NullCall:
+
+    size = 0
+
+    def payload(self, payload):
+        pass
+
+
+NULL_CALL = NullCall()
+
+
+# records the latency and payload of every call to a stage, labelled with the feature and batch being processed
+# the seconds of a call are its self time, the time spent in the stages nested in it is only counted by those stages
+class Profiler:
+
+    def __init__(self):
+        self.enabled = False
+        self.records = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.batch = None
+
+    # label the calls made by the current thread with a feature
+    def setFeature(self, feature):
+        self.local.feature = feature
+
+    # label the calls made by all threads with a batch
+    def setBatch(self, batch):
+        self.batch = batch
+
+    def record(self, stage, seconds, size=0):
+        with self.lock:
+            self.records.append((stage, seconds, size, getattr(self.local, 'feature', None), self.batch))
+
+    def clear(self):
+        with self.lock:
+            self.records = []
+
+    # records as a data frame with columns stage, seconds, bytes, feature and batch
+    def toDataFrame(self):
+        with self.lock:
+            records = pd.DataFrame(self.records, columns=['stage', 'seconds', 'bytes', 'feature', 'batch'], dtype=object)
+        # object columns keep feature labels as given instead of casting them to float next to missing labels
+        return records.astype({'seconds': float, 'bytes': int})
+
+    # latency statistics, histogram and bytes of each stage, and the seconds spent in each stage per feature and per batch
+    def report(self):
+        records = self.toDataFrame()
+        stages = {}
+        for stage, calls in records.groupby('stage'):
+            milliseconds = calls['seconds'].to_numpy() * 1000
+            counts = np.histogram(milliseconds, bins=[0] + HISTOGRAM_MS)[0]
+            stages[stage] = {'calls': len(calls), 'seconds': float(calls['seconds'].sum()),
+                             'mean_ms': float(milliseconds.mean()), 'p50_ms': float(np.percentile(milliseconds, 50)),
+                             'p90_ms': float(np.percentile(milliseconds, 90)), 'p99_ms': float(np.percentile(milliseconds, 99)),
+                             'max_ms': float(milliseconds.max()), 'bytes': int(calls['bytes'].sum()),
+                             'histogram_ms': {str(bound): int(count) for bound, count in zip(HISTOGRAM_MS, counts) if count}}
+        breakdown = lambda key: {str(label): calls.groupby('stage')['seconds'].sum().to_dict()
+                                 for label, calls in records.dropna(subset=[key]).groupby(key)}
+        return {'stages': stages, 'features': breakdown('feature'), 'batches': breakdown('batch')}
+
+    # write the report as JSON, or as CSV with one row per stage, feature stage and batch stage
+    def writeReport(self, fileName):
+        report = self.report()
+        if fileName.lower().endswith('.csv'):
+            with open(fileName, 'w', newline='') as fp:
+                writer = csv.writer(fp)
+                writer.writerow(['scope', 'label', 'stage', 'calls', 'seconds', 'p50_ms', 'p90_ms', 'max_ms', 'bytes'])
+                for stage, summary in report['stages'].items():
+                    writer.writerow(['stage', '', stage, summary['calls'], summary['seconds'], summary['p50_ms'],
+                                     summary['p90_ms'], summary['max_ms'], summary['bytes']])
+                for scope in ['features', 'batches']:
+                    for label, seconds in report[scope].items():
+                        for stage, total in seconds.items():
+                            writer.writerow([scope[:-1] if scope == 'features' else 'batch', label, stage, '', total, '', '', '', ''])
+        else:
+            with open(fileName, 'w') as fp:
+                json.dump(report, fp, indent=2)
+        return fileName
+
+
+profiler = Profiler()
+
+
+# start recording, patchEE also wraps task start/status and ee.data.getAsset/listAssets of an ee module
+def enable(patchEE=None):
+    profiler.enabled = True
+    if patchEE is not None:
+        instrumentEE(patchEE)
+
+
+def disable():
+    profiler.enabled = False
+
+
+# time the calls in a with block as a stage when profiling is enabled
+# stages nest per thread, the time of a nested stage is subtracted from the stage enclosing it
+@contextmanager
+def stage(name):
+    if not profiler.enabled:
+        yield NULL_CALL
+        return
+    call = StageCall()
+    nested = profiler.local.__dict__.setdefault('nested', [])
+    nested.append(0.0)
+    start = time.perf_counter()
+    try:
+        yield call
+    finally:
+        seconds = time.perf_counter() - start
+        profiler.record(name, seconds - nested.pop(), call.size)
+        if nested:
+            nested[-1] += seconds
+
+
+# wrap a function so each call is timed as a stage with the size of its result
+def profiledFunction(name, function):
+    def wrapper(*args, **kwargs):
+        with stage(name) as call:
+            result = function(*args, **kwargs)
+            call.payload(result)
+        return result
+    wrapper.profiled = True
+    return wrapper
+
+
+# wrap the requests of an ee module that do not go through toolsEE
+def instrumentEE(ee):
+    for owner, name, stageName in [(ee.batch.Task, 'start', 'Task.start'), (ee.batch.Task, 'status', 'Task.status'),
+                                   (ee.data, 'getAsset', 'getAsset'), (ee.data, 'listAssets', 'listAssets')]:
+        function = getattr(owner, name)
+        if not getattr(function, 'profiled', False):
+            setattr(owner, name, profiledFunction(stageName, function))
@@ -25,21 +25,45 @@ def scaleBands(bandList, scaleList, offsetList,image):
     return image.addBands(image.select(bandList).multiply(ee.Image.constant(scaleList)).add(ee.Image.constant(offsetList)).rename(bandList), overwrite = True)
 
 
+# code image bands (after the three angle bands) into a single band used to look up the algorithm domain
+def makeDomainCode(bandList,image):
+    bandList = ee.List(bandList).slice(3)
+    image = ee.Image(image)
+    return image.select(bandList).multiply(ee.Image.constant(ee.Number(10))).ceil().mod(ee.Number(10)).uint8()\
+                    .multiply(ee.Image.constant(ee.List.sequence(0,bandList.length().subtract(1)).map(lambda value:
+                            ee.Number(10).pow(ee.Number(value)))))\
+                    .reduce("sum")
+
+
 # determine if inputs fall in domain of algorithm
-# need to be updated to allow for the domain to vary with partition
+# see invalidInputPartition for a domain that varies with partition
 def invalidInput(sl2pDomain,bandList,image):
     sl2pDomain = ee.FeatureCollection(sl2pDomain).aggregate_array("DomainCode").sort()
-    bandList = ee.List(bandList).slice(3)
     image = ee.Image(image)
 
     # code image bands into a single band and compare to valid codes to make QC band
-    image = image.addBands(image.select(bandList).multiply(ee.Image.constant(ee.Number(10))).ceil().mod(ee.Number(10)).uint8()\
-                    .multiply(ee.Image.constant(ee.List.sequence(0,bandList.length().subtract(1)).map(lambda value:
-                            ee.Number(10).pow(ee.Number(value)))))\
-                    .reduce("sum").remap(sl2pDomain, ee.List.repeat(0, sl2pDomain.length()),1).rename("QC"))
+    image = image.addBands(makeDomainCode(bandList,image).remap(sl2pDomain, ee.List.repeat(0, sl2pDomain.length()),1).rename("QC"))
     return image
 
 
+# determine if inputs fall in the domain of the network used for each pixel
+# sl2pDomains is a list of domain feature collections indexed by networkID, the image needs a networkID band
+def invalidInputPartition(sl2pDomains,bandList,image):
+    sl2pDomains = ee.List(sl2pDomains)
+    image = ee.Image(image)
+    domainCode = makeDomainCode(bandList,image)
+    networkID = image.select('networkID')
+
+    # compare codes to the valid codes of each network, keeping only pixels of that network
+    def remapDomain(netIndex):
+        netIndex = ee.Number(netIndex).int()
+        sl2pDomain = ee.FeatureCollection(sl2pDomains.get(netIndex)).aggregate_array("DomainCode").sort()
+        return domainCode.remap(sl2pDomain, ee.List.repeat(0, sl2pDomain.length()),1).updateMask(networkID.eq(netIndex))
+
+    imageQC = ee.ImageCollection(ee.List.sequence(0,sl2pDomains.size().subtract(1)).map(remapDomain)).max().rename("QC")
+    return image.addBands(imageQC)
+
+
 # reduce all bands of input image to 20 m
 def reduceTo20m(input_image):
     image = ee.Image(input_image)
@@ -0,0 +1,131 @@
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+import ee
+import numpy as np
+
+
+# ------------------------------------------------------
+# Adaptive temporal windows for Earth Engine requests:
+# ------------------------------------------------------
+# fragments of Earth Engine error messages that a shorter date window can avoid
+SPLIT_ERRORS = ['memory limit exceeded', 'out of memory', 'computation timed out', 'timed out', 'deadline exceeded',
+                'too many pixels']
+
+
+# True if an exception is an Earth Engine memory or timeout error
+def isSplitError(error):
+    return isinstance(error, ee.EEException) and any(message in str(error).lower() for message in SPLIT_ERRORS)
+
+
+# bucket of a site area in m2, sites within a factor of two of each other share a bucket
+def areaBucket(area):
+    if area is None or np.isnan(area):
+        return None
+    return int(np.floor(np.log2(max(area, 1.0))))
+
+
+# split a period into date windows, starting with windows of initialDays and halving a window
+# only when Earth Engine runs out of memory or time on it
+# the window length that worked is remembered per key, e.g. (collection, areaBucket(area))
+# with the dates of the candidate scenes of the period (see toolsCatalog), days without scenes are left out of the windows
+# and a window holds at most the number of scenes remembered for the key
+class WindowPlanner:
+
+    def __init__(self, initialDays=366, minDays=1):
+        self.initialDays = initialDays
+        self.minDays = minDays
+        self.windowDays = {}
+        self.windowScenes = {}
+        self.splits = 0
+        self.lock = threading.Lock()
+
+    # length in days of the first windows planned for a key
+    def getWindowDays(self, key):
+        with self.lock:
+            return self.windowDays.get(key, self.initialDays)
+
+    # maximum number of scenes in a window planned for a key, None when no window has failed
+    def getWindowScenes(self, key):
+        with self.lock:
+            return self.windowScenes.get(key)
+
+    # remember that windows of days, holding scenes candidate scenes when known, failed for a key, splits counts the failures
+    def recordFailure(self, key, days, scenes=None):
+        with self.lock:
+            self.splits += 1
+            self.windowDays[key] = min(self.windowDays.get(key, self.initialDays), max(days // 2, self.minDays))
+            if scenes is not None:
+                self.windowScenes[key] = min(self.windowScenes.get(key, scenes), max(scenes // 2, 1))
+
+    # consecutive (start, end) windows covering startDate to endDate, end excluded
+    # with sceneDates, windows only cover the days with scenes, consecutive days are batched in one window up to the
+    # window length and number of scenes of the key, no window is planned when there are no scenes
+    def planWindows(self, startDate, endDate, key=None, sceneDates=None):
+        step = timedelta(days=self.getWindowDays(key))
+        if sceneDates is not None:
+            return self.planSceneWindows(startDate, endDate, step, self.getWindowScenes(key), sceneDates)
+        windows = []
+        start = startDate
+        while True:
+            end = min(start + step, endDate)
+            windows.append((start, end))
+            if end >= endDate:
+                return windows
+            start = end
+
+    def planSceneWindows(self, startDate, endDate, step, maxScenes, sceneDates):
+        days = {}
+        for date in sceneDates:
+            if startDate <= date < endDate:
+                day = datetime.combine(date.date(), datetime.min.time())
+                days[day] = days.get(day, 0) + 1
+        windows = []
+        for day in sorted(days):
+            start = max(day, startDate)
+            end = min(day + timedelta(days=1), endDate)
+            if windows and end - windows[-1][0] <= step and (maxScenes is None or windows[-1][2] + days[day] <= maxScenes):
+                windows[-1] = (windows[-1][0], end, windows[-1][2] + days[day])
+            else:
+                windows.append((start, end, days[day]))
+        return [(start, end) for start, end, scenes in windows]
+
+    # number of sceneDates from start to end, None when the scenes are unknown
+    def countScenes(self, start, end, sceneDates):
+        return None if sceneDates is None else sum(start <= date < end for date in sceneDates)
+
+    # call fetch(start, end) on each window and return the results in date order
+    # a window that fails with a memory or timeout error is split in half and its halves fetched instead,
+    # windows still pending are replanned with the shorter length
+    # sceneDates are the dates of the candidate scenes from startDate to endDate, windows without scenes are not fetched
+    def run(self, startDate, endDate, fetch, key=None, sceneDates=None):
+        pending = deque(self.planWindows(startDate, endDate, key, sceneDates))
+        results = []
+        while pending:
+            start, end = pending.popleft()
+            maxScenes = self.getWindowScenes(key)
+            scenes = self.countScenes(start, end, sceneDates)
+            if (end - start) > timedelta(days=self.getWindowDays(key)) or (scenes is not None and maxScenes is not None and scenes > maxScenes):
+                windows = self.planWindows(start, end, key, sceneDates)
+                if windows != [(start, end)]:
+                    pending.extendleft(reversed(windows))
+                    continue
+            try:
+                results.append(fetch(start, end))
+            except Exception as error:
+                days = (end - start) / timedelta(days=1)
+                if not isSplitError(error) or days / 2 < self.minDays:
+                    raise
+                print('Splitting window %s to %s: %s' % (start, end, error))
+                self.recordFailure(key, days, scenes)
+                middle = start + (timedelta(days=days // 2) if days >= 2 else (end - start) / 2)
+                halves = [(start, middle), (middle, end)]
+                if sceneDates is not None:
+                    halves = [window for half in halves for window in self.planWindows(half[0], half[1], key, sceneDates)]
+                pending.extendleft(reversed(halves))
+        return results
+
+
+# planner shared by the LEAF sampling functions
+planner = WindowPlanner()
@@ -0,0 +1,107 @@
+"""
+Benchmark LEAF sampleSites offline
+
+Runs LEAF.sampleSites against the fake Earth Engine backend in
+gee_helpers.fake_ee, so the client-side cost of sampling can be
+measured and compared between changes without a GEE account. Every
+request to the fake server waits for the configured latency.
+
+Outputs:
+- Round trips, payload bytes and wall time per feature, printed
+  and optionally saved as JSON.
+- With --fault-rate or --faults, the retries, window splits and
+  pixel budget reductions made to recover from injected faults.
+- With --profile, latency histograms and payload sizes per stage
+  and per feature (see leaftoolbox/toolsProfile.py).
+
+Usage:
+- python scripts/benchmark_sampler.py --features 20 --latency 0.05
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+from gee_helpers import fake_ee
+
+parser = argparse.ArgumentParser(description = 'Benchmark LEAF.sampleSites against a fake Earth Engine backend')
+parser.add_argument('--features', type = int, default = 20, help = 'features in the site asset')
+parser.add_argument('--pixels', type = int, default = 100, help = 'pixels returned by each sample request')
+parser.add_argument('--period-days', type = int, default = 365, help = 'days between the start and end date of a feature')
+parser.add_argument('--latency', type = float, default = 0.0, help = 'seconds added to each request')
+parser.add_argument('--workers', type = int, default = 1, help = 'max_workers of sampleSites')
+parser.add_argument('--image-collection', default = 'LANDSAT/LC08/C02/T1_L2')
+parser.add_argument('--variable', default = 'Surface_Reflectance')
+parser.add_argument('--output', default = None, help = 'JSON file for the report')
+parser.add_argument('--result-cache', default = None, help = 'result cache file, a second run with the same file makes no requests')
+parser.add_argument('--window-days', type = int, default = None, help = 'initial length in days of the date windows')
+parser.add_argument('--scene-catalog', default = None, help = 'scene catalog file, windows without candidate scenes are skipped')
+parser.add_argument('--fault-rate', type = float, default = 0.0, help = 'probability that a request fails with an injected fault')
+parser.add_argument('--faults', nargs = '*', default = None, choices = list(fake_ee.FAULTS),
+                    help = 'faults raised in turn by the first requests, e.g. rate_limit transient memory')
+parser.add_argument('--retry-delay', type = float, default = 0.01, help = 'base delay in seconds of the retry backoff')
+parser.add_argument('--profile', default = None, help = 'JSON or CSV file for the per-stage latency profile')
+args = parser.parse_args()
+
+backend = fake_ee.install(latency = args.latency, num_features = args.features, num_pixels = args.pixels,
+                          period_days = args.period_days, fault_rate = args.fault_rate, faults = args.faults)
+
+from leaftoolbox import LEAF
+from leaftoolbox import SL2PV0
+from leaftoolbox import toolsEE
+from leaftoolbox import toolsProfile
+from leaftoolbox import toolsWindows
+
+if args.profile:
+    toolsProfile.enable(patchEE = fake_ee)
+if args.result_cache:
+    toolsEE.setResultCache(args.result_cache)
+toolsEE.setRetryPolicy(baseDelay = args.retry_delay)
+if args.window_days:
+    toolsWindows.planner.initialDays = args.window_days
+
+with tempfile.TemporaryDirectory() as output_dir:
+    start_time = time.perf_counter()
+    sites_dictionary = LEAF.sampleSites(
+        ['projects/fake/assets/sites'],
+        imageCollectionName = args.image_collection,
+        algorithm = SL2PV0,
+        variableName = args.variable,
+        maxCloudcover = 90,
+        outputScaleSize = 30,
+        inputScaleSize = 30,
+        bufferSpatialSize = 0,
+        numPixels = args.pixels,
+        outputPathName = output_dir,
+        feature_range = [0, args.features],
+        max_workers = args.workers,
+        scene_catalog = args.scene_catalog
+    )
+    wall_time = time.perf_counter() - start_time
+
+num_features = sum(len(result) for result in sites_dictionary.values())
+report = backend.report()
+report.update({
+    'features': num_features,
+    'wall_seconds': wall_time,
+    'requests_per_feature': report['total_requests'] / max(num_features, 1),
+    'bytes_per_feature': report['total_bytes'] / max(num_features, 1),
+    'wall_seconds_per_feature': wall_time / max(num_features, 1),
+    'latency': args.latency,
+})
+report['retries'] = toolsEE.retryPolicy.report()
+report['window_splits'] = toolsWindows.planner.splits
+if args.result_cache:
+    report['result_cache'] = toolsEE.resultCache.stats()
+print(json.dumps(report, indent = 2))
+if args.output:
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent = 2)
+if args.profile:
+    toolsProfile.profiler.writeReport(args.profile)
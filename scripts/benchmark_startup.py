@@ -0,0 +1,45 @@
+"""
+Benchmark LEAF toolbox startup
+
+Measures the client-side cost of importing LEAF and of getting the
+collection and network options for a single sensor, compared with
+building the options of every sensor. Only the entries that are
+accessed are built since the option registries are lazy.
+
+Usage:
+- python scripts/benchmark_startup.py [image collection name]
+"""
+
+import os
+import sys
+import time
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+from gee_helpers.gee_helpers import initialize_gee
+
+IMAGE_COLLECTION_NAME = sys.argv[1] if len(sys.argv) > 1 else 'LANDSAT/LC08/C02/T1_L2'
+VARIABLE_NAME = 'LAI'
+
+
+def timed(label, function):
+    start_time = time.perf_counter()
+    result = function()
+    print(f'{label}: {(time.perf_counter() - start_time) * 1000:.1f} ms')
+    return result
+
+
+initialize_gee()
+
+timed('Import LEAF', lambda: __import__('leaftoolbox.LEAF'))
+from leaftoolbox import dictionariesSL2P
+from leaftoolbox import SL2PV0
+
+collection_options = timed('Collection options registry', lambda: dictionariesSL2P.make_collection_options(SL2PV0))
+net_options = timed('Network options registry', lambda: dictionariesSL2P.make_net_options())
+timed(f'Options for {IMAGE_COLLECTION_NAME}', lambda: (collection_options[IMAGE_COLLECTION_NAME],
+                                                        net_options[VARIABLE_NAME][IMAGE_COLLECTION_NAME]))
+timed('Options for every sensor and variable', lambda: (collection_options.values(),
+                                                        [variable.values() for variable in net_options.values()]))
+print('Collection options built:', collection_options.built())
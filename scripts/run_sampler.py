@@ -49,7 +49,7 @@ print("Parent directory: ", parent_dir)
 sys.path.append(parent_dir)
 
 # Import functions from custom helper module
-from gee_helpers.gee_helpers import initialize_gee, get_feature_collection
+from gee_helpers.gee_helpers import initialize_gee, get_feature_collection, assets_exists
 
 # PARAMETERS
 # This first random_sample_1000_filtered_polygons works due to the transformation
@@ -62,6 +62,12 @@ from gee_helpers.gee_helpers import initialize_gee, get_feature_collection
 POLYGONS_FEATURE_COLLECTION = 'projects/ee-ronnyale/assets/random_sample_1000_filtered_reference_buffers_date_formatted'
 PROJECT_TO_SAVE_ASSETS = 'projects/ee-ronnyale/assets/'
 DATA_OUTPUT_DIR = 'data_buffers/'
+# Set to a .json or .csv file name to save request latencies and payload sizes per stage, feature and batch
+PROFILE_REPORT = None
+# Set to a file name to reuse the results of identical queries (asset sizes, feature properties, samples)
+# between runs, results older than RESULT_CACHE_TTL seconds are requested again
+RESULT_CACHE = None
+RESULT_CACHE_TTL = 7 * 24 * 3600
 
 initialize_gee()
 
@@ -74,11 +80,19 @@ if module_path not in sys.path:
 
 from leaftoolbox import LEAF
 from leaftoolbox import SL2PV0 
+from leaftoolbox import toolsEE
+from leaftoolbox import toolsProfile
+
+if RESULT_CACHE:
+    toolsEE.setResultCache(RESULT_CACHE, ttl = RESULT_CACHE_TTL)
+
+if PROFILE_REPORT:
+    toolsProfile.enable(patchEE = ee)
 
 # Start the process
 batch_size = 20
 polygon_collection = get_feature_collection(POLYGONS_FEATURE_COLLECTION)
-total_polygons = polygon_collection.size().getInfo()
+total_polygons = toolsEE.getInfo(polygon_collection.size())
 
 # Products to be processed
 image_collections = [
@@ -87,6 +101,9 @@ image_collections = [
     # {"name": "COPERNICUS/S2_SR_HARMONIZED", "label": "S2"}        
 ]
 
+# Batches that failed after the retries, they are sampled again on the next run
+failed_batches = []
+
 for collection in image_collections:
     image_collection_name = collection["name"]
     label = collection["label"]
@@ -100,24 +117,38 @@ for collection in image_collections:
         if os.path.exists(pickle_filename):
             print(f'Batch {start_index} for {label} already processed and saved. Skipping...')
             continue
+        toolsProfile.profiler.setBatch(f'{label}_{start_index}')
         batch = polygon_collection.toList(batch_size, start_index)
         batch_fc = ee.FeatureCollection(batch)
         batch_asset_id = f'{PROJECT_TO_SAVE_ASSETS}_temp_batch_{label}_{start_index}'
-        task = ee.batch.Export.table.toAsset(
-            collection = batch_fc,
-            description = f'export_batch_{label}_{start_index}',
-            assetId = batch_asset_id
-        )
-        print(f'Exporting batch {start_index} for {label} to GEE')
-        task.start()
-
-        # Avoid running if asset is not ready yet
-        while task.status()['state'] in ['READY', 'RUNNING']:
-            time.sleep(10)
-
+        # The start of an export is not retried: a start that fails after the task
+        # was submitted would export the batch twice. A batch whose start failed is
+        # left for the next run, which only exports it if its asset does not exist
+        if assets_exists(batch_asset_id):
+            print(f'Batch {start_index} for {label} already exported to GEE')
+        else:
+            task = ee.batch.Export.table.toAsset(
+                collection = batch_fc,
+                description = f'export_batch_{label}_{start_index}',
+                assetId = batch_asset_id
+            )
+            print(f'Exporting batch {start_index} for {label} to GEE')
+            try:
+                task.start()
+            except ee.EEException as error:
+                print(f'Export of batch {start_index} for {label} failed: {error}')
+                failed_batches.append(f'{label}_{start_index}')
+                continue
+
+            # Avoid running if asset is not ready yet, rate limit and server
+            # errors of the status requests are retried with backoff
+            while toolsEE.withRetries('Task.status', task.status)['state'] in ['READY', 'RUNNING']:
+                time.sleep(10)
+
+        # Features are written to the batch results as they complete
         start_time = time.time()
         if label in ["LC08", "LC09"]:
-          sites_dictionary = LEAF.sampleSites(
+          sampled_sites = LEAF.iterSampleSites(
               [batch_asset_id],
               imageCollectionName = image_collection_name,
               algorithm = SL2PV0,
@@ -129,7 +160,7 @@ for collection in image_collections:
               numPixels = 100
           )
         elif label == "S2":
-          sites_dictionary = LEAF.sampleSites(
+          sampled_sites = LEAF.iterSampleSites(
               [batch_asset_id],
               imageCollectionName = image_collection_name,
               algorithm = SL2PV0,
@@ -141,23 +172,34 @@ for collection in image_collections:
               bufferTemporalSize = ['2020-01-01','2020-12-01'],
               numPixels = 100
           )
-        end_time = time.time()
-        execution_time = end_time - start_time
-        print(f'Execution time for batch {start_index} with {label}: {execution_time} seconds')
 
-        # Extract and process results
-        outer_key = list(sites_dictionary.keys())[0]
-        first_item = sites_dictionary[outer_key]
+        # Extract and process results, a batch that still fails after the retries
+        # and window splits is left for the next run instead of stopping the others
         batch_results = []
+        try:
+            for feature, df in sampled_sites:
+                df['site'] = feature['wllst__']
+                batch_results.append(df)
+        except ee.EEException as error:
+            print(f'Batch {start_index} for {label} failed: {error}')
+            failed_batches.append(f'{label}_{start_index}')
+            continue
 
-        for item in range(len(first_item)):
-            df = first_item[item]['leaftoolbox.SL2PV0']
-            df['site'] = first_item[item]['feature']['wllst__']
-            batch_results.append(df)
+        end_time = time.time()
+        execution_time = end_time - start_time
+        print(f'Execution time for batch {start_index} with {label}: {execution_time} seconds')
 
         # Combine batch results
         combined_df = pd.concat(batch_results, ignore_index = True)
-        with open(pickle_filename, 'wb') as file:
+        with open(pickle_filename, 'wb') as file, toolsProfile.stage('pickle'):
             pickle.dump(combined_df, file)
         
         print(f'Batch {start_index} for {label} saved to {pickle_filename}')
+
+print('Request retries:', toolsEE.retryPolicy.report())
+if failed_batches:
+    print('Failed batches, run the script again to sample them:', failed_batches)
+if RESULT_CACHE:
+    print('Result cache:', toolsEE.resultCache.stats())
+if PROFILE_REPORT:
+    print(f'Profile saved to {toolsProfile.profiler.writeReport(PROFILE_REPORT)}')
@@ -0,0 +1,23 @@
+# Shared setup of the tests
+#
+# The tests run offline against the fake Earth Engine backend in
+# gee_helpers.fake_ee, installed as the ee module before leaftoolbox
+# is imported. The backend fixture gives each test a new backend with
+# the request counts at zero.
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from gee_helpers import fake_ee
+
+fake_ee.install()
+
+
+# fresh fake backend without latency, replaced for every test
+@pytest.fixture
+def backend():
+    return fake_ee.install()
@@ -0,0 +1,172 @@
+# Requests and sampled columns of leaftoolbox.LEAF
+#
+# The properties of the features of a site are fetched in a single
+# request, and aggregated samples have one column per band and
+# statistic of the aggregate reducer. Batches of sites are subsampled
+# site by site, features sampled in worker threads are only submitted
+# as earlier ones are consumed, and the ingredients of the product
+# collections are built once per run. The columns and calls are read
+# from the graphs built with the fake ee module.
+
+import itertools
+
+import ee
+import pandas as pd
+import pytest
+
+from gee_helpers import fake_ee
+from leaftoolbox import LEAF
+from leaftoolbox import SL2PV0
+
+SITE = 'projects/fake/assets/sites'
+
+# output names of the reducers combined by LEAF.aggregateReducer
+REDUCER_OUTPUTS = {'mean': lambda: ['mean'], 'median': lambda: ['median'], 'stdDev': lambda: ['stdDev'],
+                   'count': lambda: ['count'], 'percentile': lambda percentiles: ['p%d' % p for p in percentiles]}
+
+
+# list of the sorted features of a site, as built by LEAF.sampleSites
+def siteRecords():
+    sampleRecords = ee.FeatureCollection(SITE).sort('system:time_start', False)
+    return sampleRecords.toList(sampleRecords.size())
+
+
+# number the placeholders passed to mapped functions in creation order, a function is called before the
+# functions it maps itself so the outermost unbound placeholder of a mapped graph is the one of its function
+@pytest.fixture
+def numbered(monkeypatch):
+    numbers = itertools.count()
+    make = fake_ee.ComputedObject.make.__func__
+
+    def numberedMake(cls, op, *args, **kwargs):
+        obj = make(cls, op, *args, **kwargs)
+        if op == 'element':
+            obj.number = next(numbers)
+        return obj
+    monkeypatch.setattr(fake_ee.ComputedObject, 'make', classmethod(numberedMake))
+
+
+# placeholders of the mapped functions in a graph that are not bound to a value yet
+def placeholders(obj, bound):
+    if isinstance(obj, (list, tuple)):
+        return [placeholder for value in obj for placeholder in placeholders(value, bound)]
+    if not isinstance(obj, ee.ComputedObject):
+        return []
+    if obj.op == 'element':
+        return [] if id(obj) in bound else [obj]
+    return placeholders(list(obj.args) + [obj.receiver, obj.mapped], bound)
+
+
+# value of a list, string or reducer graph of the fake ee module, bandNames are the band names of every image
+# bound maps the placeholders of the enclosing mapped functions to the elements they stand for
+def evaluate(obj, bandNames, bound=None):
+    bound = bound or {}
+    if isinstance(obj, (list, tuple)):
+        return [evaluate(value, bandNames, bound) for value in obj]
+    if not isinstance(obj, ee.ComputedObject):
+        return obj
+    if obj.op == 'element':
+        return bound[id(obj)]
+    if obj.op == 'bandNames':
+        return list(bandNames)
+    args = [evaluate(arg, bandNames, bound) for arg in obj.args]
+    if obj.op in REDUCER_OUTPUTS:
+        return REDUCER_OUTPUTS[obj.op](*args)
+    if obj.op == 'String':
+        return args[0]
+    receiver = evaluate(obj.receiver, bandNames, bound)
+    if obj.op == 'map':
+        placeholder = min(placeholders(obj.mapped, bound), key=lambda placeholder: placeholder.number)
+        return [evaluate(obj.mapped, bandNames, {**bound, id(placeholder): item}) for item in receiver]
+    if obj.op in ('combine', 'cat'):
+        return receiver + args[0]
+    if obj.op == 'flatten':
+        return [value for values in receiver for value in values]
+    if obj.op == 'add':
+        return receiver + [args[0]]
+    if obj.op == 'getOutputs':
+        return receiver
+    raise NotImplementedError(obj.op)
+
+
+def test_prefetchFeatures_sends_a_single_request(backend):
+    numRecords, featureTable = LEAF.prefetchFeatures(siteRecords(), 2, 5)
+    assert backend.counts['getInfo'] == 1 and sum(backend.counts.values()) == 1
+    assert numRecords == backend.num_features
+    assert list(featureTable.index) == [2, 3, 4]
+    assert list(featureTable.columns) == ['feature', 'timeStart', 'timeEnd', 'area', 'bounds']
+    assert [feature['wllst__'] for feature in featureTable['feature']] == \
+        [backend.feature_properties(n)['wllst__'] for n in range(2, 5)]
+    backend.reset_counts()
+    numRecords, featureTable = LEAF.prefetchFeatures(siteRecords())
+    assert backend.counts['getInfo'] == 1 and len(featureTable) == numRecords
+
+
+def test_aggregate_samples_one_column_per_band_and_statistic(backend, numbered):
+    productCollection = ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED')
+    statistics = ['mean', 'median', 'stdDev', 'p10', 'p25', 'p75', 'p90', 'count']
+    assert evaluate(LEAF.aggregateReducer().getOutputs(), []) == statistics
+    sampleData, outputNames = LEAF.sampleProductTable(productCollection, ee.Feature(SITE), 20, aggregate=True)
+    assert evaluate(outputNames, ['LAI', 'QC']) == \
+        ['LAI_' + statistic for statistic in statistics] + ['QC_' + statistic for statistic in statistics] + ['date']
+    sampleData, outputNames = LEAF.sampleProductTable(productCollection, ee.Feature(SITE), 20)
+    assert evaluate(outputNames, ['LAI', 'QC']) == ['LAI', 'QC']
+    assert sum(backend.counts.values()) == 0
+
+
+# calls of a method in a graph of the fake ee module, including the graphs of mapped functions
+def calls(obj, op):
+    if isinstance(obj, (list, tuple)):
+        return [call for value in obj for call in calls(value, op)]
+    if isinstance(obj, dict):
+        return calls(list(obj.values()), op)
+    if not isinstance(obj, ee.ComputedObject):
+        return []
+    return ([obj] if obj.op == op else []) + calls(list(obj.args) + [obj.kwargs, obj.receiver, obj.mapped], op)
+
+
+def test_batch_samples_are_subsampled_per_site(backend, tmp_path):
+    productCollection = ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED')
+    sites = ee.FeatureCollection(SITE)
+    sampleData = LEAF.sampleProductTableSites(productCollection, sites, 20, 'site')[0]
+    assert len(calls(sampleData, 'sampleRegions')) == 1 and not calls(sampleData, 'sample')
+    for subsampling in [{'numPixels': 5}, {'factor': 0.25}, {'factor': 0.25, 'numPixels': 5}]:
+        sampleData = LEAF.sampleProductTableSites(productCollection, sites, 20, 'site', **subsampling)
+        sample, = calls(sampleData, 'sample')
+        assert not calls(sampleData, 'sampleRegions')
+        assert {name: sample.kwargs[name] for name in ['numPixels', 'factor'] if name in sample.kwargs} == \
+            ({'numPixels': 5} if 'numPixels' in subsampling else subsampling)
+        assert calls(sampleData, 'set')[0].args[0] == 'site'
+    results = LEAF.sampleSitesBatch([SITE], 'COPERNICUS/S2_SR_HARMONIZED', SL2PV0, feature_range=[0, 3],
+                                    bufferTemporalSize=['2015-06-01', '2015-08-01'], numPixels=5,
+                                    outputPathName=str(tmp_path))
+    assert len(results[SITE]) == 3 and backend.counts['computeFeatures'] > 0
+
+
+def test_iterSiteFeatures_keeps_at_most_max_workers_features_pending(monkeypatch):
+    started = []
+    monkeypatch.setattr(LEAF, 'sampleSiteFeature', lambda sampleRecords, n, *args: started.append(n) or n * 10)
+    features = list(range(10))
+    iterator = LEAF.iterSiteFeatures(None, pd.DataFrame(index=features), features, len(features), 'collection', SL2PV0,
+                                     'LAI', {}, {}, 100, 30, 30, 0, [0, 0], 1, max_workers=3)
+    for n, siteResult in iterator:
+        assert siteResult == n * 10
+        assert max(started) < n + 3
+    assert sorted(started) == features
+
+
+def test_ingredients_are_built_once_per_run(backend, monkeypatch, tmp_path):
+    builds = []
+    makeLegendRemap = LEAF.toolsNets.makeLegendRemap
+    monkeypatch.setattr(LEAF.toolsNets, 'makeLegendRemap', lambda *args: builds.append(args) or makeLegendRemap(*args))
+    collectionOptions = LEAF.dictionariesSL2P.make_collection_options(SL2PV0)['COPERNICUS/S2_SR_HARMONIZED']
+    networkOptions = LEAF.dictionariesSL2P.make_net_options()
+    LEAF.ingredientCache.clear()
+    for variableName in ['LAI', 'fAPAR']:
+        LEAF.makeProductCollection(collectionOptions, networkOptions[variableName]['COPERNICUS/S2_SR_HARMONIZED'], variableName,
+                                   ee.Geometry.Point([-113.0, 53.0]), '2015-06-01', '2015-07-01', 100, 30)
+    assert len(builds) == 1
+    for run in range(2):
+        LEAF.sampleSites([SITE], 'COPERNICUS/S2_SR_HARMONIZED', SL2PV0, outputPathName=str(tmp_path), feature_range=[0, 3])
+        assert len(builds) == 2 + run
+        assert LEAF.ingredientCache.stats()['entries'] == 0
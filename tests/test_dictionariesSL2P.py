@@ -0,0 +1,31 @@
+# Option registries of leaftoolbox.dictionariesSL2P
+#
+# Each call returns its own copy of the memoized registries, entries
+# are built once and shared, and edits made by a caller are not seen
+# by the others.
+
+from leaftoolbox import SL2PV0
+from leaftoolbox import dictionariesSL2P
+
+COLLECTION = 'COPERNICUS/S2_SR_HARMONIZED'
+
+
+def test_collection_options_edits_do_not_leak():
+    options = dictionariesSL2P.make_collection_options(SL2PV0)
+    options[COLLECTION]['name'] = 'edited'
+    options[COLLECTION]['extra'] = 1
+    options['other'] = {}
+    other = dictionariesSL2P.make_collection_options(SL2PV0)
+    assert other[COLLECTION]['name'] == COLLECTION and 'extra' not in other[COLLECTION]
+    assert 'other' not in other
+    assert other[COLLECTION]['partition'] is options[COLLECTION]['partition']
+    assert COLLECTION in dictionariesSL2P.collectionOptionsCache[SL2PV0.__name__].built()
+
+
+def test_net_options_edits_do_not_leak():
+    options = dictionariesSL2P.make_net_options()
+    options['LAI'][COLLECTION]['inputBands'] = []
+    del options['fAPAR'][COLLECTION]
+    other = dictionariesSL2P.make_net_options()
+    assert other['LAI'][COLLECTION]['inputBands'] and COLLECTION in other['fAPAR']
+    assert other['LAI'][COLLECTION]['outmin'] is options['LAI'][COLLECTION]['outmin']
@@ -0,0 +1,125 @@
+# Result caches of leaftoolbox.toolsCache and leaftoolbox.toolsEE
+#
+# Entries older than the TTL are rebuilt, the least recently used
+# entries are evicted above the size limit, and identical queries
+# made through toolsEE are only sent to the server once.
+
+import ee
+import pytest
+
+from leaftoolbox import toolsCache
+from leaftoolbox import toolsEE
+
+
+# replacement of time.time in toolsCache that only moves when advanced
+class Clock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(toolsCache.time, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def resultCache(tmp_path):
+    toolsEE.setResultCache(str(tmp_path / 'results.sqlite'))
+    yield toolsEE.resultCache
+    toolsEE.setResultCache(None)
+
+
+def test_runcache_builds_each_key_once():
+    cache = toolsCache.RunCache()
+    builds = []
+    for key in ['a', 'b', 'a', 'a']:
+        cache.get(key, lambda: builds.append(key) or key.upper())
+    assert builds == ['a', 'b']
+    assert cache.stats() == {'hits': 2, 'misses': 2, 'entries': 2}
+
+
+def test_diskcache_rebuilds_entries_older_than_ttl(tmp_path, clock):
+    cache = toolsCache.DiskCache(str(tmp_path / 'cache.sqlite'), ttl=60)
+    builds = []
+    build = lambda: builds.append(clock.now) or len(builds)
+    assert cache.get('key', build) == 1
+    clock.now += 59
+    assert cache.get('key', build) == 1
+    clock.now += 2
+    assert cache.get('key', build) == 2
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+    cache.close()
+
+
+def test_diskcache_is_shared_between_runs(tmp_path, clock):
+    fileName = str(tmp_path / 'cache.sqlite')
+    cache = toolsCache.DiskCache(fileName)
+    cache.put('key', {'value': [1, 2]})
+    cache.close()
+    cache = toolsCache.DiskCache(fileName)
+    assert cache.get('key', lambda: pytest.fail('cached value rebuilt')) == {'value': [1, 2]}
+    cache.close()
+
+
+def test_diskcache_evicts_least_recently_used(tmp_path, clock):
+    value = b'x' * 1000
+    cache = toolsCache.DiskCache(str(tmp_path / 'cache.sqlite'), maxBytes=3500)
+    for key in ['a', 'b', 'c']:
+        clock.now += 1
+        cache.put(key, value)
+    clock.now += 1
+    cache.get('a', lambda: pytest.fail('cached value rebuilt'))
+    clock.now += 1
+    cache.put('d', value)
+    stats = cache.stats()
+    assert stats['evictions'] == 1 and stats['entries'] == 3 and stats['bytes'] <= 3500
+    rebuilt = []
+    for key in ['a', 'c', 'd', 'b']:
+        cache.get(key, lambda: rebuilt.append(key) or value)
+    assert rebuilt == ['b']
+    cache.close()
+
+
+def test_diskcache_keeps_a_running_total_of_stored_bytes(tmp_path, clock):
+    fileName = str(tmp_path / 'cache.sqlite')
+    cache = toolsCache.DiskCache(fileName, maxBytes=50000)
+    for n in range(100):
+        clock.now += 1
+        cache.put('key%d' % (n % 80), b'x' * (1000 + n))
+        assert cache.size == cache.stats()['bytes'] <= 50000
+    assert cache.stats()['evictions'] > 32
+    entries = cache.stats()['entries']
+    assert {key for key, in cache.connection.execute('SELECT key FROM entries')} == {'key%d' % (n % 80) for n in range(100 - entries, 100)}
+    plan = cache.connection.execute('EXPLAIN QUERY PLAN SELECT key, size FROM entries ORDER BY accessed LIMIT 32').fetchall()
+    assert any('entries_accessed' in row[-1] for row in plan)
+    size = cache.size
+    cache.close()
+    cache = toolsCache.DiskCache(fileName, maxBytes=50000)
+    assert cache.size == size
+    cache.clear()
+    assert cache.size == cache.stats()['bytes'] == 0
+    cache.close()
+
+
+def test_getinfo_sends_identical_queries_once(backend, resultCache):
+    size = lambda: ee.FeatureCollection('projects/fake/assets/sites').size()
+    assert toolsEE.getInfo(size()) == toolsEE.getInfo(size()) == backend.num_features
+    assert backend.counts['getInfo'] == 1
+    toolsEE.getInfo(ee.FeatureCollection('projects/fake/assets/other').size())
+    toolsEE.getInfo(size(), cache=False)
+    assert backend.counts['getInfo'] == 3
+    assert resultCache.stats()['hits'] == 1
+
+
+def test_computefeatures_results_are_cached(backend, resultCache):
+    samples = lambda: ee.FeatureCollection(ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED').first().sample(numPixels=10))
+    first = toolsEE.computeFeatures(samples())
+    second = toolsEE.computeFeatures(samples())
+    assert backend.counts['computeFeatures'] == 1
+    assert first.equals(second)
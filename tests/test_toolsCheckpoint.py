@@ -0,0 +1,78 @@
+# Checkpoints of sampled features and resumed runs of LEAF.sampleSites
+#
+# A run is interrupted after some features, and resuming it must only
+# sample the features missing from its checkpoint while returning all
+# of them in feature order.
+
+import pandas as pd
+import pytest
+
+from leaftoolbox import LEAF
+from leaftoolbox import SL2PV0
+from leaftoolbox import toolsCheckpoint
+
+SITE = 'projects/fake/assets/sites'
+
+
+def test_checkpoint_stores_features_in_order(tmp_path):
+    checkpoint = toolsCheckpoint.Checkpoint(str(tmp_path / 'run_checkpoint.sqlite'))
+    for n in [2, 0, 1]:
+        checkpoint.append(SITE, n, {'feature': {'id': n}, 'SL2PV0': pd.DataFrame({'date': [n]})})
+    checkpoint.append(SITE, 1, {'feature': {'id': 1}, 'SL2PV0': pd.DataFrame({'date': [10]})})
+    assert checkpoint.completed(SITE) == {0, 1, 2}
+    assert checkpoint.completed('other') == set()
+    results = checkpoint.load(SITE)
+    assert [result['feature']['id'] for result in results] == [0, 1, 2]
+    assert results[1]['SL2PV0']['date'].tolist() == [10]
+    assert [result['feature']['id'] for result in checkpoint.load(SITE, 1, 2)] == [1]
+    checkpoint.clear(SITE)
+    assert checkpoint.completed(SITE) == set()
+    checkpoint.close()
+
+
+def sampleSites(outputPathName, resume=False):
+    return LEAF.sampleSites([SITE], 'COPERNICUS/S2_SR_HARMONIZED', SL2PV0, variableName='LAI', maxCloudcover=90,
+                            outputPathName=str(outputPathName), feature_range=[0, 6], resume=resume)
+
+
+# indices of the features sampled by LEAF, a feature listed in sampled['fail'] raises an error instead
+@pytest.fixture
+def sampled(monkeypatch):
+    sampled = {'features': [], 'fail': None}
+    sampleSiteFeature = LEAF.sampleSiteFeature
+
+    def recordFeature(sampleRecords, n, *args, **kwargs):
+        if n == sampled['fail']:
+            raise RuntimeError('interrupted at feature %s' % n)
+        sampled['features'].append(n)
+        return sampleSiteFeature(sampleRecords, n, *args, **kwargs)
+    monkeypatch.setattr(LEAF, 'sampleSiteFeature', recordFeature)
+    return sampled
+
+
+def test_resume_only_samples_missing_features(backend, sampled, tmp_path):
+    sampled['fail'] = 3
+    with pytest.raises(RuntimeError):
+        sampleSites(tmp_path)
+    checkpointFile, = tmp_path.glob('*_checkpoint.sqlite')
+    checkpoint = toolsCheckpoint.Checkpoint(str(checkpointFile))
+    assert checkpoint.completed(SITE) == {0, 1, 2}
+    checkpoint.close()
+
+    sampled.update({'features': [], 'fail': None})
+    results = sampleSites(tmp_path, resume=True)[SITE]
+    assert sampled['features'] == [3, 4, 5]
+    assert len(results) == 6
+    assert [result['feature']['wllst__'] for result in results] == \
+        [backend.feature_properties(n)['wllst__'] for n in range(6)]
+    assert all(not result[SL2PV0.__name__].empty for result in results)
+
+
+def test_run_without_resume_samples_every_feature_again(backend, sampled, tmp_path):
+    sampleSites(tmp_path)
+    sampled['features'] = []
+    assert len(sampleSites(tmp_path)[SITE]) == 6
+    assert sampled['features'] == list(range(6))
+    sampled['features'] = []
+    sampleSites(tmp_path, resume=True)
+    assert sampled['features'] == []
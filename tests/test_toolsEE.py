@@ -0,0 +1,133 @@
+# Error classes and retries of the requests made through leaftoolbox.toolsEE
+#
+# Errors are classified from the messages returned by Earth Engine,
+# rate limit and transient errors are retried, the others are raised
+# at once. Faults injected in the fake backend exercise the same paths
+# end to end, including the harvest of a scene catalog, whose split
+# errors halve its windows or leave the sampling to plain date windows.
+
+import ee
+import pytest
+
+from gee_helpers import fake_ee
+from leaftoolbox import LEAF
+from leaftoolbox import SL2PV0
+from leaftoolbox import toolsCatalog
+from leaftoolbox import toolsEE
+from leaftoolbox import toolsWindows
+
+SITE = 'projects/fake/assets/sites'
+
+
+# retry policy without backoff delays, restored after the test
+@pytest.fixture
+def retries():
+    toolsEE.setRetryPolicy(maxRetries=3, baseDelay=0)
+    yield toolsEE.retryPolicy
+    toolsEE.setRetryPolicy()
+
+
+@pytest.mark.parametrize('message, errorClass', [
+    (fake_ee.FAULTS['rate_limit'], 'rateLimit'),
+    ('Too many concurrent aggregations.', 'rateLimit'),
+    ('Resource exhausted (429).', 'rateLimit'),
+    ('Quota exceeded: too many EECU-seconds used today.', 'fatal'),
+    (fake_ee.FAULTS['transient'], 'transient'),
+    ('HTTP Error 502: Bad Gateway', 'transient'),
+    (fake_ee.FAULTS['memory'], 'split'),
+    (fake_ee.FAULTS['timeout'], 'split'),
+    ('Image.select: Pattern did not match any bands.', 'fatal'),
+    ('Collection.first: Error in map(ID=5000): invalid band 4290.', 'fatal'),
+])
+def test_errorClass(message, errorClass):
+    assert toolsEE.errorClass(ee.EEException(message)) == errorClass
+
+
+def test_errorClass_of_connection_errors():
+    assert toolsEE.errorClass(ConnectionResetError('connection reset by peer')) == 'transient'
+    assert toolsEE.errorClass(TimeoutError()) == 'transient'
+    assert toolsEE.errorClass(ValueError('invalid literal')) == 'fatal'
+
+
+# request() raising ee.EEException with each message in turn, then returning result
+def failingRequest(messages, result='done'):
+    messages = list(messages)
+
+    def request():
+        if messages:
+            raise ee.EEException(messages.pop(0))
+        return result
+    return request
+
+
+def test_retries_rate_limit_and_transient_errors(retries):
+    request = failingRequest([fake_ee.FAULTS['rate_limit'], fake_ee.FAULTS['transient']])
+    assert retries.call('getInfo', request) == 'done'
+    stats = retries.report()
+    assert stats['rateLimit.retries'] == 1 and stats['transient.retries'] == 1 and stats['recovered'] == 1
+
+
+@pytest.mark.parametrize('message', [fake_ee.FAULTS['memory'], 'Quota exceeded.', 'Invalid argument.'])
+def test_raises_split_and_fatal_errors_at_once(retries, message):
+    request = failingRequest([message])
+    with pytest.raises(ee.EEException):
+        retries.call('getInfo', request)
+    assert retries.call('getInfo', request) == 'done'
+    assert not any(name.endswith('.retries') for name in retries.report())
+
+
+def test_gives_up_after_max_retries(retries):
+    request = failingRequest([fake_ee.FAULTS['rate_limit']] * 4)
+    with pytest.raises(ee.EEException):
+        retries.call('getInfo', request)
+    stats = retries.report()
+    assert stats['rateLimit.retries'] == 3 and stats['rateLimit.failed'] == 1
+
+
+def test_delay_is_bounded_by_the_backoff():
+    policy = toolsEE.RetryPolicy(baseDelay=1.0, maxDelay=8.0)
+    for attempt in range(6):
+        assert all(0 <= policy.delay(attempt) <= min(8.0, 2**attempt) for _ in range(50))
+
+
+def test_requests_recover_from_faults_of_the_backend(retries):
+    backend = fake_ee.install(faults=['rate_limit', 'transient', None])
+    assert toolsEE.getInfo(ee.FeatureCollection('projects/fake/assets/sites').size(), cache=False) == backend.num_features
+    assert backend.counts['getInfo'] == 3
+    assert retries.report()['recovered'] == 1
+
+
+def sampleSitesWithCatalog(tmp_path):
+    return LEAF.sampleSites([SITE], 'COPERNICUS/S2_SR_HARMONIZED', SL2PV0, outputPathName=str(tmp_path), feature_range=[0, 3],
+                            scene_catalog=str(tmp_path / 'scenes.sqlite'))[SITE]
+
+
+# window planner of a test, restored afterwards so the window lengths it learns are not shared
+@pytest.fixture
+def planner(monkeypatch):
+    planner = toolsWindows.WindowPlanner()
+    monkeypatch.setattr(toolsWindows, 'planner', planner)
+    return planner
+
+
+def test_scene_harvest_splits_windows_on_memory_and_timeout_faults(retries, planner, tmp_path):
+    backend = fake_ee.install(faults=['rate_limit', 'memory', 'timeout'])
+    results = sampleSitesWithCatalog(tmp_path)
+    assert backend.faults_raised == {'rate_limit': 1, 'memory': 1, 'timeout': 1}
+    assert planner.getWindowDays(('catalog', 'COPERNICUS/S2_SR_HARMONIZED')) < planner.initialDays
+    assert len(results) == 3 and all(not result[SL2PV0.__name__].empty for result in results)
+    catalog = toolsCatalog.SceneCatalog(str(tmp_path / 'scenes.sqlite'))
+    assert catalog.connection.execute('SELECT COUNT(*) FROM harvests').fetchone()[0] == 1
+    catalog.close()
+
+
+def test_sampling_falls_back_to_date_windows_when_the_harvest_fails(retries, planner, tmp_path):
+    planner.minDays = planner.initialDays
+    backend = fake_ee.install(faults=['memory'])
+    results = sampleSitesWithCatalog(tmp_path)
+    assert backend.faults_raised == {'memory': 1}
+    assert retries.report()['split.catalogFallback'] == 1
+    assert len(results) == 3 and all(not result[SL2PV0.__name__].empty for result in results)
+    catalog = toolsCatalog.SceneCatalog(str(tmp_path / 'scenes.sqlite'))
+    assert catalog.connection.execute('SELECT COUNT(*) FROM harvests').fetchone()[0] == 0
+    catalog.close()
@@ -0,0 +1,362 @@
+# Parity of the local NumPy networks with the server-side networks
+#
+# The Earth Engine graphs built by leaftoolbox.toolsNets and
+# leaftoolbox.toolsUtils with the fake ee module are evaluated pixel
+# by pixel with NumPy below, and compared to the outputs of the local
+# mirrors in leaftoolbox.toolsNetsLocal.
+
+import csv
+
+import numpy as np
+import pytest
+
+from gee_helpers import fake_ee
+from leaftoolbox import toolsNets
+from leaftoolbox import toolsNetsIO
+from leaftoolbox import toolsNetsLocal
+from leaftoolbox import toolsUtils
+
+
+# pixel values of an image, (pixels, bands) for band images or (pixels, ...) for array images
+# constant images have a single pixel that broadcasts over the others
+class Image:
+
+    def __init__(self, data, names=None, array=False):
+        self.data = np.asarray(data, dtype=np.float64)
+        self.names = list(names) if names is not None else ['b%d' % i for i in range(self.data.shape[1])]
+        self.array = array
+
+
+# constant image with one band per value
+def constant(value):
+    value = np.atleast_1d(np.asarray(value, dtype=np.float64))
+    return Image(value[np.newaxis, :])
+
+
+# apply a NumPy function to two numbers, or pixel by pixel to two images or an image and a number
+def binary(function, left, right):
+    if not isinstance(left, Image) and not isinstance(right, Image):
+        return function(np.asarray(left, dtype=np.float64), np.asarray(right, dtype=np.float64)).item()
+    left = left if isinstance(left, Image) else constant(left)
+    right = right if isinstance(right, Image) else constant(right)
+    names = left.names if len(left.names) >= len(right.names) else right.names
+    return Image(function(pixelValues(left, right), pixelValues(right, left)), names, left.array or right.array)
+
+
+# values of image to combine with other, a single band image is a scalar in each pixel of an array image
+def pixelValues(image, other):
+    if other.array and not image.array and image.data.shape[1] == 1:
+        return image.data.reshape(image.data.shape[:1] + (1,) * (other.data.ndim - 1))
+    return image.data
+
+
+BINARY = {'add': np.add, 'subtract': np.subtract, 'multiply': np.multiply, 'divide': np.divide,
+          'mod': np.fmod, 'pow': np.power}
+UNARY = {'exp': np.exp, 'ceil': np.ceil, 'uint8': lambda data: np.clip(np.floor(data), 0, 255),
+         'int': np.trunc}
+
+
+# value of a fake ee expression, element is the value of the argument of the mapped function
+def evaluate(obj, element=None):
+    if isinstance(obj, dict):
+        return {key: evaluate(value, element) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [evaluate(value, element) for value in obj]
+    if not isinstance(obj, fake_ee.ComputedObject):
+        return obj
+    op = obj.op
+    args = [evaluate(arg, element) for arg in obj.args]
+    if op == 'element':
+        return element
+    if obj.receiver is None:
+        if op in ('String', 'List', 'Dictionary', 'FeatureCollection', 'Feature', 'ImageCollection'):
+            return args[0] if args else {}
+        if op == 'Array':
+            return np.array(args[0], dtype=np.float64)
+        if op == 'Number':
+            return float(np.ravel(args[0])[0])
+        if op == 'Image':
+            value = args[0]
+            if isinstance(value, Image):
+                return value
+            if isinstance(value, np.ndarray):
+                return Image(value[np.newaxis], array=True)
+            return constant(value)
+        if op == 'constant':
+            return constant(args[0])
+        if op == 'sequence':
+            return list(range(int(args[0]), int(args[1]) + 1))
+        if op == 'repeat':
+            return [args[0]] * int(args[1])
+        raise NotImplementedError(op)
+    if op == 'map':
+        return [evaluate(obj.mapped, item) for item in evaluate(obj.receiver, element)]
+    receiver = evaluate(obj.receiver, element)
+    if op in BINARY:
+        return binary(BINARY[op], receiver, args[0])
+    if op in UNARY and not isinstance(receiver, Image):
+        return UNARY[op](np.float64(receiver)).item()
+    if op in UNARY:
+        return Image(UNARY[op](receiver.data), receiver.names, receiver.array)
+    if op == 'getNumber':
+        return float(receiver[args[0]])
+    if op == 'cat':
+        return receiver + args[0]
+    if op == 'format':
+        return '%d' % receiver if float(receiver).is_integer() else str(receiver)
+    if op == 'get':
+        return receiver[args[0]] if isinstance(receiver, dict) else receiver[int(args[0])]
+    if op in ('length', 'size'):
+        return len(receiver)
+    if op == 'set':
+        return dict(receiver, **{args[0]: args[1]})
+    if op in ('clip', 'geometry'):
+        return receiver
+    if op == 'eq':
+        return Image((receiver.data == args[0]).astype(np.float64), receiver.names)
+    if op == 'updateMask':
+        return Image(np.where(args[0].data != 0, receiver.data, np.nan), receiver.names)
+    if op == 'max':
+        return Image(np.fmax.reduce([image.data for image in receiver]), receiver[0].names)
+    if op == 'slice':
+        return receiver[int(args[0]):]
+    if op == 'sort':
+        return sorted(receiver)
+    if op == 'aggregate_array':
+        return [feature[args[0]] for feature in receiver]
+    if op == 'toArray' and isinstance(receiver, dict):
+        return np.array([receiver[key] for key in args[0]], dtype=np.float64)
+    if op == 'toArray':
+        return Image(receiver.data[..., np.newaxis] if receiver.array else receiver.data, array=True)
+    if op == 'transpose':
+        return receiver.T
+    if op == 'reshape':
+        return receiver.reshape([int(size) for size in args[0]])
+    if op == 'bandNames':
+        return receiver.names
+    if op == 'arrayProject':
+        shape = receiver.data.shape
+        return Image(receiver.data.reshape((shape[0],) + tuple(shape[1 + axis] for axis in args[0])), array=True)
+    if op == 'arrayTranspose':
+        return Image(np.swapaxes(receiver.data, -1, -2), array=True)
+    if op == 'arrayReshape':
+        return Image(receiver.data.reshape((receiver.data.shape[0],) + tuple(int(size) for size in args[0].data[0])), array=True)
+    if op == 'arraySlice':
+        assert args[0] == 0
+        rows = args[1].data[:, 0].astype(int)
+        return Image(receiver.data[0][rows][:, np.newaxis], array=True)
+    if op == 'arrayFlatten':
+        return Image(receiver.data, args[0][0])
+    if op == 'matrixMultiply':
+        return Image(np.matmul(receiver.data, args[0].data), array=True)
+    if op == 'reduce':
+        assert args[0] == 'sum'
+        return Image(receiver.data.sum(axis=1, keepdims=True))
+    if op == 'rename':
+        return Image(receiver.data, [args[0]] if isinstance(args[0], str) else args[0], receiver.array)
+    if op == 'select':
+        names = args[0] if isinstance(args[0], list) else [args[0]]
+        return Image(receiver.data[:, [receiver.names.index(name) for name in names]], names)
+    if op == 'addBands':
+        return Image(np.hstack([receiver.data, args[0].data]), receiver.names + args[0].names)
+    if op == 'remap':
+        source, target, default = args
+        mapping = dict(zip(source, target))
+        return Image(np.vectorize(lambda value: mapping.get(value, default))(receiver.data), receiver.names)
+    raise NotImplementedError(op)
+
+
+BANDS = ['cosVZA', 'cosSZA', 'cosRAA', 'B3', 'B4', 'B5', 'B6', 'B7', 'B8A', 'B11', 'B12']
+
+
+# random network with the keys and list shapes of toolsNets.makeNets
+def makeNetwork(rng, numInputs=len(BANDS), numHidden=5):
+    return {'inpSlope': rng.uniform(0.5, 2, numInputs).tolist(), 'inpOffset': rng.uniform(-1, 1, numInputs).tolist(),
+            'h1wt': rng.normal(size=numHidden * numInputs).tolist(), 'h1bi': rng.normal(size=numHidden).tolist(),
+            'h2wt': rng.normal(size=numHidden).tolist(), 'h2bi': [float(rng.normal())],
+            'outSlope': [float(rng.uniform(0.5, 2))], 'outBias': [float(rng.normal())]}
+
+
+@pytest.fixture
+def pixels():
+    return np.random.default_rng(1).uniform(0, 1, (64, len(BANDS)))
+
+
+def test_applyNet_matches_server(pixels):
+    network = makeNetwork(np.random.default_rng(2))
+    image = fake_ee.Image(Image(pixels, BANDS))
+    server = evaluate(toolsNets.applyNet('LAI', {'Image': image, 'Network': network}))
+    assert server.names == ['LAI']
+    np.testing.assert_allclose(toolsNetsLocal.applyNet(pixels, network), server.data[:, 0], rtol=1e-12, atol=1e-12)
+
+
+def test_wrapperNNets_matches_applyNet_per_network(pixels):
+    rng = np.random.default_rng(3)
+    networks = [makeNetwork(rng) for _ in range(3)]
+    networkID = np.array([0, 1, 2, 5] * (len(pixels) // 4))
+    output = toolsNetsLocal.wrapperNNets(networks, networkID, pixels)
+    for netIndex, network in enumerate(networks):
+        rows = networkID == netIndex
+        np.testing.assert_allclose(output[rows], toolsNetsLocal.applyNet(pixels[rows], network), rtol=1e-12)
+    assert np.isnan(output[networkID == 5]).all()
+
+
+def test_invalidInput_matches_server(pixels):
+    codes = toolsNetsLocal.makeDomainCodes(pixels)
+    sl2pDomain = sorted(set(codes[::2].tolist()) | {123})
+    image = fake_ee.Image(Image(pixels, BANDS))
+    server = evaluate(toolsUtils.invalidInput([{'DomainCode': code} for code in sl2pDomain], BANDS, image))
+    qc = server.data[:, server.names.index('QC')]
+    np.testing.assert_array_equal(toolsNetsLocal.invalidInput(sl2pDomain, pixels), qc)
+    assert qc[::2].sum() == 0
+
+
+def test_invalidInputPartition_uses_the_domain_of_each_network(pixels):
+    codes = toolsNetsLocal.makeDomainCodes(pixels)
+    networkID = np.arange(len(pixels)) % 2
+    sl2pDomains = [codes[networkID == 0][:10], codes[networkID == 1]]
+    qc = toolsNetsLocal.invalidInputPartition(toolsNetsLocal.makeDomainKeys(sl2pDomains), networkID, pixels)
+    expected = np.where(networkID == 0, toolsNetsLocal.invalidInput(sl2pDomains[0], pixels),
+                        toolsNetsLocal.invalidInput(sl2pDomains[1], pixels))
+    np.testing.assert_array_equal(qc, expected)
+    qc = toolsNetsLocal.invalidInputPartition(toolsNetsLocal.makeDomainKeys(sl2pDomains), np.full(len(pixels), 7), pixels)
+    assert qc.all()
+
+
+def test_wrapperNNetStack_matches_wrapperNNets(pixels):
+    rng = np.random.default_rng(4)
+    netLists = [[makeNetwork(rng) for _ in range(2)] for _ in range(3)]
+    networkID = np.arange(len(pixels)) % 3
+    expected = np.column_stack([toolsNetsLocal.wrapperNNets(netList, networkID, pixels) for netList in netLists])
+    np.testing.assert_allclose(toolsNetsLocal.wrapperNNetStack(netLists, networkID, pixels), expected, rtol=1e-12)
+
+
+def test_streamNNetStack_writes_npy_for_arrays_and_iterators(pixels, tmp_path):
+    rng = np.random.default_rng(5)
+    netLists = [[makeNetwork(rng) for _ in range(2)] for _ in range(2)]
+    networkID = np.arange(len(pixels)) % 2
+    expected = toolsNetsLocal.wrapperNNetStack(netLists, networkID, pixels)
+    fileName = str(tmp_path / 'array.npy')
+    assert toolsNetsLocal.streamNNetStack(pixels, netLists, fileName, networkID, blockRows=10) == len(pixels)
+    np.testing.assert_allclose(np.load(fileName), expected, rtol=1e-12)
+    blocks = ((networkID[start:start + 10], pixels[start:start + 10]) for start in range(0, len(pixels), 10))
+    fileName = str(tmp_path / 'iterator.npy')
+    assert toolsNetsLocal.streamNNetStack(blocks, netLists, fileName, blockRows=10) == len(pixels)
+    np.testing.assert_allclose(np.load(fileName), expected, rtol=1e-12)
+    assert not (tmp_path / 'iterator.npy.part').exists()
+
+
+def test_makeRangeFlags_sets_one_bit_per_checked_column():
+    rng = np.random.default_rng(9)
+    output = rng.uniform(-1, 2, (64, 6))
+    output[::5, 0] = np.nan
+    output[::7, 4] = np.nan
+    outmin = np.array([0.0, np.nan, 0.0, np.nan, 0.5, np.nan])
+    outmax = np.array([1.0, np.nan, np.nan, np.nan, 1.5, 1.0])
+    flags = toolsNetsLocal.makeRangeFlags(output, outmin, outmax)
+    assert flags.dtype == np.uint8
+    for bit, column in enumerate([0, 2, 4, 5]):
+        expected = (output[:, column] < outmin[column]) | (output[:, column] > outmax[column])
+        np.testing.assert_array_equal((flags >> bit) & 1, expected)
+    assert (flags[::5] & 1 == 0).all() and (flags[::7] & 4 == 0).all()
+    assert (flags >> 4 == 0).all()
+
+
+def test_rangeFlagType_holds_every_checked_column():
+    assert toolsNetsLocal.rangeFlagType(np.full(3, np.nan), np.full(3, np.nan)) == np.uint8
+    assert toolsNetsLocal.rangeFlagType(np.zeros(8), np.ones(8)) == np.uint8
+    assert toolsNetsLocal.rangeFlagType(np.zeros(9), np.ones(9)) == np.uint16
+    output = np.column_stack([np.arange(-4.0, 5.0)] * 9)
+    flags = toolsNetsLocal.makeRangeFlags(output, np.zeros(9), np.ones(9))
+    assert flags.dtype == np.uint16
+    np.testing.assert_array_equal(flags, np.where((output[:, 0] < 0) | (output[:, 0] > 1), 2**9 - 1, 0))
+
+
+# row of an exported network table in the tabledataN layout read by toolsNets.makeNets, tabledata3 is the variable
+def makeNetworkRow(network, variableNum):
+    row = {'tabledata%d' % ind: 0.0 for ind in range(1, 6)}
+    row['tabledata3'] = variableNum
+    num = 6
+    for key in toolsNetsLocal.NET_KEYS:
+        values = network[key]
+        row['tabledata%d' % num] = len(values)
+        row.update({'tabledata%d' % (num + 1 + n): value for n, value in enumerate(values)})
+        num += len(values) + 1
+    return row
+
+
+def test_makeNets_matches_server():
+    network = makeNetwork(np.random.default_rng(6))
+    row = makeNetworkRow(network, 1)
+    server = evaluate(toolsNets.makeNets([row], 1))
+    local = toolsNetsIO.makeNets(row)
+    for key in toolsNetsLocal.NET_KEYS:
+        np.testing.assert_array_equal(np.ravel(local[key]), server[key])
+
+
+def test_loadNets_caches_every_network(tmp_path):
+    rng = np.random.default_rng(7)
+    networks = {variableNum: [makeNetwork(rng) for _ in range(3)] for variableNum in [1, 2]}
+    exportFileName = str(tmp_path / 'nets.csv')
+    rows = [makeNetworkRow(network, variableNum) for variableNum, nets in networks.items() for network in nets]
+    with open(exportFileName, 'w', newline='') as fp:
+        writer = csv.DictWriter(fp, fieldnames=sorted(set().union(*rows), key=lambda name: int(name[9:])))
+        writer.writeheader()
+        writer.writerows(rows)
+    cacheDir = str(tmp_path / 'cache')
+    assert [len(nets) for nets in toolsNetsIO.loadNets('nets', exportFileName, cacheDir, numNets=1).values()] == [1, 1]
+    netVars = toolsNetsIO.loadNets('nets', cacheDir=cacheDir)
+    assert sorted(netVars) == [1, 2]
+    for variableNum, nets in networks.items():
+        assert len(netVars[variableNum]) == 3
+        for cached, network in zip(netVars[variableNum], nets):
+            np.testing.assert_allclose(toolsNetsLocal.applyNet(np.ones((2, len(BANDS))), cached),
+                                       toolsNetsLocal.applyNet(np.ones((2, len(BANDS))), network), rtol=1e-12)
+
+
+# network lists of a variable (index 0) with their partition image, networks are picked by the legendRemap of colOptions
+@pytest.fixture
+def partitioned(pixels):
+    rng = np.random.default_rng(8)
+    partition = np.array([1, 2, 3, 9] * (len(pixels) // 4), dtype=np.float64)[:, np.newaxis]
+    return {'network': [[makeNetwork(rng) for _ in range(3)]], 'errorNetwork': [[makeNetwork(rng) for _ in range(3)]],
+            'partition': fake_ee.Image(Image(partition, ['partition'])), 'image': fake_ee.Image(Image(pixels, BANDS)),
+            'netOptions': {'variable': 1, 'inputBands': BANDS},
+            'colOptions': {'legend': None, 'Network_Ind': None, 'legendRemap': ([1, 2, 3], [0, 1, 2])},
+            'networkID': np.array([0, 1, 2, 0] * (len(pixels) // 4))}
+
+
+# columns of an evaluated image in band order
+def bands(image, names):
+    return np.column_stack([image.data[:, image.names.index(name)] for name in names])
+
+
+def test_wrapperNNets_matches_local_wrapper(pixels, partitioned):
+    server = evaluate(toolsNets.wrapperNNets(partitioned['network'], partitioned['partition'], partitioned['netOptions'],
+                                             partitioned['colOptions'], 'estimate', 'LAI', partitioned['image']))
+    assert server.names == ['estimateLAI', 'partition', 'networkID']
+    np.testing.assert_array_equal(server.data[:, 2], partitioned['networkID'])
+    np.testing.assert_allclose(server.data[:, 0], toolsNetsLocal.wrapperNNets(partitioned['network'][0], partitioned['networkID'], pixels),
+                               rtol=1e-12)
+
+
+def test_wrapperNNetsGrouped_matches_wrapperNNets(partitioned):
+    arguments = (partitioned['network'], partitioned['partition'], partitioned['netOptions'], partitioned['colOptions'],
+                 'estimate', 'LAI', partitioned['image'])
+    baseline = evaluate(toolsNets.wrapperNNets(*arguments))
+    grouped = evaluate(toolsNets.wrapperNNetsGrouped(*arguments))
+    assert grouped.names == baseline.names
+    np.testing.assert_allclose(grouped.data, baseline.data, rtol=1e-12)
+
+
+@pytest.mark.parametrize('dispatch', ['mask', 'grouped'])
+def test_wrapperNNetsFused_matches_separate_passes(partitioned, dispatch):
+    separate = lambda network, suffixName: evaluate(toolsNets.wrapperNNets(network, partitioned['partition'], partitioned['netOptions'],
+                                                                           partitioned['colOptions'], suffixName, 'LAI', partitioned['image']))
+    estimate = separate(partitioned['network'], 'estimate')
+    error = separate(partitioned['errorNetwork'], 'error')
+    fused = evaluate(toolsNets.wrapperNNetsFused(partitioned['network'], partitioned['errorNetwork'], partitioned['partition'],
+                                                 partitioned['netOptions'], partitioned['colOptions'], 'LAI', partitioned['image'], dispatch))
+    assert fused.names == ['estimateLAI', 'partition', 'networkID', 'errorLAI']
+    np.testing.assert_allclose(bands(fused, estimate.names), estimate.data, rtol=1e-12)
+    np.testing.assert_allclose(bands(fused, ['errorLAI']), error.data[:, :1], rtol=1e-12)
@@ -0,0 +1,57 @@
+# Storage of SL2P outputs and output ranges in leaftoolbox.toolsNetsIO
+#
+# Quantized tables must decode to the clipped outputs within half a
+# quantization step, with missing outputs back as NaN. Output ranges
+# are parsed once from the exported table and read from the cache.
+
+import csv
+
+import numpy as np
+import pytest
+import pandas as pd
+
+from leaftoolbox import dictionariesSL2P
+from leaftoolbox import toolsNetsIO
+
+
+def test_quantized_outputs_round_trip(tmp_path):
+    outputParams = dictionariesSL2P.make_outputParams()
+    table = pd.DataFrame({'estimateLAI': [-0.5, 0.0, 1.2345, 7.9996, 9.0, np.nan],
+                          'errorfAPAR': [0.5, np.nan, 1.5, 0.0004, 0.25, 0.125],
+                          'date': np.arange(6, dtype=np.int64),
+                          'site': ['a', 'b', 'c', 'd', 'e', 'f']})
+    outputs = toolsNetsIO.decodeOutputs(toolsNetsIO.encodeOutputs(table, str(tmp_path / 'outputs'), outputParams))
+    assert outputs.raw('estimateLAI').dtype == np.uint16
+    assert outputs.raw('estimateLAI')[-1] == toolsNetsIO.QUANTIZED_FILL
+    for column in ['estimateLAI', 'errorfAPAR']:
+        params = outputParams[column.replace('estimate', '').replace('error', '')]
+        expected = np.clip(table[column].to_numpy(), params['outputOffset'], params['outputMax'])
+        np.testing.assert_allclose(outputs[column], expected, atol=0.5 / params['outputScale'], equal_nan=True)
+        np.testing.assert_array_equal(np.concatenate(list(outputs.iterBlocks(column, blockRows=4))), outputs[column])
+    np.testing.assert_array_equal(outputs['date'], table['date'])
+    assert list(outputs.toDataFrame()['site']) == list(table['site'])
+    assert len(outputs) == len(table)
+
+
+def test_makeRanges_reads_variable_numbers_and_names():
+    rows = [{'variable': 'LAI', 'min': '0', 'max': '8'}, {'variable': '2', 'min': '0', 'max': '1'},
+            {'variable': 'LAI', 'min': '-1', 'max': '9'}, {'variable': '4.0', 'min': '0', 'max': '600'}]
+    assert toolsNetsIO.makeRanges(rows) == {1: (0.0, 8.0), 2: (0.0, 1.0), 4: (0.0, 600.0)}
+    rows = [{'name': 'fCOVER', 'low': 0.1, 'high': 0.9}]
+    assert toolsNetsIO.makeRanges(rows, variableColumn='name', minColumn='low', maxColumn='high') == {3: (0.1, 0.9)}
+
+
+def test_loadRanges_parses_the_exported_table_once(tmp_path):
+    exportFileName = str(tmp_path / 'ranges.csv')
+    with open(exportFileName, 'w', newline='') as fp:
+        writer = csv.DictWriter(fp, fieldnames=['variable', 'min', 'max'])
+        writer.writeheader()
+        writer.writerows([{'variable': 'LAI', 'min': 0, 'max': 8}, {'variable': 'fAPAR', 'min': 0, 'max': 1}])
+    cacheDir = str(tmp_path / 'cache')
+    with pytest.raises(ValueError):
+        toolsNetsIO.loadRanges('ranges', cacheDir=cacheDir)
+    ranges = toolsNetsIO.loadRanges('ranges', exportFileName, cacheDir)
+    assert ranges == {1: (0.0, 8.0), 2: (0.0, 1.0)}
+    (tmp_path / 'ranges.csv').unlink()
+    assert toolsNetsIO.loadRanges('ranges', exportFileName, cacheDir) == ranges
+    assert toolsNetsIO.readRanges('other', cacheDir) is None
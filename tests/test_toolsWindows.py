@@ -0,0 +1,85 @@
+# Adaptive date windows of leaftoolbox.toolsWindows
+#
+# Windows are fetched by a function that fails with the Earth Engine
+# memory error above a number of days, and must be split until every
+# day of the period is fetched exactly once.
+
+from datetime import datetime, timedelta
+
+import ee
+import pytest
+
+from leaftoolbox import toolsWindows
+
+
+# fetch(start, end) failing with a memory error on windows longer than maxDays
+def limitedFetch(maxDays, fetched):
+    def fetch(start, end):
+        if end - start > timedelta(days=maxDays):
+            raise ee.EEException('User memory limit exceeded.')
+        fetched.append((start, end))
+        return (start, end)
+    return fetch
+
+
+def test_run_splits_failed_windows_and_keeps_date_order():
+    planner = toolsWindows.WindowPlanner(initialDays=366)
+    fetched = []
+    start, end = datetime(2020, 1, 1), datetime(2021, 1, 1)
+    results = planner.run(start, end, limitedFetch(60, fetched), key='site')
+    assert results == fetched
+    assert results[0][0] == start and results[-1][1] == end
+    assert all(previous[1] == following[0] for previous, following in zip(results, results[1:]))
+    assert all(windowEnd - windowStart <= timedelta(days=60) for windowStart, windowEnd in results)
+    assert planner.splits > 0
+    assert planner.getWindowDays('site') <= 60
+
+
+def test_run_starts_with_the_window_length_learned_for_a_key():
+    planner = toolsWindows.WindowPlanner(initialDays=366)
+    planner.run(datetime(2020, 1, 1), datetime(2021, 1, 1), limitedFetch(60, []), key='site')
+    splits = planner.splits
+    fetched = []
+    planner.run(datetime(2021, 1, 1), datetime(2022, 1, 1), limitedFetch(60, fetched), key='site')
+    assert planner.splits == splits
+    assert fetched[0][0] == datetime(2021, 1, 1) and fetched[-1][1] == datetime(2022, 1, 1)
+    assert planner.run(datetime(2021, 1, 1), datetime(2021, 3, 1), limitedFetch(366, []), key='other') == \
+        [(datetime(2021, 1, 1), datetime(2021, 3, 1))]
+
+
+def test_run_raises_errors_that_a_shorter_window_cannot_avoid():
+    planner = toolsWindows.WindowPlanner()
+
+    def fetch(start, end):
+        raise ee.EEException('Image.select: Pattern did not match any bands.')
+    with pytest.raises(ee.EEException):
+        planner.run(datetime(2020, 1, 1), datetime(2021, 1, 1), fetch)
+    assert planner.splits == 0
+
+
+def test_run_gives_up_below_the_minimum_window():
+    planner = toolsWindows.WindowPlanner(initialDays=8, minDays=1)
+    with pytest.raises(ee.EEException):
+        planner.run(datetime(2020, 1, 1), datetime(2020, 1, 9), limitedFetch(0, []))
+
+
+def test_scene_windows_skip_days_without_scenes():
+    planner = toolsWindows.WindowPlanner(initialDays=366)
+    sceneDates = [datetime(2020, 3, 1, 18), datetime(2020, 3, 1, 18, 1), datetime(2020, 7, 4, 17)]
+    fetched = []
+    planner.run(datetime(2020, 1, 1), datetime(2021, 1, 1), limitedFetch(366, fetched), sceneDates=sceneDates)
+    assert fetched == [(datetime(2020, 3, 1), datetime(2020, 7, 5))]
+    assert planner.run(datetime(2020, 1, 1), datetime(2021, 1, 1), limitedFetch(366, []), sceneDates=[]) == []
+
+
+def test_scene_windows_are_split_by_number_of_scenes():
+    planner = toolsWindows.WindowPlanner(initialDays=366)
+    sceneDates = [datetime(2020, 1, 1) + timedelta(days=16 * n) for n in range(20)]
+
+    def fetch(start, end):
+        if sum(start <= date < end for date in sceneDates) > 4:
+            raise ee.EEException('Computation timed out.')
+        return sum(start <= date < end for date in sceneDates)
+    counts = planner.run(datetime(2020, 1, 1), datetime(2021, 1, 1), fetch, key='site', sceneDates=sceneDates)
+    assert sum(counts) == len(sceneDates)
+    assert planner.getWindowScenes('site') <= 4